@@ -0,0 +1,89 @@
+"""
+Write-behind buffer for User.last_active
+
+Bumping last_active was the hottest single-row write in the system, and it
+competed with the conversation state updates. Timestamps are collected in
+memory and written with one bulk UPDATE. That happens every few seconds, as
+soon as enough users are waiting, and once more when the process exits.
+"""
+
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from sqlalchemy import bindparam, or_, update
+
+from app import db
+from models import User
+
+users = User.__table__
+
+
+class LastActiveBuffer:
+    def __init__(self, flush_interval=5, max_pending=500):
+        self.app = None
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+
+    def init_app(self, app):
+        """Start the background flusher and flush whatever is left on exit"""
+        self.app = app
+        self.flush_interval = app.config['LAST_ACTIVE_FLUSH_SECONDS']
+        self.max_pending = app.config['LAST_ACTIVE_FLUSH_SIZE']
+
+        threading.Thread(target=self._run, name='last-active-flush', daemon=True).start()
+        atexit.register(self.flush)
+
+    def touch(self, user_id, when=None):
+        """Record activity for a user; it is written on the next flush"""
+        with self._lock:
+            self._pending[user_id] = when or datetime.utcnow()
+            full = len(self._pending) >= self.max_pending
+
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write all buffered timestamps in one bulk UPDATE"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+
+            if not pending or self.app is None:
+                return 0
+
+            params = [{'user_id': user_id, 'seen_at': seen_at} for user_id, seen_at in pending.items()]
+            statement = (
+                update(users)
+                .where(users.c.id == bindparam('user_id'))
+                .where(or_(users.c.last_active.is_(None), users.c.last_active < bindparam('seen_at')))
+                .values(last_active=bindparam('seen_at'))
+            )
+
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as conn:
+                        conn.execute(statement, params)
+            except Exception as e:
+                logging.error(f"Error flushing last_active for {len(pending)} user(s): {str(e)}")
+                # Keep the timestamps for the next attempt unless newer ones arrived
+                with self._lock:
+                    for user_id, seen_at in pending.items():
+                        self._pending.setdefault(user_id, seen_at)
+                return 0
+
+            return len(pending)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+last_active_buffer = LastActiveBuffer()
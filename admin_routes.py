@@ -1,8 +1,12 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, abort
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 from app import db
 from models import User, Template, CV, Transaction
+from template_catalog import template_catalog
+from preview_cache import preview_cache
+from downloads import cv_downloads
+from retention import retention
 import json
 
 admin_bp = Blueprint('admin', __name__)
@@ -72,7 +76,10 @@ def user_detail(user_id):
 def templates():
     """Template management page"""
     templates = Template.query.order_by(Template.created_at.desc()).all()
-    return render_template('admin/templates.html', templates=templates)
+    preview_colors = {t.id: [c for c in preview_cache.colors_for(t.template_file) if c] for t in templates}
+    preview_stats = preview_cache.stats(t.template_file for t in templates)
+    return render_template('admin/templates.html', templates=templates,
+                         preview_colors=preview_colors, preview_stats=preview_stats)
 
 @admin_bp.route('/templates/add', methods=['GET', 'POST'])
 def add_template():
@@ -91,7 +98,9 @@ def add_template():
             template.template_file = template_file
             
             db.session.add(template)
+            template_catalog.bump()
             db.session.commit()
+            preview_cache.refresh(template.template_file)
             
             flash('Template added successfully!', 'success')
             return redirect(url_for('admin.templates'))
@@ -111,7 +120,9 @@ def edit_template(template_id):
         template.is_premium = request.form.get('is_premium') == 'on'
         template.template_file = request.form.get('template_file')
         
+        template_catalog.bump()
         db.session.commit()
+        preview_cache.refresh(template.template_file)
         flash(f'Template {template.name} updated successfully!', 'success')
         return redirect(url_for('admin.templates'))
     
@@ -122,6 +133,7 @@ def toggle_template(template_id):
     """Toggle template active status"""
     template = Template.query.get_or_404(template_id)
     template.is_active = not template.is_active
+    template_catalog.bump()
     db.session.commit()
     
     status = 'activated' if template.is_active else 'deactivated'
@@ -134,7 +146,9 @@ def toggle_premium(template_id):
     """Toggle template premium status"""
     template = Template.query.get_or_404(template_id)
     template.is_premium = not template.is_premium
+    template_catalog.bump()
     db.session.commit()
+    preview_cache.refresh(template.template_file)
     
     status = 'premium' if template.is_premium else 'free'
     flash(f'Template {template.name} is now {status}!', 'success')
@@ -143,80 +157,25 @@ def toggle_premium(template_id):
 
 @admin_bp.route('/templates/<int:template_id>/preview')
 def preview_template(template_id):
-    """Generate a preview CV for the template"""
+    """Serve the prebuilt preview CV for the template"""
     template = Template.query.get_or_404(template_id)
-    
-    # Sample CV data for preview
-    sample_cv_data = {
-        'full_name': 'John Smith',
-        'email': 'john.smith@email.com',
-        'phone': '+1 (555) 123-4567',
-        'address': '123 Main Street, City, State 12345',
-        'summary': 'Experienced professional with over 10 years in the industry. Proven track record of delivering high-quality results and leading successful teams. Passionate about innovation and continuous learning.',
-        'experience': [
-            'Senior Manager at Tech Corp\nJanuary 2020 - Present\nLead a team of 15 professionals in developing innovative solutions. Increased team productivity by 35% and reduced project delivery time by 20%. Managed multiple high-priority projects with budgets exceeding $2M.',
-            'Project Manager at StartUp Inc\nMarch 2017 - December 2019\nOversaw product development lifecycle from conception to launch. Collaborated with cross-functional teams to deliver 5 successful product launches. Implemented agile methodologies that improved team efficiency by 25%.',
-            'Business Analyst at Global Solutions\nJune 2014 - February 2017\nAnalyzed business requirements and translated them into technical specifications. Worked closely with stakeholders to identify process improvements. Contributed to a 15% increase in operational efficiency.'
-        ],
-        'education': [
-            'Master of Business Administration\nHarvard Business School\n2014\nConcentration in Strategy and Operations',
-            'Bachelor of Science in Computer Science\nStanford University\n2012\nGraduated Magna Cum Laude, GPA: 3.8/4.0'
-        ],
-        'skills': [
-            'Project Management',
-            'Strategic Planning',
-            'Team Leadership',
-            'Data Analysis',
-            'Process Improvement',
-            'Agile Methodologies',
-            'Budget Management',
-            'Stakeholder Relations',
-            'Risk Assessment',
-            'Performance Optimization'
-        ]
-    }
+    color_scheme = request.args.get('color') or None
     
     try:
-        from pdf_generator import PDFGenerator
-        import tempfile
-        import os
         from flask import send_file
         
-        # Create temporary file for preview
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_file:
-            temp_filepath = tmp_file.name
-        
-        # Generate preview PDF
-        pdf_gen = PDFGenerator()
-        
-        # Get template generator
-        import cv_templates
-        template_module = getattr(cv_templates, template.template_file.replace('.py', ''))
-        generator_class = getattr(template_module, 'TemplateGenerator')
-        
-        # Generate PDF
-        generator = generator_class()
-        success = generator.generate(sample_cv_data, temp_filepath)
+        preview_path, etag = preview_cache.get(template.template_file, color_scheme)
         
-        if success:
-            def cleanup_file():
-                try:
-                    os.unlink(temp_filepath)
-                except:
-                    pass
-            
-            # Schedule cleanup after response
-            from flask import after_this_request
-            @after_this_request
-            def remove_file(response):
-                cleanup_file()
-                return response
-            
+        if preview_path:
+            # The ETag is the preview's content hash, so a revalidation is answered with 304
             return send_file(
-                temp_filepath,
+                preview_path,
                 as_attachment=False,
                 download_name=f'{template.name}_preview.pdf',
-                mimetype='application/pdf'
+                mimetype='application/pdf',
+                etag=etag,
+                conditional=True,
+                max_age=0
             )
         else:
             flash('Error generating template preview', 'error')
@@ -226,17 +185,42 @@ def preview_template(template_id):
         flash(f'Error generating preview: {str(e)}', 'error')
         return redirect(url_for('admin.templates'))
 
+@admin_bp.route('/templates/previews/rebuild', methods=['POST'])
+@login_required
+def rebuild_previews():
+    """Re-render every template preview in the background"""
+    template_files = [t.template_file for t in Template.query.all()]
+    queued = preview_cache.rebuild(template_files, force=True, background=True)
+    
+    flash(f'Rebuilding {queued} template previews in the background.', 'success')
+    return redirect(url_for('admin.templates'))
+
 @admin_bp.route('/cvs')
 def cvs():
     """CV management page"""
     page = request.args.get('page', 1, type=int)
     per_page = 20
+    job_title = request.args.get('job_title', '').strip()
+    
+    query = CV.query
+    if job_title:
+        query = query.filter(CV.job_title.ilike(f'%{job_title}%'))
     
-    cvs = CV.query.order_by(CV.created_at.desc()).paginate(
+    cvs = query.order_by(CV.created_at.desc()).paginate(
         page=page, per_page=per_page, error_out=False
     )
     
-    return render_template('admin/cvs.html', cvs=cvs)
+    return render_template('admin/cvs.html', cvs=cvs, job_title=job_title)
+
+@admin_bp.route('/cvs/<int:cv_id>/download')
+@login_required
+def download_cv(cv_id):
+    """Serve a generated CV from storage"""
+    cv = CV.query.get_or_404(cv_id)
+    if not cv.file_path:
+        abort(404)
+    
+    return cv_downloads.serve(cv.file_path)
 
 @admin_bp.route('/transactions')
 def transactions():
@@ -253,7 +237,17 @@ def transactions():
 @admin_bp.route('/settings')
 def settings():
     """System settings page"""
-    return render_template('admin/settings.html')
+    return render_template('admin/settings.html', retention_report=retention.report(),
+                           sweep_running=retention.running)
+
+@admin_bp.route('/settings/retention/sweep', methods=['POST'])
+@login_required
+def run_retention_sweep():
+    """Run the retention sweep now, in the background"""
+    retention.request_sweep()
+    
+    flash('Retention sweep started in the background. Refresh this page for the updated disk usage.', 'success')
+    return redirect(url_for('admin.settings'))
 
 @admin_bp.route('/settings/twilio', methods=['GET', 'POST'])
 def twilio_settings():
@@ -37,11 +37,85 @@ app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['CV_FOLDER'] = 'generated_cvs'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# Storage for generated CVs and profile photos: 'local' (STORAGE_FOLDER) or 's3'
+app.config['STORAGE_BACKEND'] = os.environ.get("STORAGE_BACKEND", "local")
+app.config['STORAGE_FOLDER'] = os.environ.get("STORAGE_FOLDER", "storage")
+app.config['STORAGE_CACHE_FOLDER'] = os.environ.get("STORAGE_CACHE_FOLDER", os.path.join(app.config['UPLOAD_FOLDER'], 'cache'))
+app.config['S3_ENDPOINT_URL'] = os.environ.get("S3_ENDPOINT_URL", "https://s3.amazonaws.com")
+app.config['S3_BUCKET'] = os.environ.get("S3_BUCKET")
+app.config['S3_REGION'] = os.environ.get("S3_REGION", "us-east-1")
+app.config['S3_ACCESS_KEY_ID'] = os.environ.get("S3_ACCESS_KEY_ID")
+app.config['S3_SECRET_ACCESS_KEY'] = os.environ.get("S3_SECRET_ACCESS_KEY")
+
+# Inbound media downloads (MEDIA_BACKGROUND processes photos after the webhook has replied).
+# Without it the download runs inside the webhook, so deadline plus read timeout
+# must stay well under Twilio's 15s webhook timeout.
+app.config['MEDIA_FOLDER'] = os.environ.get("MEDIA_FOLDER", os.path.join(app.config['UPLOAD_FOLDER'], 'incoming'))
+app.config['MEDIA_MAX_BYTES'] = int(os.environ.get("MEDIA_MAX_BYTES", 16 * 1024 * 1024))
+app.config['MEDIA_CONNECT_TIMEOUT'] = float(os.environ.get("MEDIA_CONNECT_TIMEOUT", 3))
+app.config['MEDIA_READ_TIMEOUT'] = float(os.environ.get("MEDIA_READ_TIMEOUT", 4))
+app.config['MEDIA_DOWNLOAD_DEADLINE'] = float(os.environ.get("MEDIA_DOWNLOAD_DEADLINE", 8))
+app.config['MEDIA_WORKERS'] = int(os.environ.get("MEDIA_WORKERS", 4))
+app.config['MEDIA_BACKGROUND'] = os.environ.get("MEDIA_BACKGROUND", "false").lower() in ("1", "true", "yes")
+
+# Profile photo ingestion
+app.config['PHOTO_MAX_BYTES'] = int(os.environ.get("PHOTO_MAX_BYTES", 10 * 1024 * 1024))
+
 # Twilio configuration
 app.config['TWILIO_ACCOUNT_SID'] = os.environ.get("TWILIO_ACCOUNT_SID")
 app.config['TWILIO_AUTH_TOKEN'] = os.environ.get("TWILIO_AUTH_TOKEN")
 app.config['TWILIO_PHONE_NUMBER'] = os.environ.get("TWILIO_PHONE_NUMBER")
 
+# Outbound WhatsApp messages (TWILIO_API_BASE can point at scripts/fake_twilio.py)
+app.config['TWILIO_API_BASE'] = os.environ.get("TWILIO_API_BASE", "https://api.twilio.com")
+app.config['OUTBOUND_WORKERS'] = int(os.environ.get("OUTBOUND_WORKERS", 4))
+app.config['OUTBOUND_RATE_PER_SECOND'] = float(os.environ.get("OUTBOUND_RATE_PER_SECOND", 20))
+app.config['OUTBOUND_BURST'] = int(os.environ.get("OUTBOUND_BURST", 20))
+app.config['OUTBOUND_MAX_ATTEMPTS'] = int(os.environ.get("OUTBOUND_MAX_ATTEMPTS", 6))
+app.config['OUTBOUND_TIMEOUT'] = float(os.environ.get("OUTBOUND_TIMEOUT", 10))
+
+# Background rendering
+app.config['RENDER_WORKERS'] = int(os.environ.get("RENDER_WORKERS", 2))
+
+# Content-addressed cache of rendered PDFs
+app.config['PDF_CACHE_FOLDER'] = os.environ.get("PDF_CACHE_FOLDER", os.path.join(app.config['CV_FOLDER'], 'cache'))
+app.config['PDF_CACHE_MAX_MB'] = int(os.environ.get("PDF_CACHE_MAX_MB", 500))
+
+# Signed download links for generated CVs (Twilio fetches WhatsApp media from PUBLIC_BASE_URL)
+app.config['PUBLIC_BASE_URL'] = os.environ.get("PUBLIC_BASE_URL")
+app.config['DOWNLOAD_SIGNING_KEY'] = os.environ.get("DOWNLOAD_SIGNING_KEY")
+app.config['DOWNLOAD_URL_TTL_HOURS'] = float(os.environ.get("DOWNLOAD_URL_TTL_HOURS", 24))
+app.config['DOWNLOAD_OFFLOAD'] = os.environ.get("DOWNLOAD_OFFLOAD", "")  # x-sendfile, x-accel-redirect
+app.config['DOWNLOAD_ACCEL_PREFIX'] = os.environ.get("DOWNLOAD_ACCEL_PREFIX", "/protected-cvs")
+
+# Retention of generated CVs and stored photos (RETENTION_SWEEP_HOURS=0 disables the scheduled sweep)
+app.config['RETENTION_FREE_DAYS'] = int(os.environ.get("RETENTION_FREE_DAYS", 30))
+app.config['RETENTION_PREMIUM_DAYS'] = int(os.environ.get("RETENTION_PREMIUM_DAYS", 365))
+app.config['RETENTION_ABANDONED_DAYS'] = int(os.environ.get("RETENTION_ABANDONED_DAYS", 7))
+app.config['RETENTION_ORPHAN_GRACE_HOURS'] = float(os.environ.get("RETENTION_ORPHAN_GRACE_HOURS", 24))
+app.config['RETENTION_CACHE_DAYS'] = int(os.environ.get("RETENTION_CACHE_DAYS", 7))
+app.config['RETENTION_SWEEP_HOURS'] = float(os.environ.get("RETENTION_SWEEP_HOURS", 6))
+app.config['RETENTION_BATCH_SIZE'] = int(os.environ.get("RETENTION_BATCH_SIZE", 100))
+app.config['RETENTION_DELETES_PER_SECOND'] = float(os.environ.get("RETENTION_DELETES_PER_SECOND", 20))
+
+# Prebuilt admin template previews
+app.config['PREVIEW_FOLDER'] = os.environ.get("PREVIEW_FOLDER", os.path.join(app.config['CV_FOLDER'], 'previews'))
+# Render every preview when a process starts; otherwise they are built on first
+# view, or all at once with `flask --app main build-previews`
+app.config['PREVIEW_WARMUP'] = os.environ.get("PREVIEW_WARMUP", "false").lower() in ("1", "true", "yes")
+
+# Webhook deduplication (Twilio retries slow deliveries with the same MessageSid)
+app.config['DEDUP_CACHE_SIZE'] = int(os.environ.get("DEDUP_CACHE_SIZE", 10000))
+app.config['DEDUP_TTL_HOURS'] = int(os.environ.get("DEDUP_TTL_HOURS", 24))
+
+# Write-behind buffer for User.last_active
+app.config['LAST_ACTIVE_FLUSH_SECONDS'] = float(os.environ.get("LAST_ACTIVE_FLUSH_SECONDS", 5))
+app.config['LAST_ACTIVE_FLUSH_SIZE'] = int(os.environ.get("LAST_ACTIVE_FLUSH_SIZE", 500))
+
+# In-process conversation state cache
+app.config['STATE_CACHE_SIZE'] = int(os.environ.get("STATE_CACHE_SIZE", 5000))
+app.config['STATE_CACHE_TTL_SECONDS'] = int(os.environ.get("STATE_CACHE_TTL_SECONDS", 300))
+
 # Initialize the app with the extension
 db.init_app(app)
 
@@ -68,6 +142,10 @@ with app.app_context():
     # Create all tables
     db.create_all()
 
+    # Add columns introduced after the tables were first created
+    from migrations import upgrade_schema
+    upgrade_schema()
+
     # Initialize default templates
     from models import Template
     if not Template.query.first():
@@ -149,4 +227,56 @@ app.register_blueprint(admin_bp, url_prefix='/admin')
 
 # Import and register auth blueprint
 from auth_routes import auth_bp
-app.register_blueprint(auth_bp)
\ No newline at end of file
+app.register_blueprint(auth_bp)
+
+# Configure webhook deduplication
+from message_dedup import message_deduplicator
+message_deduplicator.init_app(app)
+
+# Configure CV and photo storage
+from storage import storage
+storage.init_app(app)
+
+# Configure inbound media downloads
+from media_fetcher import media_fetcher
+media_fetcher.init_app(app)
+
+# Configure profile photo processing
+from profile_photos import profile_photos
+profile_photos.init_app(app)
+
+# Configure the in-process template catalog
+from template_catalog import template_catalog
+template_catalog.init_app(app)
+
+# Configure the conversation state cache
+from conversation_store import conversation_store
+conversation_store.init_app(app)
+
+# Start the last_active write-behind buffer
+from activity_tracker import last_active_buffer
+last_active_buffer.init_app(app)
+
+# Configure the rendered PDF cache
+from pdf_cache import pdf_cache
+pdf_cache.init_app(app)
+
+# Configure signed CV download links
+from downloads import cv_downloads
+cv_downloads.init_app(app)
+
+# Start the outbound message dispatcher
+from outbound import outbound
+outbound.init_app(app)
+
+# Start the background render queue
+from render_queue import render_queue
+render_queue.init_app(app)
+
+# Build any missing admin template previews
+from preview_cache import preview_cache
+preview_cache.init_app(app)
+
+# Start the retention sweeper for old CVs, orphaned files and temp files
+from retention import retention
+retention.init_app(app)
@@ -1,8 +1,15 @@
-import json
-import logging
 from datetime import datetime
 from app import db
-from models import User, ConversationState, Template, CV, Transaction
+from models import User, CV, Transaction
+from conversation_store import conversation_store
+from template_catalog import template_catalog
+from cv_templates import template_info
+from cv_templates.parsing import describe_education, describe_experience, parse_education, parse_experience
+from profile_photos import profile_photos
+from media_fetcher import media_fetcher
+from message_lock import phone_locks
+from outbound import outbound
+import unit_of_work
 
 class ConversationManager:
     def __init__(self):
@@ -24,25 +31,24 @@ class ConversationManager:
             'payment': self.handle_payment
         }
     
-    def handle_message(self, user, conv_state, message, media_url=None):
-        """Route message to appropriate handler based on conversation state"""
-        try:
-            current_state = conv_state.state
-            handler = self.states.get(current_state, self.handle_welcome)
-            
-            response = handler(user, conv_state, message, media_url)
-            
-            # Update conversation state timestamp
-            conv_state.updated_at = datetime.utcnow()
-            db.session.commit()
-            
-            return response
-            
-        except Exception as e:
-            logging.error(f"Error in conversation manager: {str(e)}")
-            return "Sorry, something went wrong. Let's start over. Type 'menu' to see options."
+    def handle_message(self, user, conv_state, message, media=()):
+        """Route message to appropriate handler based on conversation state
+
+        Handlers only stage changes in the session. The caller's unit of work
+        commits them once. Errors propagate to it, so a failed message is
+        rolled back as a whole and leaves no stored reply behind.
+        """
+        current_state = conv_state.state
+        handler = self.states.get(current_state, self.handle_welcome)
+        
+        response = handler(user, conv_state, message, media)
+        
+        # Write the conversation state back
+        conversation_store.save(user, conv_state)
+        
+        return response
     
-    def handle_welcome(self, user, conv_state, message, media_url=None):
+    def handle_welcome(self, user, conv_state, message, media=()):
         """Handle initial welcome and returning users"""
         # Check if returning user
         existing_cvs = CV.query.filter_by(user_id=user.id).count()
@@ -56,11 +62,10 @@ class ConversationManager:
         
         # Set state to menu
         conv_state.state = 'menu'
-        db.session.commit()
         
         return welcome_msg + menu_msg
     
-    def handle_menu(self, user, conv_state, message, media_url=None):
+    def handle_menu(self, user, conv_state, message, media=()):
         """Handle main menu selections"""
         message = message.lower().strip()
         
@@ -94,63 +99,47 @@ class ConversationManager:
         }
         
         conv_state.state = 'collect_name'
-        conv_state.data = json.dumps(cv_data)
-        db.session.commit()
+        conv_state.cv_data = cv_data
         
         return "Great! Let's create your professional CV! 📄✨\n\nFirst, what's your full name?"
     
-    def handle_collect_name(self, user, conv_state, message, media_url=None):
+    def handle_collect_name(self, user, conv_state, message, media=()):
         """Collect user's full name"""
-        cv_data = json.loads(conv_state.data)
-        cv_data['full_name'] = message.strip()
+        conv_state.set_field('full_name', message.strip())
         
         conv_state.state = 'collect_email'
-        conv_state.data = json.dumps(cv_data)
-        db.session.commit()
         
         return f"Nice to meet you, {message.strip()}! 👋\n\nWhat's your email address?"
     
-    def handle_collect_email(self, user, conv_state, message, media_url=None):
+    def handle_collect_email(self, user, conv_state, message, media=()):
         """Collect user's email"""
-        cv_data = json.loads(conv_state.data)
-        cv_data['email'] = message.strip()
+        conv_state.set_field('email', message.strip())
         
         conv_state.state = 'collect_phone'
-        conv_state.data = json.dumps(cv_data)
-        db.session.commit()
         
         return "Perfect! 📧\n\nWhat's your phone number?"
     
-    def handle_collect_phone(self, user, conv_state, message, media_url=None):
+    def handle_collect_phone(self, user, conv_state, message, media=()):
         """Collect user's phone number"""
-        cv_data = json.loads(conv_state.data)
-        cv_data['phone'] = message.strip()
+        conv_state.set_field('phone', message.strip())
         
         conv_state.state = 'collect_address'
-        conv_state.data = json.dumps(cv_data)
-        db.session.commit()
         
         return "Got it! 📱\n\nWhat's your address? (City, Country is fine)"
     
-    def handle_collect_address(self, user, conv_state, message, media_url=None):
+    def handle_collect_address(self, user, conv_state, message, media=()):
         """Collect user's address"""
-        cv_data = json.loads(conv_state.data)
-        cv_data['address'] = message.strip()
+        conv_state.set_field('address', message.strip())
         
         conv_state.state = 'collect_summary'
-        conv_state.data = json.dumps(cv_data)
-        db.session.commit()
         
         return "Great! 🏠\n\nNow, write a brief professional summary about yourself (2-3 sentences):"
     
-    def handle_collect_summary(self, user, conv_state, message, media_url=None):
+    def handle_collect_summary(self, user, conv_state, message, media=()):
         """Collect professional summary"""
-        cv_data = json.loads(conv_state.data)
-        cv_data['summary'] = message.strip()
+        conv_state.set_field('summary', message.strip())
         
         conv_state.state = 'collect_experience'
-        conv_state.data = json.dumps(cv_data)
-        db.session.commit()
         
         return """Excellent! 💼
 
@@ -161,17 +150,15 @@ Now let's add your work experience. For each job, include:
 
 Send each job as a separate message, or type 'done' when finished."""
     
-    def handle_collect_experience(self, user, conv_state, message, media_url=None):
+    def handle_collect_experience(self, user, conv_state, message, media=()):
         """Collect work experience"""
-        cv_data = json.loads(conv_state.data)
+        cv_data = conv_state.cv_data
         
         if message.lower().strip() == 'done':
             if not cv_data['experience']:
                 return "Please add at least one work experience entry, or type 'skip' to continue without experience."
             
             conv_state.state = 'collect_education'
-            conv_state.data = json.dumps(cv_data)
-            db.session.commit()
             
             return """Perfect! 🎓
 
@@ -185,8 +172,6 @@ Send each qualification as a separate message, or type 'done' when finished."""
         
         elif message.lower().strip() == 'skip':
             conv_state.state = 'collect_education'
-            conv_state.data = json.dumps(cv_data)
-            db.session.commit()
             
             return """No problem! 🎓
 
@@ -199,24 +184,21 @@ Let's add your education. For each qualification, include:
 Send each qualification as a separate message, or type 'done' when finished."""
         
         else:
-            # Add experience entry
-            cv_data['experience'].append(message.strip())
-            conv_state.data = json.dumps(cv_data)
-            db.session.commit()
+            # Add experience entry, parsed once here so renders only lay it out
+            entry = parse_experience(message.strip())
+            conv_state.append_field('experience', entry)
             
-            return f"Added experience entry! ✅\n\nAdd another experience or type 'done' to continue.\n\nTotal entries: {len(cv_data['experience'])}"
+            return f"Added experience entry! ✅\n\n💼 {describe_experience(entry)}\n\nAdd another experience or type 'done' to continue.\n\nTotal entries: {len(cv_data['experience'])}"
     
-    def handle_collect_education(self, user, conv_state, message, media_url=None):
+    def handle_collect_education(self, user, conv_state, message, media=()):
         """Collect education information"""
-        cv_data = json.loads(conv_state.data)
+        cv_data = conv_state.cv_data
         
         if message.lower().strip() == 'done':
             if not cv_data['education']:
                 return "Please add at least one education entry, or type 'skip' to continue without education."
             
             conv_state.state = 'collect_skills'
-            conv_state.data = json.dumps(cv_data)
-            db.session.commit()
             
             return """Great! 🛠️
 
@@ -229,8 +211,6 @@ Send all your skills in one message, separated by commas."""
         
         elif message.lower().strip() == 'skip':
             conv_state.state = 'collect_skills'
-            conv_state.data = json.dumps(cv_data)
-            db.session.commit()
             
             return """No problem! 🛠️
 
@@ -242,28 +222,23 @@ Let's add your skills. Examples:
 Send all your skills in one message, separated by commas."""
         
         else:
-            # Add education entry
-            cv_data['education'].append(message.strip())
-            conv_state.data = json.dumps(cv_data)
-            db.session.commit()
+            # Add education entry, parsed once here so renders only lay it out
+            entry = parse_education(message.strip())
+            conv_state.append_field('education', entry)
             
-            return f"Added education entry! ✅\n\nAdd another qualification or type 'done' to continue.\n\nTotal entries: {len(cv_data['education'])}"
+            return f"Added education entry! ✅\n\n🎓 {describe_education(entry)}\n\nAdd another qualification or type 'done' to continue.\n\nTotal entries: {len(cv_data['education'])}"
     
-    def handle_collect_skills(self, user, conv_state, message, media_url=None):
+    def handle_collect_skills(self, user, conv_state, message, media=()):
         """Collect skills"""
-        cv_data = json.loads(conv_state.data)
-        
         if message.lower().strip() == 'skip':
             skills = []
         else:
             # Split skills by comma and clean them
             skills = [skill.strip() for skill in message.split(',') if skill.strip()]
         
-        cv_data['skills'] = skills
+        conv_state.set_field('skills', skills)
         
         conv_state.state = 'profile_photo'
-        conv_state.data = json.dumps(cv_data)
-        db.session.commit()
         
         return """Awesome! 📸
 
@@ -274,138 +249,96 @@ Would you like to add a profile photo to your CV?
 
 Type '1' and send photo, or '2' to skip."""
     
-    def handle_profile_photo(self, user, conv_state, message, media_url=None):
+    def handle_profile_photo(self, user, conv_state, message, media=()):
         """Handle profile photo upload"""
-        cv_data = json.loads(conv_state.data)
-        
         if message.strip() == '2' or message.lower().strip() == 'skip':
             # Skip photo
             conv_state.state = 'select_template'
-            conv_state.data = json.dumps(cv_data)
-            db.session.commit()
             
-            return self.show_template_selection(user)
-        
-        elif media_url:
-            # Photo uploaded
-            try:
-                # Download and save the photo
-                import requests
-                import os
-                from datetime import datetime
-                
-                # Create safe filename
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"profile_{user.id}_{timestamp}.jpg"
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                
-                # Download image
-                response = requests.get(media_url)
-                if response.status_code == 200:
-                    with open(filepath, 'wb') as f:
-                        f.write(response.content)
-                    cv_data['profile_photo'] = filepath
-                else:
-                    cv_data['profile_photo'] = None
-                
-                conv_state.state = 'select_template'
-                conv_state.data = json.dumps(cv_data)
-                db.session.commit()
-                
-                return "Great photo! 📸✅\n\n" + self.show_template_selection(user)
+            return self.show_template_selection(user, conv_state)
+        
+        elif media:
+            if media_fetcher.background:
+                # Download and process the photo after replying; the templates follow as a message
+                unit_of_work.on_commit(
+                    lambda: media_fetcher.submit(self.ingest_photo_later, user.phone_number, list(media))
+                )
+                return "Got your photo! 📸 Processing it now, I'll send the templates in a moment."
             
-            except Exception as e:
-                logging.error(f"Error handling photo: {str(e)}")
-                return "Sorry, couldn't process your photo. Let's continue without it.\n\n" + self.show_template_selection(user)
+            # Photo uploaded: download, resize and recompress it once for every render
+            photo_path = profile_photos.ingest(media)
+            return self.accept_photo(user, conv_state, photo_path)
         
         else:
             return "Please send a photo or type '2' to skip."
     
-    def handle_select_template(self, user, conv_state, message, media_url=None):
+    def accept_photo(self, user, conv_state, photo_path):
+        """Record the processed photo, or its absence, and move on to template selection"""
+        conv_state.set_field('profile_photo', photo_path)
+        conv_state.state = 'select_template'
+        
+        if photo_path:
+            return "Great photo! 📸✅\n\n" + self.show_template_selection(user, conv_state)
+        return "Sorry, couldn't process your photo. Let's continue without it.\n\n" + self.show_template_selection(user, conv_state)
+    
+    def ingest_photo_later(self, phone_number, media):
+        """Process a photo off the webhook thread and send the next step as an outbound message"""
+        photo_path = profile_photos.ingest(media)
+        
+        with phone_locks.hold(phone_number):
+            with unit_of_work.unit_of_work():
+                user, conv_state = conversation_store.load(phone_number)
+                # The user skipped the photo or started over while it was processing
+                if conv_state.state != 'profile_photo':
+                    return
+                
+                reply = self.accept_photo(user, conv_state, photo_path)
+                conversation_store.save(user, conv_state)
+                outbound.queue(phone_number, reply)
+    
+    def handle_select_template(self, user, conv_state, message, media=()):
         """Handle template selection"""
-        cv_data = json.loads(conv_state.data)
+        cv_data = conv_state.cv_data
         
         try:
             template_choice = int(message.strip())
             
-            # Get available templates
-            if user.is_premium:
-                templates = Template.query.filter_by(is_active=True).all()
-            else:
-                templates = Template.query.filter_by(is_active=True, is_premium=False).all()
+            # Map the number to the list the user was actually shown
+            choices = cv_data.get('template_choices')
+            if choices is None:
+                choices = [t.id for t in template_catalog.available(user.is_premium)]
             
-            if 1 <= template_choice <= len(templates):
-                selected_template = templates[template_choice - 1]
-                cv_data['template_id'] = selected_template.id
+            if 1 <= template_choice <= len(choices):
+                selected_template = template_catalog.get(choices[template_choice - 1])
+                
+                if (selected_template is None or not selected_template.is_active
+                        or (selected_template.is_premium and not user.is_premium)):
+                    return "Sorry, that template is no longer available.\n\n" + self.show_template_selection(user, conv_state)
+                
+                conv_state.set_field('template_id', selected_template.id)
                 
                 # Check if this is a premium template and ask for color selection
-                if selected_template.is_premium and selected_template.template_file in ['template3.py', 'template5.py', 'template6.py', 'template8.py', 'template9.py', 'template10.py']:
+                if selected_template.is_premium and template_info(selected_template.template_file).supports_color:
                     conv_state.state = 'select_color'
-                    conv_state.data = json.dumps(cv_data)
-                    db.session.commit()
                     
                     return self.show_color_selection(selected_template)
                 
-                # For non-premium templates or basic templates, generate CV directly
-                cv_data['color_scheme'] = 'blue'  # default color
+                # For non-premium templates or basic templates, render with the default color
+                conv_state.set_field('color_scheme', 'blue')  # default color
                 
-                # Generate CV
-                from pdf_generator import PDFGenerator
-                pdf_gen = PDFGenerator()
-                
-                cv_file_path = pdf_gen.generate_cv(user, cv_data, selected_template)
-                
-                if cv_file_path:
-                    # Save CV to database
-                    new_cv = CV()
-                    new_cv.user_id = user.id
-                    new_cv.template_id = selected_template.id
-                    new_cv.full_name = cv_data['full_name']
-                    new_cv.email = cv_data['email']
-                    new_cv.phone = cv_data['phone']
-                    new_cv.address = cv_data['address']
-                    new_cv.summary = cv_data['summary']
-                    new_cv.experience = json.dumps(cv_data['experience'])
-                    new_cv.education = json.dumps(cv_data['education'])
-                    new_cv.skills = json.dumps(cv_data['skills'])
-                    new_cv.profile_photo = cv_data.get('profile_photo')
-                    new_cv.file_path = cv_file_path
-                    new_cv.is_premium = selected_template.is_premium
-                    new_cv.color_scheme = cv_data.get('color_scheme', 'blue')
-                    
-                    db.session.add(new_cv)
-                    db.session.commit()
-                    
-                    # Reset conversation state
-                    conv_state.state = 'menu'
-                    conv_state.data = '{}'
-                    db.session.commit()
-                    
-                    success_msg = f"🎉 Your CV has been created successfully!\n\n"
-                    success_msg += f"Template: {selected_template.name}\n"
-                    success_msg += f"Created: {datetime.utcnow().strftime('%Y-%m-%d %H:%M')}\n\n"
-                    
-                    if not user.is_premium:
-                        success_msg += "💎 Want premium templates and editable formats?\n"
-                        success_msg += "Type 'premium' to see upgrade options!\n\n"
-                    
-                    success_msg += self.get_main_menu()
-                    
-                    return success_msg
-                else:
-                    return "Sorry, there was an error generating your CV. Please try again."
+                return self.finalize_cv(user, conv_state, cv_data, selected_template)
             else:
-                return f"Please select a valid template number (1-{len(templates)})."
+                return f"Please select a valid template number (1-{len(choices)})."
                 
         except ValueError:
             return "Please enter a number to select a template."
     
-    def show_template_selection(self, user):
+    def show_template_selection(self, user, conv_state):
         """Show available templates for selection"""
-        if user.is_premium:
-            templates = Template.query.filter_by(is_active=True).all()
-        else:
-            templates = Template.query.filter_by(is_active=True, is_premium=False).all()
+        templates = template_catalog.available(user.is_premium)
+        
+        # Remember the numbering so the reply maps to the template that was shown
+        conv_state.set_field('template_choices', [t.id for t in templates])
         
         msg = "Choose your CV template:\n\n"
         
@@ -420,7 +353,7 @@ Type '1' and send photo, or '2' to skip."""
     
     def show_templates(self, user, conv_state):
         """Show all available templates"""
-        templates = Template.query.filter_by(is_active=True).all()
+        templates = template_catalog.available(include_premium=True)
         
         msg = "📋 Available CV Templates:\n\n"
         
@@ -490,7 +423,7 @@ Type '1' and send photo, or '2' to skip."""
         msg += self.get_main_menu()
         return msg
     
-    def handle_premium_upgrade(self, user, conv_state, message, media_url=None):
+    def handle_premium_upgrade(self, user, conv_state, message, media=()):
         """Handle premium upgrade selection"""
         try:
             choice = int(message.strip())
@@ -515,11 +448,10 @@ Type '1' and send photo, or '2' to skip."""
                 transaction.description = package["name"]
                 
                 db.session.add(transaction)
-                db.session.commit()
+                db.session.flush()
                 
                 conv_state.state = 'payment'
-                conv_state.data = json.dumps({"transaction_id": transaction.id})
-                db.session.commit()
+                conv_state.cv_data = {"transaction_id": transaction.id}
                 
                 msg = f"💳 Payment Required\n\n"
                 msg += f"Package: {package['name']}\n"
@@ -539,17 +471,16 @@ Type '1' and send photo, or '2' to skip."""
         except ValueError:
             return "Please enter a number to select a package."
     
-    def handle_payment(self, user, conv_state, message, media_url=None):
+    def handle_payment(self, user, conv_state, message, media=()):
         """Handle payment confirmation"""
         if message.lower().strip() == 'cancel':
             conv_state.state = 'menu'
-            conv_state.data = '{}'
-            db.session.commit()
+            conv_state.cv_data = {}
             
             return "Payment cancelled. No charges applied.\n\n" + self.get_main_menu()
         
         # Mock payment processing
-        data = json.loads(conv_state.data)
+        data = conv_state.cv_data
         transaction_id = data.get('transaction_id')
         
         if transaction_id:
@@ -561,13 +492,12 @@ Type '1' and send photo, or '2' to skip."""
                 transaction.completed_at = datetime.utcnow()
                 
                 # Upgrade user to premium
+                User.query.filter_by(id=user.id).update({'is_premium': True})
                 user.is_premium = True
                 
-                db.session.commit()
                 
                 conv_state.state = 'menu'
-                conv_state.data = '{}'
-                db.session.commit()
+                conv_state.cv_data = {}
                 
                 msg = "🎉 Payment successful!\n\n"
                 msg += "✅ You're now a Premium user!\n"
@@ -616,9 +546,9 @@ Type '1' and send photo, or '2' to skip."""
         msg += "Reply with the number of your preferred color scheme:"
         return msg
     
-    def handle_select_color(self, user, conv_state, message, media_url=None):
+    def handle_select_color(self, user, conv_state, message, media=()):
         """Handle color scheme selection"""
-        cv_data = json.loads(conv_state.data)
+        cv_data = conv_state.cv_data
         
         color_map = {
             '1': 'blue',
@@ -631,70 +561,42 @@ Type '1' and send photo, or '2' to skip."""
         
         color_choice = message.strip()
         if color_choice in color_map:
-            cv_data['color_scheme'] = color_map[color_choice]
+            conv_state.set_field('color_scheme', color_map[color_choice])
             
             # Get the selected template
-            template = Template.query.get(cv_data['template_id'])
-            
-            # Generate CV with selected color
-            from pdf_generator import PDFGenerator
-            pdf_gen = PDFGenerator()
-            
-            cv_file_path = pdf_gen.generate_cv(user, cv_data, template)
+            template = template_catalog.get(cv_data['template_id'])
             
-            if cv_file_path:
-                # Save CV to database
-                new_cv = CV()
-                new_cv.user_id = user.id
-                new_cv.template_id = template.id
-                new_cv.full_name = cv_data['full_name']
-                new_cv.email = cv_data['email']
-                new_cv.phone = cv_data['phone']
-                new_cv.address = cv_data['address']
-                new_cv.summary = cv_data['summary']
-                new_cv.experience = json.dumps(cv_data['experience'])
-                new_cv.education = json.dumps(cv_data['education'])
-                new_cv.skills = json.dumps(cv_data['skills'])
-                new_cv.profile_photo = cv_data.get('profile_photo')
-                new_cv.file_path = cv_file_path
-                new_cv.is_premium = template.is_premium
-                new_cv.color_scheme = cv_data['color_scheme']
-                
-                db.session.add(new_cv)
-                db.session.commit()
-                
-                # Reset conversation
-                conv_state.state = 'idle'
-                conv_state.data = ''
-                db.session.commit()
-                
-                # Send CV file via WhatsApp
-                from twilio.rest import Client
-                import os
-                
-                client = Client(os.environ.get('TWILIO_ACCOUNT_SID'), os.environ.get('TWILIO_AUTH_TOKEN'))
-                
-                try:
-                    # Upload file and send
-                    with open(cv_file_path, 'rb') as file:
-                        message = client.messages.create(
-                            body=f"🎉 Your premium CV is ready!\n\nTemplate: {template.name}\nColor: {color_map[color_choice].title()}\n\n{self.get_main_menu()}",
-                            from_=os.environ.get('TWILIO_PHONE_NUMBER'),
-                            to=user.phone_number,
-                            media_url=f"data:application/pdf;base64,{file.read()}"
-                        )
-                    
-                    return f"🎉 Perfect! Your CV has been generated with {color_map[color_choice]} colors and sent to you!\n\n{self.get_main_menu()}"
-                    
-                except Exception as e:
-                    logging.error(f"Error sending CV file: {str(e)}")
-                    return f"✅ Your CV has been generated successfully!\n\nTemplate: {template.name}\nColor: {color_map[color_choice].title()}\n\n{self.get_main_menu()}"
-            
-            else:
-                return "❌ Sorry, there was an error generating your CV. Please try again.\n\n" + self.get_main_menu()
+            return self.finalize_cv(user, conv_state, cv_data, template)
         
         else:
-            return "Please select a valid color option (1-6):\n\n" + self.show_color_selection(Template.query.get(cv_data['template_id']))
+            return "Please select a valid color option (1-6):\n\n" + self.show_color_selection(template_catalog.get(cv_data['template_id']))
+    
+    def finalize_cv(self, user, conv_state, cv_data, template):
+        """Queue the finished CV for rendering and return to the menu"""
+        from render_queue import render_queue
+        
+        # Conversations started before entries were parsed on arrival still hold text
+        cv_data['experience'] = [parse_experience(entry) for entry in cv_data.get('experience', [])]
+        cv_data['education'] = [parse_education(entry) for entry in cv_data.get('education', [])]
+        
+        render_queue.enqueue(user, template, cv_data)
+        
+        # Reset conversation state
+        conv_state.state = 'menu'
+        conv_state.cv_data = {}
+        
+        msg = "⏳ Your CV is being prepared!\n\n"
+        msg += f"Template: {template.name}\n"
+        msg += f"Color: {cv_data.get('color_scheme', 'blue').title()}\n\n"
+        msg += "I'll send it to you here as soon as it's ready.\n\n"
+        
+        if not user.is_premium:
+            msg += "💎 Want premium templates and editable formats?\n"
+            msg += "Type 'premium' to see upgrade options!\n\n"
+        
+        msg += self.get_main_menu()
+        
+        return msg
     
     def get_main_menu(self):
         """Get the main menu options"""
@@ -0,0 +1,327 @@
+"""
+Conversation state storage for the webhook hot path
+
+Each inbound message needs the sender's user record and conversation state.
+Both are loaded with one joined SELECT into lightweight row objects instead
+of ORM instances. A first-time sender is created with INSERT ... ON CONFLICT
+DO NOTHING, so concurrent first messages cannot collide. After the
+message is handled, the state is written back in a single UPDATE and the
+user's activity goes to the last_active write-behind buffer. Nothing here
+commits; the caller's unit of work does.
+
+Decoded conversation data is kept in a bounded LRU/TTL cache keyed by phone
+number. Every write bumps the row's version and is written through to the
+cache once committed. The load query passes the cached version and only
+returns the JSON blob when the row has moved on. A cache hit skips both the
+blob transfer and json.loads, and another worker's write is never missed.
+
+The data blob is not rewritten on every step. Each changed field is appended
+to the conversation_patches log. On load, the log is replayed on top of the
+blob, and it is compacted when the CV is finished or the log gets long. Row
+writes per step stay flat however long the CV grows.
+
+The same query also reads the template catalog version, so the bot's
+template list is checked for freshness without an extra round trip.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import case, delete, insert, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from models import User, ConversationState, ConversationPatch
+from activity_tracker import last_active_buffer
+from template_catalog import template_catalog
+from unit_of_work import on_commit
+
+users = User.__table__
+conversation_states = ConversationState.__table__
+conversation_patches = ConversationPatch.__table__
+
+
+class StaleStateError(Exception):
+    """Raised when the conversation state changed underneath a handler"""
+
+
+class UserRow:
+    """The parts of a users row the conversation flow needs"""
+
+    def __init__(self, id, phone_number, is_premium):
+        self.id = id
+        self.phone_number = phone_number
+        self.is_premium = bool(is_premium)
+
+    def __repr__(self):
+        return f'<UserRow {self.phone_number}>'
+
+
+class ConversationRow:
+    """A conversation_states row with its data decoded, written back after each message
+
+    Handlers change the data through set_field() and append_field(), so that
+    only the changed fields are persisted. Assigning cv_data replaces the data
+    wholesale and compacts the row on the next save.
+    """
+
+    def __init__(self, phone_number, state, cv_data, version, patch_count=0, updated_at=None):
+        self.phone_number = phone_number
+        self.state = state
+        self.version = version
+        self.patch_count = patch_count
+        self.updated_at = updated_at
+        self._cv_data = cv_data
+        self.changes = []
+        self.replaced = False
+
+    @property
+    def cv_data(self):
+        return self._cv_data
+
+    @cv_data.setter
+    def cv_data(self, cv_data):
+        self._cv_data = cv_data
+        self.changes = []
+        self.replaced = True
+
+    def set_field(self, field, value):
+        """Set one field of the conversation data"""
+        self._cv_data[field] = value
+        self.changes.append(('set', field, value))
+
+    def append_field(self, field, value):
+        """Append a value to a list field of the conversation data"""
+        self._cv_data.setdefault(field, []).append(value)
+        self.changes.append(('append', field, value))
+
+    def __repr__(self):
+        return f'<ConversationRow {self.phone_number}: {self.state}>'
+
+
+class ConversationCache:
+    """Bounded LRU of decoded conversation data with TTL expiry"""
+
+    def __init__(self, max_entries=5000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0}
+
+    def checkout(self, phone_number):
+        """Take the cached entry out of the cache, returning (version, cv_data) or None
+
+        The caller owns the decoded data until it checks it back in after a
+        commit. A failed message therefore never leaves half-applied changes
+        in the cache.
+        """
+        with self._lock:
+            entry = self._entries.pop(phone_number, None)
+            if entry is None:
+                return None
+
+            version, cv_data, cached_at = entry
+            if time.monotonic() - cached_at > self.ttl:
+                self._stats['evictions'] += 1
+                return None
+            return version, cv_data
+
+    def checkin(self, phone_number, version, cv_data):
+        """Store committed conversation data"""
+        with self._lock:
+            self._entries[phone_number] = (version, cv_data, time.monotonic())
+            self._entries.move_to_end(phone_number)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def record(self, outcome):
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def stats(self):
+        """Hit/miss counters for this worker process"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses'] + stats['stale']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+class ConversationStore:
+    # Fold the patch log back into the data blob once it gets this long
+    COMPACT_AFTER = 50
+
+    def __init__(self):
+        self.cache = ConversationCache()
+
+    def init_app(self, app):
+        """Read cache settings from the app config"""
+        self.cache.max_entries = app.config['STATE_CACHE_SIZE']
+        self.cache.ttl = app.config['STATE_CACHE_TTL_SECONDS']
+
+    def load(self, phone_number):
+        """Load the user and conversation state for a phone number, creating them if needed"""
+        cached = self.cache.checkout(phone_number)
+        cached_version = cached[0] if cached else None
+
+        row = db.session.execute(self._session_query(phone_number, cached_version)).first()
+
+        if row is None or row.state is None:
+            self._create(phone_number)
+            row = db.session.execute(self._session_query(phone_number, None)).first()
+
+        if cached and row.version == cached_version:
+            self.cache.record('hits')
+            cv_data = cached[1]
+        else:
+            self.cache.record('stale' if cached else 'misses')
+            cv_data = json.loads(row.data) if row.data else {}
+            if row.patch_count:
+                self._apply_patches(cv_data, phone_number)
+
+        # The template catalog version rides along, so a stale catalog is reloaded here
+        template_catalog.sync(row.catalog_version)
+
+        user = UserRow(row.id, row.phone_number, row.is_premium)
+        conv_state = ConversationRow(row.phone_number, row.state, cv_data, row.version,
+                                     row.patch_count, row.updated_at)
+        return user, conv_state
+
+    def save(self, user, conv_state):
+        """Write the conversation state back and record the user's activity
+
+        Changed fields are appended to the patch log, so a step writes only
+        what it changed. The whole blob is rewritten only when the data was
+        replaced (a new CV or a finished one) or when the log grows past
+        COMPACT_AFTER.
+        """
+        now = datetime.utcnow()
+        conv_state.updated_at = now
+        new_version = conv_state.version + 1
+
+        values = {'state': conv_state.state, 'version': new_version, 'updated_at': now}
+        compact = conv_state.replaced or conv_state.patch_count + len(conv_state.changes) > self.COMPACT_AFTER
+        if compact:
+            values['data'] = json.dumps(conv_state.cv_data)
+            values['patch_count'] = 0
+        elif conv_state.changes:
+            values['patch_count'] = conversation_states.c.patch_count + len(conv_state.changes)
+
+        written = db.session.execute(
+            update(conversation_states)
+            .where(conversation_states.c.phone_number == conv_state.phone_number)
+            .where(conversation_states.c.version == conv_state.version)
+            .values(**values)
+        ).rowcount
+        if not written:
+            raise StaleStateError(f"Conversation state for {conv_state.phone_number} changed concurrently")
+
+        if compact and conv_state.patch_count:
+            db.session.execute(
+                delete(conversation_patches)
+                .where(conversation_patches.c.phone_number == conv_state.phone_number)
+            )
+        elif not compact and conv_state.changes:
+            db.session.execute(insert(conversation_patches), [
+                {
+                    'phone_number': conv_state.phone_number,
+                    'version': new_version,
+                    'op': op,
+                    'field': field,
+                    'value': json.dumps(value)
+                }
+                for op, field, value in conv_state.changes
+            ])
+
+        # Write through to the cache once the new version is durable
+        phone_number, cv_data = conv_state.phone_number, conv_state.cv_data
+        on_commit(lambda: self.cache.checkin(phone_number, new_version, cv_data))
+
+        # last_active is written in bulk by the write-behind buffer, for messages that took effect
+        user_id = user.id
+        on_commit(lambda: last_active_buffer.touch(user_id, now))
+
+    def _apply_patches(self, cv_data, phone_number):
+        """Replay the patch log on top of the compacted data"""
+        patches = db.session.execute(
+            select(conversation_patches.c.op, conversation_patches.c.field, conversation_patches.c.value)
+            .where(conversation_patches.c.phone_number == phone_number)
+            .order_by(conversation_patches.c.id)
+        )
+        for op, field, value in patches:
+            value = json.loads(value)
+            if op == 'append':
+                cv_data.setdefault(field, []).append(value)
+            else:
+                cv_data[field] = value
+
+    def _session_query(self, phone_number, cached_version):
+        if cached_version is None:
+            data = conversation_states.c.data
+        else:
+            # Skip the blob when the cached copy is still current
+            data = case(
+                (conversation_states.c.version == literal(cached_version), None),
+                else_=conversation_states.c.data
+            )
+
+        return (
+            select(
+                users.c.id,
+                users.c.phone_number,
+                users.c.is_premium,
+                conversation_states.c.state,
+                conversation_states.c.version,
+                conversation_states.c.patch_count,
+                data.label('data'),
+                conversation_states.c.updated_at,
+                template_catalog.version_column().label('catalog_version')
+            )
+            .select_from(users.outerjoin(
+                conversation_states,
+                conversation_states.c.phone_number == users.c.phone_number
+            ))
+            .where(users.c.phone_number == phone_number)
+        )
+
+    def _create(self, phone_number):
+        """Auto-register a new user and their conversation state"""
+        now = datetime.utcnow()
+
+        created = db.session.execute(
+            self._insert_ignore(users).values(
+                phone_number=phone_number,
+                is_premium=False,
+                created_at=now,
+                last_active=now
+            )
+        ).rowcount
+        db.session.execute(
+            self._insert_ignore(conversation_states).values(
+                phone_number=phone_number,
+                state='welcome',
+                data='{}',
+                version=0,
+                patch_count=0,
+                updated_at=now
+            )
+        )
+
+        if created:
+            logging.info(f"Auto-registered new user: {phone_number}")
+
+    def _insert_ignore(self, table):
+        """INSERT ... ON CONFLICT DO NOTHING for the current database"""
+        if db.engine.dialect.name == 'postgresql':
+            return postgresql.insert(table).on_conflict_do_nothing()
+        return sqlite.insert(table).on_conflict_do_nothing()
+
+
+conversation_store = ConversationStore()
@@ -1,61 +1,141 @@
-
 """
 CV Templates Package
 
 This package contains different CV template generators.
 Each template is implemented as a separate module with a TemplateGenerator class.
+
+Template modules (and ReportLab with them) are imported the first time a
+template is used, not when the package is imported. Web workers that only
+list templates never load them. Template metadata lives in the registry
+below, so it can be read without importing anything.
 """
 
+import hashlib
+import importlib
+import importlib.util
+import threading
+
 __version__ = '1.0.0'
 __author__ = 'CV Maker Bot'
 
-# Import all available templates
-from . import template1
-from . import template2
-from . import template3
-from . import template4
-from . import template5
-from . import template6
-from . import template7
-from . import template8
-from . import template9
-from . import template10
+# Colour schemes offered by the templates that support them
+COLOR_NAMES = ('blue', 'green', 'red', 'purple', 'orange', 'navy')
+
+# Profile photos are embedded at up to this resolution
+PHOTO_DPI = 300
+
+_MM = 72 / 25.4  # points per millimetre
+
+
+class TemplateInfo:
+    """Static metadata for a template module"""
+
+    def __init__(self, name, color_schemes=(), page_size='A4', photo_size=None):
+        self.name = name
+        self.color_schemes = tuple(color_schemes)
+        self.page_size = page_size
+        self.photo_size = photo_size  # Square photo box in points, None if no photo
+
+    @property
+    def supports_color(self):
+        return bool(self.color_schemes)
+
+    def __repr__(self):
+        return f'<TemplateInfo {self.name}>'
+
+
+# Registry of available templates
+TEMPLATES = {
+    'template1': TemplateInfo('template1'),
+    'template2': TemplateInfo('template2'),
+    'template3': TemplateInfo('template3', color_schemes=COLOR_NAMES, photo_size=80),
+    'template4': TemplateInfo('template4'),
+    'template5': TemplateInfo('template5', color_schemes=COLOR_NAMES, photo_size=120),
+    'template6': TemplateInfo('template6', color_schemes=COLOR_NAMES, photo_size=100),
+    'template7': TemplateInfo('template7'),
+    'template8': TemplateInfo('template8'),
+    'template9': TemplateInfo('template9', photo_size=55 * _MM),
+    'template10': TemplateInfo('template10', color_schemes=COLOR_NAMES, photo_size=50 * _MM),
+}
 
 # List of available templates
-AVAILABLE_TEMPLATES = [
-    'template1',
-    'template2',
-    'template3',
-    'template4',
-    'template5',
-    'template6',
-    'template7',
-    'template8',
-    'template9',
-    'template10'
-]
+AVAILABLE_TEMPLATES = list(TEMPLATES)
+
+_modules = {}
+_versions = {}
+_import_lock = threading.Lock()
+
+# Generator instances keep per-render state, so each thread gets its own
+_local = threading.local()
+
+
+def template_key(template_name):
+    """Normalise 'template3.py' or 'template3' to the registry key"""
+    key = template_name[:-3] if template_name.endswith('.py') else template_name
+    if key not in TEMPLATES:
+        raise ValueError(f"Unknown template: {template_name}")
+    return key
+
+
+def template_info(template_name):
+    """Get template metadata without importing the template module"""
+    return TEMPLATES[template_key(template_name)]
+
+
+def template_version(template_name):
+    """Hash of a template's source, so caches of its output notice code changes"""
+    key = template_key(template_name)
+    version = _versions.get(key)
+    if version is None:
+        digest = hashlib.sha256()
+        for module_name in (key, 'parsing', 'stylesheets', 'output'):
+            spec = importlib.util.find_spec(f'{__name__}.{module_name}')
+            with open(spec.origin, 'rb') as f:
+                digest.update(f.read())
+        version = _versions[key] = digest.hexdigest()[:16]
+    return version
+
+
+def photo_pixels():
+    """Edge length in pixels that covers the largest photo box at PHOTO_DPI"""
+    largest = max(info.photo_size or 0 for info in TEMPLATES.values())
+    return int(round(largest / 72 * PHOTO_DPI))
+
+
+def load_template(template_name):
+    """Import a template module on first use"""
+    key = template_key(template_name)
+    module = _modules.get(key)
+    if module is None:
+        with _import_lock:
+            module = _modules.get(key)
+            if module is None:
+                module = importlib.import_module(f'{__name__}.{key}')
+                _modules[key] = module
+    return module
+
 
 def get_template_generator(template_name):
     """Get template generator by name"""
-    if template_name == 'template1':
-        return template1.TemplateGenerator
-    elif template_name == 'template2':
-        return template2.TemplateGenerator
-    elif template_name == 'template3':
-        return template3.TemplateGenerator
-    elif template_name == 'template4':
-        return template4.TemplateGenerator
-    elif template_name == 'template5':
-        return template5.TemplateGenerator
-    elif template_name == 'template6':
-        return template6.TemplateGenerator
-    elif template_name == 'template7':
-        return template7.TemplateGenerator
-    elif template_name == 'template8':
-        return template8.TemplateGenerator
-    elif template_name == 'template9':
-        return template9.TemplateGenerator
-    elif template_name == 'template10':
-        return template10.TemplateGenerator
-    else:
-        raise ValueError(f"Unknown template: {template_name}")
+    return load_template(template_name).TemplateGenerator
+
+
+def get_generator(template_name):
+    """Get this thread's cached generator instance for a template"""
+    generators = getattr(_local, 'generators', None)
+    if generators is None:
+        generators = _local.generators = {}
+
+    key = template_key(template_name)
+    generator = generators.get(key)
+    if generator is None:
+        generator = generators[key] = get_template_generator(key)()
+    return generator
+
+
+def prewarm_styles():
+    """Build every template's stylesheets up front so no render pays for them"""
+    for template_name, info in TEMPLATES.items():
+        generator = get_generator(template_name)
+        for color_scheme in info.color_schemes or [None]:
+            generator.load_styles(color_scheme)
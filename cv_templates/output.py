@@ -0,0 +1,14 @@
+"""
+PDF output settings shared by every template
+
+ReportLab normally stamps each PDF with the current time and a random
+document ID, so identical input gives different bytes. In invariant mode
+(the default) both are fixed, and the same CV data, template and colour
+always produce a byte-identical file. That is what the PDF cache, ETags
+and golden-file checks rely on. Set PDF_INVARIANT=0 to get real creation
+dates back.
+"""
+
+import os
+
+INVARIANT = os.environ.get('PDF_INVARIANT', '1') != '0'
@@ -0,0 +1,195 @@
+"""
+Experience and education entry parsing shared by all templates
+
+Users send each job or qualification as a free-text message, e.g.
+
+    Senior Manager at Tech Corp
+    Jan 2020 - Present
+    Led a team of 15 people
+
+or with the organisation on its own line:
+
+    Bachelor of Science
+    Stanford University
+    2012
+
+The conversation flow parses each entry when the user sends it and stores
+the structured dict, so templates only lay the fields out. Date lines are
+recognised with precompiled patterns instead of substring checks.
+
+Templates still accept text entries (CVs and conversations from before entries
+were stored structured). Those are parsed on demand and memoized per entry
+text, so re-rendering a CV in another template or colour does not parse it
+again. Dict entries are normalised to the same shape.
+"""
+
+import re
+from functools import lru_cache
+
+# Parsed entries kept per process; a CV has a handful, so this covers many CVs
+PARSE_CACHE_SIZE = 2048
+
+# A line this short that mentions a year is taken as the period
+SHORT_PERIOD_LENGTH = 30
+
+_MONTH = r'(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]{0,6}\.?'
+_YEAR = r'(?:19|20)\d{2}'
+_DATE = rf'(?:{_MONTH}\s{{0,3}})?{_YEAR}|(?:0?[1-9]|1[0-2])/(?:19|20)?\d{{2}}'
+_OPEN_END = r'present|current|now|today|date|ongoing'
+_RANGE = rf'(?:{_DATE})\s{{0,3}}(?:-|–|—|to|until|till)\s{{0,3}}(?:{_DATE}|{_OPEN_END})'
+
+# A line that is nothing but a date or a date range
+PERIOD_LINE = re.compile(
+    rf'[(\[]?\s{{0,3}}(?:(?:since|from)\s{{1,3}})?(?:{_RANGE}|{_DATE})\s{{0,3}}[)\]]?\.?',
+    re.IGNORECASE
+)
+# A date range inside other text, e.g. on the heading line
+DATE_RANGE = re.compile(rf'\(?\b(?:{_RANGE})\b\)?', re.IGNORECASE)
+YEAR = re.compile(rf'\b{_YEAR}\b')
+
+# "Title at Company" and friends; tried in order
+EXPERIENCE_SEPARATORS = (
+    re.compile(r'\s+(?:at|@)\s+', re.IGNORECASE),
+    re.compile(r'\s+[|]\s+'),
+    re.compile(r'\s+[-–—]\s+'),
+)
+EDUCATION_SEPARATORS = (
+    re.compile(r'\s+(?:at|from|@)\s+', re.IGNORECASE),
+    re.compile(r'\s+[|]\s+'),
+    re.compile(r'\s+[-–—]\s+'),
+)
+
+BULLET = re.compile(r'^(?:[•·▪●*]|-(?=\s))\s*')
+_TRIM = ' ,;|-–—'
+
+
+def parse_experience(entry):
+    """Structured experience entry: title, company, period, bullets and description"""
+    if isinstance(entry, dict):
+        title = entry.get('title') or ''
+        company = entry.get('company') or ''
+        period = entry.get('period') or ''
+        bullets = _entry_lines(entry, 'bullets')
+    else:
+        title, company, period, bullets = _parse_experience_text(str(entry))
+
+    return {
+        'title': title,
+        'company': company,
+        'period': period,
+        'bullets': list(bullets),
+        'description': ' '.join(bullets),
+    }
+
+
+def parse_education(entry):
+    """Structured education entry: degree, institution, period, details and description"""
+    if isinstance(entry, dict):
+        degree = entry.get('degree') or ''
+        institution = entry.get('institution') or ''
+        period = entry.get('period') or ''
+        details = _entry_lines(entry, 'details')
+    else:
+        degree, institution, period, details = _parse_education_text(str(entry))
+
+    return {
+        'degree': degree,
+        'institution': institution,
+        'period': period,
+        'details': list(details),
+        'description': ' '.join(details),
+    }
+
+
+def describe_experience(entry):
+    """One-line summary of a structured experience entry"""
+    heading = ' at '.join(part for part in (entry['title'], entry['company']) if part)
+    return f"{heading} ({entry['period']})" if entry['period'] else heading
+
+
+def describe_education(entry):
+    """One-line summary of a structured education entry"""
+    heading = ', '.join(part for part in (entry['degree'], entry['institution']) if part)
+    return f"{heading} ({entry['period']})" if entry['period'] else heading
+
+
+def current_job_title(experience):
+    """Title of the first (most recent) experience entry, or None"""
+    for entry in experience:
+        title = parse_experience(entry)['title']
+        if title:
+            return title[:150]
+    return None
+
+
+def is_period(line):
+    """Whether a line of an entry reads as its dates"""
+    if PERIOD_LINE.fullmatch(line):
+        return True
+    return len(line) <= SHORT_PERIOD_LENGTH and YEAR.search(line) is not None
+
+
+def cache_info():
+    """Memoization counters for the entry parsers"""
+    return {
+        'experience': _parse_experience_text.cache_info()._asdict(),
+        'education': _parse_education_text.cache_info()._asdict(),
+    }
+
+
+def clear_cache():
+    _parse_experience_text.cache_clear()
+    _parse_education_text.cache_clear()
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_experience_text(text):
+    return _parse_entry(text, EXPERIENCE_SEPARATORS)
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_education_text(text):
+    return _parse_entry(text, EDUCATION_SEPARATORS)
+
+
+def _parse_entry(text, separators):
+    """Split entry text into (heading, organisation, period, remaining lines)"""
+    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    if not lines:
+        return '', '', '', ()
+
+    heading, rest = lines[0], lines[1:]
+    period = ''
+
+    period_index = next((i for i, line in enumerate(rest) if is_period(line)), None)
+    if period_index is not None:
+        period = rest.pop(period_index)
+    else:
+        # Dates written on the heading line, e.g. "Engineer at Acme (2019 - 2021)"
+        match = DATE_RANGE.search(heading)
+        remainder = (heading[:match.start()] + heading[match.end():]).strip(_TRIM) if match else ''
+        if remainder:
+            period = match.group(0).strip('()')
+            heading = remainder
+
+    name, organisation = heading, ''
+    for separator in separators:
+        parts = separator.split(heading, 1)
+        if len(parts) == 2 and parts[0].strip(_TRIM) and parts[1].strip(_TRIM):
+            name, organisation = parts[0].strip(_TRIM), parts[1].strip(_TRIM)
+            break
+
+    # "Title / Organisation / Dates" on separate lines
+    if not organisation and period_index == 1:
+        organisation = rest.pop(0)
+
+    details = (BULLET.sub('', line).strip() for line in rest)
+    return name, organisation, period, tuple(line for line in details if line)
+
+
+def _entry_lines(entry, key):
+    lines = entry.get(key)
+    if lines is None:
+        lines = str(entry.get('description') or '').split('\n')
+    lines = (BULLET.sub('', str(line).strip()).strip() for line in lines)
+    return [line for line in lines if line]
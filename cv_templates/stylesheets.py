@@ -0,0 +1,44 @@
+"""
+Shared ReportLab stylesheets
+
+A template's stylesheet is a getSampleStyleSheet() plus a dozen custom
+ParagraphStyles, and it depends only on the template and colour scheme.
+Each (template, colour scheme) pair is built once per process and then
+shared by every render. Shared stylesheets are read-only; templates that
+need a one-off style create their own ParagraphStyle.
+"""
+
+import threading
+
+_stylesheets = {}
+_lock = threading.Lock()
+_stats = {'built': 0, 'hits': 0}
+
+
+def shared_stylesheet(template, color_scheme, build):
+    """Return the stylesheet for a template and colour scheme, calling build() on first use"""
+    key = (template, color_scheme)
+    stylesheet = _stylesheets.get(key)
+    if stylesheet is not None:
+        _stats['hits'] += 1
+        return stylesheet
+
+    with _lock:
+        stylesheet = _stylesheets.get(key)
+        if stylesheet is None:
+            stylesheet = build()
+            _stylesheets[key] = stylesheet
+            _stats['built'] += 1
+    return stylesheet
+
+
+def stylesheet_stats():
+    """Build/hit counters for this process"""
+    return dict(_stats, cached=len(_stylesheets))
+
+
+def clear_stylesheets():
+    """Drop every cached stylesheet (used by benchmarks)"""
+    with _lock:
+        _stylesheets.clear()
+        _stats.update(built=0, hits=0)
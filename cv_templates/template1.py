@@ -12,11 +12,23 @@ from reportlab.lib.units import inch, mm, cm
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT, TA_JUSTIFY
 
+from .output import INVARIANT
+from .parsing import parse_education, parse_experience
+from .stylesheets import shared_stylesheet
+
 class TemplateGenerator:
     def __init__(self):
+        self.load_styles()
+    
+    def load_styles(self, color_scheme=None):
+        """Use the shared stylesheet for this template, building it on first use"""
+        self.styles = shared_stylesheet(__name__, None, self._build_styles)
+    
+    def _build_styles(self):
         self.styles = getSampleStyleSheet()
         self.setup_custom_styles()
-        
+        return self.styles
+    
     def setup_custom_styles(self):
         """Setup custom paragraph styles for this template"""
         # Header name style
@@ -114,7 +126,8 @@ class TemplateGenerator:
                 rightMargin=20*mm,
                 leftMargin=20*mm,
                 topMargin=20*mm,
-                bottomMargin=20*mm
+                bottomMargin=20*mm,
+                invariant=INVARIANT
             )
             
             story = []
@@ -140,7 +153,6 @@ class TemplateGenerator:
             
             # Build PDF
             doc.build(story)
-            logging.info(f"Template1 CV generated: {filepath}")
             return True
             
         except Exception as e:
@@ -206,56 +218,25 @@ class TemplateGenerator:
     def _parse_experience_entry(self, experience_text):
         """Parse a single experience entry"""
         elements = []
+        entry = parse_experience(experience_text)
         
-        # Split the experience text into lines
-        lines = [line.strip() for line in experience_text.split('\n') if line.strip()]
-        
-        if not lines:
+        if not any(entry.values()):
             return elements
         
-        # First line should contain job title and company
-        first_line = lines[0]
-        
-        # Try to parse job title and company
-        if ' at ' in first_line:
-            parts = first_line.split(' at ', 1)
-            job_title = parts[0].strip()
-            company = parts[1].strip()
-        else:
-            job_title = first_line
-            company = ""
-        
         # Job title
-        elements.append(Paragraph(job_title, self.styles['JobTitle']))
+        elements.append(Paragraph(entry['title'], self.styles['JobTitle']))
         
         # Company
-        if company:
-            elements.append(Paragraph(company, self.styles['Organization']))
-        
-        # Look for duration in subsequent lines
-        duration = ""
-        description_lines = []
-        
-        for line in lines[1:]:
-            # Check if line looks like a date range
-            if any(keyword in line.lower() for keyword in ['jan', 'feb', 'mar', 'apr', 'may', 'jun',
-                                                          'jul', 'aug', 'sep', 'oct', 'nov', 'dec',
-                                                          '20', '19', 'present', 'current', '-']):
-                if not duration:  # Only take the first date-like line
-                    duration = line
-                else:
-                    description_lines.append(line)
-            else:
-                description_lines.append(line)
+        if entry['company']:
+            elements.append(Paragraph(entry['company'], self.styles['Organization']))
         
         # Duration
-        if duration:
-            elements.append(Paragraph(duration, self.styles['DateStyle']))
+        if entry['period']:
+            elements.append(Paragraph(entry['period'], self.styles['DateStyle']))
         
         # Description
-        if description_lines:
-            description_text = ' '.join(description_lines)
-            elements.append(Paragraph(description_text, self.styles['Description']))
+        if entry['description']:
+            elements.append(Paragraph(entry['description'], self.styles['Description']))
         
         return elements
     
@@ -277,58 +258,25 @@ class TemplateGenerator:
     def _parse_education_entry(self, education_text):
         """Parse a single education entry"""
         elements = []
+        entry = parse_education(education_text)
         
-        # Split the education text into lines
-        lines = [line.strip() for line in education_text.split('\n') if line.strip()]
-        
-        if not lines:
+        if not any(entry.values()):
             return elements
         
-        # First line should contain degree/qualification
-        first_line = lines[0]
-        
-        # Try to parse degree and institution
-        if ' at ' in first_line:
-            parts = first_line.split(' at ', 1)
-            degree = parts[0].strip()
-            institution = parts[1].strip()
-        elif ' from ' in first_line:
-            parts = first_line.split(' from ', 1)
-            degree = parts[0].strip()
-            institution = parts[1].strip()
-        else:
-            degree = first_line
-            institution = ""
-        
         # Degree/Qualification
-        elements.append(Paragraph(degree, self.styles['JobTitle']))
+        elements.append(Paragraph(entry['degree'], self.styles['JobTitle']))
         
         # Institution
-        if institution:
-            elements.append(Paragraph(institution, self.styles['Organization']))
-        
-        # Look for year/duration and additional info
-        year_info = ""
-        additional_info = []
-        
-        for line in lines[1:]:
-            # Check if line looks like a year
-            if any(keyword in line for keyword in ['20', '19']) and len(line) < 20:
-                if not year_info:
-                    year_info = line
-                else:
-                    additional_info.append(line)
-            else:
-                additional_info.append(line)
+        if entry['institution']:
+            elements.append(Paragraph(entry['institution'], self.styles['Organization']))
         
         # Year
-        if year_info:
-            elements.append(Paragraph(year_info, self.styles['DateStyle']))
+        if entry['period']:
+            elements.append(Paragraph(entry['period'], self.styles['DateStyle']))
         
         # Additional info
-        if additional_info:
-            additional_text = ' '.join(additional_info)
-            elements.append(Paragraph(additional_text, self.styles['Description']))
+        if entry['description']:
+            elements.append(Paragraph(entry['description'], self.styles['Description']))
         
         return elements
     
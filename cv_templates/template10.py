@@ -16,6 +16,10 @@ from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT, TA_JUSTIFY
 from reportlab.platypus.flowables import Flowable
 from reportlab.graphics.shapes import Drawing, Circle, Line
 
+from .output import INVARIANT
+from .parsing import parse_education, parse_experience
+from .stylesheets import shared_stylesheet
+
 class TimelineFlowable(Flowable):
     """Custom flowable for timeline elements"""
     def __init__(self, width=10, height=10, color=colors.HexColor('#34495E')):
@@ -28,69 +32,77 @@ class TimelineFlowable(Flowable):
         self.canv.setFillColor(self.color)
         self.canv.circle(self.width/2, self.height/2, 3, fill=1)
 
+COLOR_SCHEMES = {
+    'blue': {
+        'primary': colors.HexColor('#34495E'),
+        'secondary': colors.HexColor('#2C3E50'),
+        'accent': colors.HexColor('#3498DB'),
+        'light': colors.HexColor('#ECF0F1'),
+        'sidebar': colors.HexColor('#F8F9FA')
+    },
+    'green': {
+        'primary': colors.HexColor('#27AE60'),
+        'secondary': colors.HexColor('#2E7D32'),
+        'accent': colors.HexColor('#4CAF50'),
+        'light': colors.HexColor('#E8F5E8'),
+        'sidebar': colors.HexColor('#F1F8E9')
+    },
+    'purple': {
+        'primary': colors.HexColor('#8E44AD'),
+        'secondary': colors.HexColor('#7B1FA2'),
+        'accent': colors.HexColor('#9C27B0'),
+        'light': colors.HexColor('#F3E5F5'),
+        'sidebar': colors.HexColor('#F8F5FA')
+    },
+    'red': {
+        'primary': colors.HexColor('#E74C3C'),
+        'secondary': colors.HexColor('#C62828'),
+        'accent': colors.HexColor('#F44336'),
+        'light': colors.HexColor('#FFEBEE'),
+        'sidebar': colors.HexColor('#FCF8F8')
+    },
+    'orange': {
+        'primary': colors.HexColor('#E67E22'),
+        'secondary': colors.HexColor('#D84315'),
+        'accent': colors.HexColor('#FF5722'),
+        'light': colors.HexColor('#FFF3E0'),
+        'sidebar': colors.HexColor('#FDF7F0')
+    },
+    'navy': {
+        'primary': colors.HexColor('#2C3E50'),
+        'secondary': colors.HexColor('#1A252F'),
+        'accent': colors.HexColor('#34495E'),
+        'light': colors.HexColor('#EAEDED'),
+        'sidebar': colors.HexColor('#F4F6F6')
+    }
+}
+
+
 class TemplateGenerator:
+    color_schemes = COLOR_SCHEMES
+    
     def __init__(self):
-        self.styles = getSampleStyleSheet()
-        self.color_schemes = {
-            'blue': {
-                'primary': colors.HexColor('#34495E'),
-                'secondary': colors.HexColor('#2C3E50'),
-                'accent': colors.HexColor('#3498DB'),
-                'light': colors.HexColor('#ECF0F1'),
-                'sidebar': colors.HexColor('#F8F9FA')
-            },
-            'green': {
-                'primary': colors.HexColor('#27AE60'),
-                'secondary': colors.HexColor('#2E7D32'),
-                'accent': colors.HexColor('#4CAF50'),
-                'light': colors.HexColor('#E8F5E8'),
-                'sidebar': colors.HexColor('#F1F8E9')
-            },
-            'purple': {
-                'primary': colors.HexColor('#8E44AD'),
-                'secondary': colors.HexColor('#7B1FA2'),
-                'accent': colors.HexColor('#9C27B0'),
-                'light': colors.HexColor('#F3E5F5'),
-                'sidebar': colors.HexColor('#F8F5FA')
-            },
-            'red': {
-                'primary': colors.HexColor('#E74C3C'),
-                'secondary': colors.HexColor('#C62828'),
-                'accent': colors.HexColor('#F44336'),
-                'light': colors.HexColor('#FFEBEE'),
-                'sidebar': colors.HexColor('#FCF8F8')
-            },
-            'orange': {
-                'primary': colors.HexColor('#E67E22'),
-                'secondary': colors.HexColor('#D84315'),
-                'accent': colors.HexColor('#FF5722'),
-                'light': colors.HexColor('#FFF3E0'),
-                'sidebar': colors.HexColor('#FDF7F0')
-            },
-            'navy': {
-                'primary': colors.HexColor('#2C3E50'),
-                'secondary': colors.HexColor('#1A252F'),
-                'accent': colors.HexColor('#34495E'),
-                'light': colors.HexColor('#EAEDED'),
-                'sidebar': colors.HexColor('#F4F6F6')
-            }
-        }
-        self.current_colors = self.color_schemes['blue']  # Default
-        self.setup_custom_styles()
+        self.set_color_scheme('blue')
         
     def set_color_scheme(self, scheme_name):
         """Set color scheme for the template"""
         if scheme_name in self.color_schemes:
-            self.current_colors = self.color_schemes[scheme_name]
-            self.setup_custom_styles()  # Refresh styles with new colors
+            self.load_styles(scheme_name)
+    
+    def load_styles(self, color_scheme='blue'):
+        """Use the shared stylesheet for a colour scheme, building it on first use"""
+        if color_scheme not in self.color_schemes:
+            color_scheme = 'blue'
+        self.current_colors = self.color_schemes[color_scheme]
+        self.styles = shared_stylesheet(__name__, color_scheme, self._build_styles)
+    
+    def _build_styles(self):
+        self.styles = getSampleStyleSheet()
+        self.setup_custom_styles()
+        return self.styles
         
     def setup_custom_styles(self):
         """Setup professional two-column styles"""
-        # Clear existing styles to prevent conflicts
-        style_names = ['HeaderName', 'ContactInfo', 'SectionHeading', 'JobTitle', 'Organization', 'DateStyle', 'Description']
-        for style_name in style_names:
-            if style_name in self.styles.byName:
-                del self.styles.byName[style_name]
         # Header name style
         self.styles.add(ParagraphStyle(
             name='HeaderName',
@@ -231,8 +243,8 @@ class TemplateGenerator:
     def generate(self, cv_data, filepath, color_scheme='blue'):
         """Generate two-column CV"""
         try:
-            # Set color scheme
-            self.set_color_scheme(color_scheme)
+            # Set color scheme (unknown names fall back to blue)
+            self.load_styles(color_scheme)
             
             doc = SimpleDocTemplate(
                 filepath,
@@ -240,7 +252,8 @@ class TemplateGenerator:
                 rightMargin=15*mm,
                 leftMargin=15*mm,
                 topMargin=20*mm,
-                bottomMargin=20*mm
+                bottomMargin=20*mm,
+                invariant=INVARIANT
             )
             
             story = []
@@ -264,7 +277,6 @@ class TemplateGenerator:
             
             story.append(layout_table)
             doc.build(story)
-            logging.info(f"Template10 CV generated: {filepath}")
             return True
             
         except Exception as e:
@@ -376,26 +388,13 @@ class TemplateGenerator:
     def _parse_experience_entry(self, experience_text):
         """Parse experience entry with timeline design"""
         elements = []
-        lines = [line.strip() for line in experience_text.split('\n') if line.strip()]
+        entry = parse_experience(experience_text)
         
-        if not lines:
+        if not any(entry.values()):
             return elements
         
-        # Parse first line for company and position
-        first_line = lines[0]
-        company = ""
-        position = ""
-        
-        if ' at ' in first_line:
-            parts = first_line.split(' at ', 1)
-            position = parts[0].strip()
-            company = parts[1].strip()
-        elif ' - ' in first_line:
-            parts = first_line.split(' - ', 1)
-            company = parts[0].strip()
-            position = parts[1].strip()
-        else:
-            company = first_line
+        company = entry['company']
+        position = entry['title']
         
         # Create timeline entry with circle and content
         timeline_data = []
@@ -409,13 +408,8 @@ class TemplateGenerator:
         if position:
             content_cell.append(Paragraph(position, self.styles['PositionTitle']))
         
-        # Find date in subsequent lines
-        date_found = False
-        for i, line in enumerate(lines[1:], 1):
-            if any(keyword in line.lower() for keyword in ['20', '19', 'present', 'current', '-']) and len(line) < 30:
-                content_cell.append(Paragraph(line, self.styles['DateRange']))
-                date_found = True
-                break
+        if entry['period']:
+            content_cell.append(Paragraph(entry['period'], self.styles['DateRange']))
         
         timeline_data.append([circle_cell, content_cell])
         
@@ -431,10 +425,8 @@ class TemplateGenerator:
         elements.append(timeline_table)
         
         # Add bullet points for responsibilities
-        start_idx = 2 if date_found else 1
-        for line in lines[start_idx:]:
-            if line and not any(keyword in line.lower() for keyword in ['20', '19', 'present', 'current']):
-                elements.append(Paragraph(f"• {line}", self.styles['BulletPoint']))
+        for line in entry['bullets']:
+            elements.append(Paragraph(f"• {line}", self.styles['BulletPoint']))
         
         elements.append(Spacer(1, 10))
         return elements
@@ -442,21 +434,13 @@ class TemplateGenerator:
     def _parse_education_entry(self, education_text):
         """Parse education entry"""
         elements = []
-        lines = [line.strip() for line in education_text.split('\n') if line.strip()]
+        entry = parse_education(education_text)
         
-        if not lines:
+        if not any(entry.values()):
             return elements
         
-        first_line = lines[0]
-        degree = ""
-        school = ""
-        
-        if ' at ' in first_line or ' from ' in first_line:
-            parts = first_line.split(' at ' if ' at ' in first_line else ' from ', 1)
-            degree = parts[0].strip()
-            school = parts[1].strip()
-        else:
-            degree = first_line
+        degree = entry['degree']
+        school = entry['institution']
         
         # Create timeline entry for education
         timeline_data = []
@@ -468,11 +452,8 @@ class TemplateGenerator:
         if school:
             content_cell.append(Paragraph(school, self.styles['EducationSchool']))
         
-        # Find date
-        for line in lines[1:]:
-            if any(keyword in line for keyword in ['20', '19']) and len(line) < 20:
-                content_cell.append(Paragraph(line, self.styles['DateRange']))
-                break
+        if entry['period']:
+            content_cell.append(Paragraph(entry['period'], self.styles['DateRange']))
         
         timeline_data.append([circle_cell, content_cell])
         
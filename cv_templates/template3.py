@@ -13,58 +13,77 @@ from reportlab.lib.units import inch, mm, cm
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT, TA_JUSTIFY
 
+from .output import INVARIANT
+from .parsing import parse_education, parse_experience
+from .stylesheets import shared_stylesheet
+
+COLOR_SCHEMES = {
+    'blue': {
+        'primary': colors.HexColor('#1F2937'),
+        'accent': colors.HexColor('#3B82F6'),
+        'secondary': colors.HexColor('#6B7280'),
+        'light_blue': colors.HexColor('#EFF6FF'),
+        'border': colors.HexColor('#E5E7EB')
+    },
+    'green': {
+        'primary': colors.HexColor('#1F2937'),
+        'accent': colors.HexColor('#10B981'),
+        'secondary': colors.HexColor('#6B7280'),
+        'light_blue': colors.HexColor('#ECFDF5'),
+        'border': colors.HexColor('#E5E7EB')
+    },
+    'red': {
+        'primary': colors.HexColor('#1F2937'),
+        'accent': colors.HexColor('#EF4444'),
+        'secondary': colors.HexColor('#6B7280'),
+        'light_blue': colors.HexColor('#FEF2F2'),
+        'border': colors.HexColor('#E5E7EB')
+    },
+    'purple': {
+        'primary': colors.HexColor('#1F2937'),
+        'accent': colors.HexColor('#8B5CF6'),
+        'secondary': colors.HexColor('#6B7280'),
+        'light_blue': colors.HexColor('#F5F3FF'),
+        'border': colors.HexColor('#E5E7EB')
+    },
+    'orange': {
+        'primary': colors.HexColor('#1F2937'),
+        'accent': colors.HexColor('#F59E0B'),
+        'secondary': colors.HexColor('#6B7280'),
+        'light_blue': colors.HexColor('#FFFBEB'),
+        'border': colors.HexColor('#E5E7EB')
+    },
+    'navy': {
+        'primary': colors.HexColor('#1F2937'),
+        'accent': colors.HexColor('#1E40AF'),
+        'secondary': colors.HexColor('#6B7280'),
+        'light_blue': colors.HexColor('#EFF6FF'),
+        'border': colors.HexColor('#E5E7EB')
+    }
+}
+
+
 class TemplateGenerator:
+    color_schemes = COLOR_SCHEMES
+    
     def __init__(self):
+        self.styles = None
+        self.colors = None
+    
+    def load_styles(self, color_scheme='blue'):
+        """Use the shared stylesheet for a colour scheme, building it on first use"""
+        if color_scheme not in self.color_schemes:
+            color_scheme = 'blue'
+        self.colors = self.color_schemes[color_scheme]
+        self.styles = shared_stylesheet(__name__, color_scheme, self._build_styles)
+    
+    def _build_styles(self):
         self.styles = getSampleStyleSheet()
-        self.color_schemes = {
-            'blue': {
-                'primary': colors.HexColor('#1F2937'),
-                'accent': colors.HexColor('#3B82F6'),
-                'secondary': colors.HexColor('#6B7280'),
-                'light_blue': colors.HexColor('#EFF6FF'),
-                'border': colors.HexColor('#E5E7EB')
-            },
-            'green': {
-                'primary': colors.HexColor('#1F2937'),
-                'accent': colors.HexColor('#10B981'),
-                'secondary': colors.HexColor('#6B7280'),
-                'light_blue': colors.HexColor('#ECFDF5'),
-                'border': colors.HexColor('#E5E7EB')
-            },
-            'red': {
-                'primary': colors.HexColor('#1F2937'),
-                'accent': colors.HexColor('#EF4444'),
-                'secondary': colors.HexColor('#6B7280'),
-                'light_blue': colors.HexColor('#FEF2F2'),
-                'border': colors.HexColor('#E5E7EB')
-            },
-            'purple': {
-                'primary': colors.HexColor('#1F2937'),
-                'accent': colors.HexColor('#8B5CF6'),
-                'secondary': colors.HexColor('#6B7280'),
-                'light_blue': colors.HexColor('#F5F3FF'),
-                'border': colors.HexColor('#E5E7EB')
-            },
-            'orange': {
-                'primary': colors.HexColor('#1F2937'),
-                'accent': colors.HexColor('#F59E0B'),
-                'secondary': colors.HexColor('#6B7280'),
-                'light_blue': colors.HexColor('#FFFBEB'),
-                'border': colors.HexColor('#E5E7EB')
-            },
-            'navy': {
-                'primary': colors.HexColor('#1F2937'),
-                'accent': colors.HexColor('#1E40AF'),
-                'secondary': colors.HexColor('#6B7280'),
-                'light_blue': colors.HexColor('#EFF6FF'),
-                'border': colors.HexColor('#E5E7EB')
-            }
-        }
-        
-    def setup_custom_styles(self, color_scheme='blue'):
+        self.setup_custom_styles()
+        return self.styles
+    
+    def setup_custom_styles(self):
         """Setup contemporary styles with clean typography"""
-        self.colors = self.color_schemes.get(color_scheme, self.color_schemes['blue'])
-        
         # Contemporary name style
         self.styles.add(ParagraphStyle(
             name='ContemporaryName',
@@ -199,7 +218,7 @@ class TemplateGenerator:
     def generate(self, cv_data, filepath, color_scheme='blue'):
         """Generate contemporary CV"""
         try:
-            self.setup_custom_styles(color_scheme)
+            self.load_styles(color_scheme)
             
             # Create PDF document
             doc = SimpleDocTemplate(
@@ -208,7 +227,8 @@ class TemplateGenerator:
                 rightMargin=50,
                 leftMargin=50,
                 topMargin=50,
-                bottomMargin=50
+                bottomMargin=50,
+                invariant=INVARIANT
             )
             
             story = []
@@ -238,7 +258,6 @@ class TemplateGenerator:
                 story.extend(self._create_skills_section(cv_data['skills']))
             
             doc.build(story)
-            logging.info(f"Contemporary CV generated: {filepath}")
             return True
             
         except Exception as e:
@@ -306,31 +325,20 @@ class TemplateGenerator:
         content = []
         
         try:
-            if isinstance(experience_text, dict):
-                job_title = experience_text.get('title', 'Position')
-                company = experience_text.get('company', 'Company')
-                period = experience_text.get('period', 'Period')
-                description = experience_text.get('description', '')
-            else:
-                lines = str(experience_text).strip().split('\n')
-                job_title = lines[0] if len(lines) > 0 else 'Position'
-                company = lines[1] if len(lines) > 1 else 'Company'
-                period = lines[2] if len(lines) > 2 else 'Period'
-                description = '\n'.join(lines[3:]) if len(lines) > 3 else ''
+            entry = parse_experience(experience_text)
             
-            content.append(Paragraph(job_title, self.styles['PositionTitle']))
-            content.append(Paragraph(company, self.styles['CompanyName']))
-            content.append(Paragraph(period, self.styles['DateRange']))
+            content.append(Paragraph(entry['title'], self.styles['PositionTitle']))
+            if entry['company']:
+                content.append(Paragraph(entry['company'], self.styles['CompanyName']))
+            if entry['period']:
+                content.append(Paragraph(entry['period'], self.styles['DateRange']))
             
-            if description:
-                # Format as bullet points if multiple lines
-                if '\n' in description or '•' in description:
-                    desc_lines = description.replace('•', '').split('\n')
-                    for line in desc_lines:
-                        if line.strip():
-                            content.append(Paragraph(f"• {line.strip()}", self.styles['Description']))
-                else:
-                    content.append(Paragraph(description, self.styles['Description']))
+            # Format as bullet points if multiple lines
+            if len(entry['bullets']) > 1:
+                for line in entry['bullets']:
+                    content.append(Paragraph(f"• {line}", self.styles['Description']))
+            elif entry['description']:
+                content.append(Paragraph(entry['description'], self.styles['Description']))
             
             content.append(Spacer(1, 8))
             
@@ -361,24 +369,16 @@ class TemplateGenerator:
         content = []
         
         try:
-            if isinstance(education_text, dict):
-                degree = education_text.get('degree', 'Degree')
-                institution = education_text.get('institution', 'Institution')
-                period = education_text.get('period', 'Period')
-                description = education_text.get('description', '')
-            else:
-                lines = str(education_text).strip().split('\n')
-                degree = lines[0] if len(lines) > 0 else 'Degree'
-                institution = lines[1] if len(lines) > 1 else 'Institution'
-                period = lines[2] if len(lines) > 2 else 'Period'
-                description = '\n'.join(lines[3:]) if len(lines) > 3 else ''
+            entry = parse_education(education_text)
             
-            content.append(Paragraph(degree, self.styles['PositionTitle']))
-            content.append(Paragraph(institution, self.styles['CompanyName']))
-            content.append(Paragraph(period, self.styles['DateRange']))
+            content.append(Paragraph(entry['degree'], self.styles['PositionTitle']))
+            if entry['institution']:
+                content.append(Paragraph(entry['institution'], self.styles['CompanyName']))
+            if entry['period']:
+                content.append(Paragraph(entry['period'], self.styles['DateRange']))
             
-            if description:
-                content.append(Paragraph(description, self.styles['Description']))
+            if entry['description']:
+                content.append(Paragraph(entry['description'], self.styles['Description']))
             
             content.append(Spacer(1, 8))
             
@@ -13,11 +13,23 @@ from reportlab.lib.units import inch, mm, cm
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT, TA_JUSTIFY
 
+from .output import INVARIANT
+from .parsing import parse_education, parse_experience
+from .stylesheets import shared_stylesheet
+
 class TemplateGenerator:
     def __init__(self):
+        self.load_styles()
+    
+    def load_styles(self, color_scheme=None):
+        """Use the shared stylesheet for this template, building it on first use"""
+        self.styles = shared_stylesheet(__name__, None, self._build_styles)
+    
+    def _build_styles(self):
         self.styles = getSampleStyleSheet()
         self.setup_custom_styles()
-        
+        return self.styles
+    
     def setup_custom_styles(self):
         """Setup minimal custom styles"""
         # Simple name style
@@ -105,7 +117,8 @@ class TemplateGenerator:
                 rightMargin=30*mm,
                 leftMargin=30*mm,
                 topMargin=25*mm,
-                bottomMargin=25*mm
+                bottomMargin=25*mm,
+                invariant=INVARIANT
             )
             
             story = []
@@ -130,7 +143,6 @@ class TemplateGenerator:
                 story.extend(self._create_skills_section(cv_data['skills']))
             
             doc.build(story)
-            logging.info(f"Template4 CV generated: {filepath}")
             return True
             
         except Exception as e:
@@ -185,32 +197,20 @@ class TemplateGenerator:
     def _parse_experience_entry(self, experience_text):
         """Parse experience with minimal formatting"""
         elements = []
-        lines = [line.strip() for line in experience_text.split('\n') if line.strip()]
+        entry = parse_experience(experience_text)
         
-        if not lines:
+        if not any(entry.values()):
             return elements
         
-        first_line = lines[0]
-        if ' at ' in first_line:
-            parts = first_line.split(' at ', 1)
-            job_title = parts[0].strip()
-            company = parts[1].strip()
-        else:
-            job_title = first_line
-            company = ""
-        
-        elements.append(Paragraph(job_title, self.styles['JobTitle']))
-        if company:
-            elements.append(Paragraph(company, self.styles['Organization']))
-        
-        # Find duration and description
-        for line in lines[1:]:
-            if any(keyword in line.lower() for keyword in ['jan', 'feb', 'mar', 'apr', 'may', 'jun',
-                                                          'jul', 'aug', 'sep', 'oct', 'nov', 'dec',
-                                                          '20', '19', 'present', 'current', '-']):
-                elements.append(Paragraph(line, self.styles['DateStyle']))
-            else:
-                elements.append(Paragraph(line, self.styles['Description']))
+        elements.append(Paragraph(entry['title'], self.styles['JobTitle']))
+        if entry['company']:
+            elements.append(Paragraph(entry['company'], self.styles['Organization']))
+        
+        # Duration and description
+        if entry['period']:
+            elements.append(Paragraph(entry['period'], self.styles['DateStyle']))
+        for line in entry['bullets']:
+            elements.append(Paragraph(line, self.styles['Description']))
         
         return elements
     
@@ -221,7 +221,9 @@ class TemplateGenerator:
         elements.append(heading)
         
         for edu in education_list:
-            elements.append(Paragraph(edu, self.styles['Description']))
+            entry = parse_education(edu)
+            parts = [entry['degree'], entry['institution'], entry['period'], entry['description']]
+            elements.append(Paragraph(', '.join(part for part in parts if part), self.styles['Description']))
         
         return elements
     
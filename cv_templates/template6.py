@@ -13,58 +13,77 @@ from reportlab.lib.units import inch, mm, cm
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT, TA_JUSTIFY
 
+from .output import INVARIANT
+from .parsing import parse_education, parse_experience
+from .stylesheets import shared_stylesheet
+
+COLOR_SCHEMES = {
+    'blue': {
+        'sidebar': colors.HexColor('#2C3E50'),
+        'accent': colors.HexColor('#3498DB'),
+        'text_light': colors.white,
+        'text_dark': colors.HexColor('#2C3E50'),
+        'main_bg': colors.white
+    },
+    'green': {
+        'sidebar': colors.HexColor('#27AE60'),
+        'accent': colors.HexColor('#2ECC71'),
+        'text_light': colors.white,
+        'text_dark': colors.HexColor('#27AE60'),
+        'main_bg': colors.white
+    },
+    'red': {
+        'sidebar': colors.HexColor('#C0392B'),
+        'accent': colors.HexColor('#E74C3C'),
+        'text_light': colors.white,
+        'text_dark': colors.HexColor('#C0392B'),
+        'main_bg': colors.white
+    },
+    'purple': {
+        'sidebar': colors.HexColor('#7D3C98'),
+        'accent': colors.HexColor('#9B59B6'),
+        'text_light': colors.white,
+        'text_dark': colors.HexColor('#7D3C98'),
+        'main_bg': colors.white
+    },
+    'orange': {
+        'sidebar': colors.HexColor('#D35400'),
+        'accent': colors.HexColor('#E67E22'),
+        'text_light': colors.white,
+        'text_dark': colors.HexColor('#D35400'),
+        'main_bg': colors.white
+    },
+    'navy': {
+        'sidebar': colors.HexColor('#2C3E50'),
+        'accent': colors.HexColor('#34495E'),
+        'text_light': colors.white,
+        'text_dark': colors.HexColor('#2C3E50'),
+        'main_bg': colors.white
+    }
+}
+
+
 class TemplateGenerator:
+    color_schemes = COLOR_SCHEMES
+    
     def __init__(self):
+        self.styles = None
+        self.colors = None
+    
+    def load_styles(self, color_scheme='blue'):
+        """Use the shared stylesheet for a colour scheme, building it on first use"""
+        if color_scheme not in self.color_schemes:
+            color_scheme = 'blue'
+        self.colors = self.color_schemes[color_scheme]
+        self.styles = shared_stylesheet(__name__, color_scheme, self._build_styles)
+    
+    def _build_styles(self):
         self.styles = getSampleStyleSheet()
-        self.color_schemes = {
-            'blue': {
-                'sidebar': colors.HexColor('#2C3E50'),
-                'accent': colors.HexColor('#3498DB'),
-                'text_light': colors.white,
-                'text_dark': colors.HexColor('#2C3E50'),
-                'main_bg': colors.white
-            },
-            'green': {
-                'sidebar': colors.HexColor('#27AE60'),
-                'accent': colors.HexColor('#2ECC71'),
-                'text_light': colors.white,
-                'text_dark': colors.HexColor('#27AE60'),
-                'main_bg': colors.white
-            },
-            'red': {
-                'sidebar': colors.HexColor('#C0392B'),
-                'accent': colors.HexColor('#E74C3C'),
-                'text_light': colors.white,
-                'text_dark': colors.HexColor('#C0392B'),
-                'main_bg': colors.white
-            },
-            'purple': {
-                'sidebar': colors.HexColor('#7D3C98'),
-                'accent': colors.HexColor('#9B59B6'),
-                'text_light': colors.white,
-                'text_dark': colors.HexColor('#7D3C98'),
-                'main_bg': colors.white
-            },
-            'orange': {
-                'sidebar': colors.HexColor('#D35400'),
-                'accent': colors.HexColor('#E67E22'),
-                'text_light': colors.white,
-                'text_dark': colors.HexColor('#D35400'),
-                'main_bg': colors.white
-            },
-            'navy': {
-                'sidebar': colors.HexColor('#2C3E50'),
-                'accent': colors.HexColor('#34495E'),
-                'text_light': colors.white,
-                'text_dark': colors.HexColor('#2C3E50'),
-                'main_bg': colors.white
-            }
-        }
-        
-    def setup_custom_styles(self, color_scheme='blue'):
+        self.setup_custom_styles()
+        return self.styles
+    
+    def setup_custom_styles(self):
         """Setup sidebar CV styles with dynamic colors"""
-        self.colors = self.color_schemes.get(color_scheme, self.color_schemes['blue'])
-        
         # Sidebar styles (white text on dark background)
         self.styles.add(ParagraphStyle(
             name='SidebarName',
@@ -177,7 +196,7 @@ class TemplateGenerator:
     def generate(self, cv_data, filepath, color_scheme='blue'):
         """Generate sidebar CV with dark left sidebar and white right main area"""
         try:
-            self.setup_custom_styles(color_scheme)
+            self.load_styles(color_scheme)
             
             # Create PDF document
             doc = SimpleDocTemplate(
@@ -186,7 +205,8 @@ class TemplateGenerator:
                 rightMargin=0,
                 leftMargin=0,
                 topMargin=0,
-                bottomMargin=0
+                bottomMargin=0,
+                invariant=INVARIANT
             )
             
             story = []
@@ -221,7 +241,6 @@ class TemplateGenerator:
             story.append(table)
             doc.build(story)
             
-            logging.info(f"Sidebar CV generated: {filepath}")
             return True
             
         except Exception as e:
@@ -320,30 +339,20 @@ class TemplateGenerator:
         content = []
         
         try:
-            if isinstance(experience_text, dict):
-                job_title = experience_text.get('title', 'Position')
-                company = experience_text.get('company', 'Company')
-                period = experience_text.get('period', 'Period')
-                description = experience_text.get('description', '')
-            else:
-                lines = str(experience_text).strip().split('\n')
-                job_title = lines[0] if len(lines) > 0 else 'Position'
-                company = lines[1] if len(lines) > 1 else 'Company'
-                period = lines[2] if len(lines) > 2 else 'Period'
-                description = '\n'.join(lines[3:]) if len(lines) > 3 else ''
+            entry = parse_experience(experience_text)
             
-            content.append(Paragraph(job_title, self.styles['JobTitle']))
-            content.append(Paragraph(company, self.styles['Organization']))
-            content.append(Paragraph(period, self.styles['DateRange']))
+            content.append(Paragraph(entry['title'], self.styles['JobTitle']))
+            if entry['company']:
+                content.append(Paragraph(entry['company'], self.styles['Organization']))
+            if entry['period']:
+                content.append(Paragraph(entry['period'], self.styles['DateRange']))
             
-            if description:
-                if '\n' in description or '•' in description:
-                    desc_lines = description.replace('•', '').split('\n')
-                    for line in desc_lines:
-                        if line.strip():
-                            content.append(Paragraph(f"• {line.strip()}", self.styles['Description']))
-                else:
-                    content.append(Paragraph(description, self.styles['Description']))
+            # Format as bullet points if multiple lines
+            if len(entry['bullets']) > 1:
+                for line in entry['bullets']:
+                    content.append(Paragraph(f"• {line}", self.styles['Description']))
+            elif entry['description']:
+                content.append(Paragraph(entry['description'], self.styles['Description']))
             
             content.append(Spacer(1, 8))
             
@@ -374,24 +383,16 @@ class TemplateGenerator:
         content = []
         
         try:
-            if isinstance(education_text, dict):
-                degree = education_text.get('degree', 'Degree')
-                institution = education_text.get('institution', 'Institution')
-                period = education_text.get('period', 'Period')
-                description = education_text.get('description', '')
-            else:
-                lines = str(education_text).strip().split('\n')
-                degree = lines[0] if len(lines) > 0 else 'Degree'
-                institution = lines[1] if len(lines) > 1 else 'Institution'
-                period = lines[2] if len(lines) > 2 else 'Period'
-                description = '\n'.join(lines[3:]) if len(lines) > 3 else ''
+            entry = parse_education(education_text)
             
-            content.append(Paragraph(degree, self.styles['JobTitle']))
-            content.append(Paragraph(institution, self.styles['Organization']))
-            content.append(Paragraph(period, self.styles['DateRange']))
+            content.append(Paragraph(entry['degree'], self.styles['JobTitle']))
+            if entry['institution']:
+                content.append(Paragraph(entry['institution'], self.styles['Organization']))
+            if entry['period']:
+                content.append(Paragraph(entry['period'], self.styles['DateRange']))
             
-            if description:
-                content.append(Paragraph(description, self.styles['Description']))
+            if entry['description']:
+                content.append(Paragraph(entry['description'], self.styles['Description']))
             
             content.append(Spacer(1, 8))
             
@@ -13,11 +13,23 @@ from reportlab.lib.units import inch, mm, cm
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT, TA_JUSTIFY
 
+from .output import INVARIANT
+from .parsing import parse_education, parse_experience
+from .stylesheets import shared_stylesheet
+
 class TemplateGenerator:
     def __init__(self):
+        self.load_styles()
+    
+    def load_styles(self, color_scheme=None):
+        """Use the shared stylesheet for this template, building it on first use"""
+        self.styles = shared_stylesheet(__name__, None, self._build_styles)
+    
+    def _build_styles(self):
         self.styles = getSampleStyleSheet()
         self.setup_custom_styles()
-        
+        return self.styles
+    
     def setup_custom_styles(self):
         """Setup academic-focused styles"""
         # Academic header
@@ -118,7 +130,8 @@ class TemplateGenerator:
                 rightMargin=25*mm,
                 leftMargin=25*mm,
                 topMargin=25*mm,
-                bottomMargin=25*mm
+                bottomMargin=25*mm,
+                invariant=INVARIANT
             )
             
             story = []
@@ -143,7 +156,6 @@ class TemplateGenerator:
                 story.extend(self._create_skills_section(cv_data['skills']))
             
             doc.build(story)
-            logging.info(f"Template7 CV generated: {filepath}")
             return True
             
         except Exception as e:
@@ -213,31 +225,16 @@ class TemplateGenerator:
     def _parse_experience_entry(self, experience_text):
         """Parse academic position entry"""
         elements = []
-        lines = [line.strip() for line in experience_text.split('\n') if line.strip()]
+        entry = parse_experience(experience_text)
         
-        if not lines:
+        if not any(entry.values()):
             return elements
         
-        first_line = lines[0]
-        if ' at ' in first_line:
-            parts = first_line.split(' at ', 1)
-            position = parts[0].strip()
-            institution = parts[1].strip()
-        else:
-            position = first_line
-            institution = ""
+        position = entry['title']
+        institution = entry['company']
         
         # Create table for position and dates
-        position_data = []
-        dates = ""
-        
-        # Find dates in subsequent lines
-        for line in lines[1:]:
-            if any(keyword in line.lower() for keyword in ['jan', 'feb', 'mar', 'apr', 'may', 'jun',
-                                                          'jul', 'aug', 'sep', 'oct', 'nov', 'dec',
-                                                          '20', '19', 'present', 'current', '-']):
-                dates = line
-                break
+        dates = entry['period']
         
         if dates:
             position_table = Table([[position, dates]], colWidths=[12*cm, 5*cm])
@@ -263,7 +260,7 @@ class TemplateGenerator:
             elements.append(Paragraph(institution, self.styles['Institution']))
         
         # Add description if any
-        description_lines = [line for line in lines[1:] if not any(keyword in line.lower() for keyword in ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec', '20', '19', 'present', 'current', '-'])]
+        description_lines = entry['bullets']
         
         if description_lines:
             description_text = ' '.join(description_lines)
@@ -292,26 +289,14 @@ class TemplateGenerator:
     def _parse_education_entry(self, education_text):
         """Parse academic education entry"""
         elements = []
-        lines = [line.strip() for line in education_text.split('\n') if line.strip()]
+        entry = parse_education(education_text)
         
-        if not lines:
+        if not any(entry.values()):
             return elements
         
-        first_line = lines[0]
-        if ' at ' in first_line or ' from ' in first_line:
-            parts = first_line.split(' at ' if ' at ' in first_line else ' from ', 1)
-            degree = parts[0].strip()
-            institution = parts[1].strip()
-        else:
-            degree = first_line
-            institution = ""
-        
-        # Find year
-        year = ""
-        for line in lines[1:]:
-            if any(keyword in line for keyword in ['20', '19']) and len(line) < 20:
-                year = line
-                break
+        degree = entry['degree']
+        institution = entry['institution']
+        year = entry['period']
         
         if year:
             edu_table = Table([[degree, year]], colWidths=[12*cm, 5*cm])
@@ -14,11 +14,23 @@ from reportlab.lib.units import inch, mm, cm
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT, TA_JUSTIFY
 
+from .output import INVARIANT
+from .parsing import parse_education, parse_experience
+from .stylesheets import shared_stylesheet
+
 class TemplateGenerator:
     def __init__(self):
+        self.load_styles()
+    
+    def load_styles(self, color_scheme=None):
+        """Use the shared stylesheet for this template, building it on first use"""
+        self.styles = shared_stylesheet(__name__, None, self._build_styles)
+    
+    def _build_styles(self):
         self.styles = getSampleStyleSheet()
         self.setup_custom_styles()
-        
+        return self.styles
+    
     def setup_custom_styles(self):
         """Setup professional sales-focused styles"""
         # Header name
@@ -173,7 +185,8 @@ class TemplateGenerator:
                 rightMargin=25*mm,
                 leftMargin=25*mm,
                 topMargin=25*mm,
-                bottomMargin=25*mm
+                bottomMargin=25*mm,
+                invariant=INVARIANT
             )
             
             story = []
@@ -203,7 +216,6 @@ class TemplateGenerator:
                 story.extend(self._create_languages_section(languages))
             
             doc.build(story)
-            logging.info(f"Template8 CV generated: {filepath}")
             return True
             
         except Exception as e:
@@ -272,22 +284,13 @@ class TemplateGenerator:
     def _parse_experience_entry(self, experience_text):
         """Parse experience entry"""
         elements = []
-        lines = [line.strip() for line in experience_text.split('\n') if line.strip()]
+        entry = parse_experience(experience_text)
         
-        if not lines:
+        if not any(entry.values()):
             return elements
         
-        # Parse first line for position and company
-        first_line = lines[0]
-        position = ""
-        company = ""
-        
-        if ' at ' in first_line:
-            parts = first_line.split(' at ', 1)
-            position = parts[0].strip()
-            company = parts[1].strip()
-        else:
-            position = first_line
+        position = entry['title']
+        company = entry['company']
         
         # Add position and company
         if position:
@@ -295,30 +298,24 @@ class TemplateGenerator:
         if company:
             elements.append(Paragraph(company, self.styles['CompanyName']))
         
-        # Find and add date range
-        date_line = None
-        for i, line in enumerate(lines[1:], 1):
-            if any(keyword in line.lower() for keyword in ['20', '19', 'present', 'current', '-']) and len(line) < 30:
-                date_line = line
-                elements.append(Paragraph(date_line, self.styles['DateRange']))
-                break
+        # Add date range
+        if entry['period']:
+            elements.append(Paragraph(entry['period'], self.styles['DateRange']))
         
         # Add bullet points and key achievements
-        start_idx = 2 if date_line else 1
         key_achievement = None
         
-        for line in lines[start_idx:]:
-            if line and not any(keyword in line.lower() for keyword in ['20', '19', 'present', 'current']):
-                # Check if this looks like a key achievement (contains numbers, percentages, etc.)
-                if any(indicator in line for indicator in ['$', '%', 'million', 'thousand', 'increased', 'achieved', 'over']):
-                    if not key_achievement:  # Only take the first key achievement
-                        key_achievement = line
-                        elements.append(Paragraph(f"Key Achievement", self.styles['KeyAchievement']))
-                        elements.append(Paragraph(line, self.styles['Summary']))
-                    else:
-                        elements.append(Paragraph(f"• {line}", self.styles['BulletPoint']))
+        for line in entry['bullets']:
+            # Check if this looks like a key achievement (contains numbers, percentages, etc.)
+            if any(indicator in line for indicator in ['$', '%', 'million', 'thousand', 'increased', 'achieved', 'over']):
+                if not key_achievement:  # Only take the first key achievement
+                    key_achievement = line
+                    elements.append(Paragraph(f"Key Achievement", self.styles['KeyAchievement']))
+                    elements.append(Paragraph(line, self.styles['Summary']))
                 else:
                     elements.append(Paragraph(f"• {line}", self.styles['BulletPoint']))
+            else:
+                elements.append(Paragraph(f"• {line}", self.styles['BulletPoint']))
         
         elements.append(Spacer(1, 8))
         return elements
@@ -338,21 +335,13 @@ class TemplateGenerator:
     def _parse_education_entry(self, education_text):
         """Parse education entry"""
         elements = []
-        lines = [line.strip() for line in education_text.split('\n') if line.strip()]
+        entry = parse_education(education_text)
         
-        if not lines:
+        if not any(entry.values()):
             return elements
         
-        first_line = lines[0]
-        degree = ""
-        school = ""
-        
-        if ' at ' in first_line or ' from ' in first_line:
-            parts = first_line.split(' at ' if ' at ' in first_line else ' from ', 1)
-            degree = parts[0].strip()
-            school = parts[1].strip()
-        else:
-            degree = first_line
+        degree = entry['degree']
+        school = entry['institution']
         
         if degree:
             elements.append(Paragraph(degree, self.styles['EducationDegree']))
@@ -360,11 +349,10 @@ class TemplateGenerator:
             elements.append(Paragraph(school, self.styles['EducationSchool']))
         
         # Add year and additional details
-        for line in lines[1:]:
-            if any(keyword in line for keyword in ['20', '19']) and len(line) < 20:
-                elements.append(Paragraph(line, self.styles['DateRange']))
-            elif line and not any(keyword in line for keyword in ['20', '19']):
-                elements.append(Paragraph(line, self.styles['Summary']))
+        if entry['period']:
+            elements.append(Paragraph(entry['period'], self.styles['DateRange']))
+        for line in entry['details']:
+            elements.append(Paragraph(line, self.styles['Summary']))
         
         elements.append(Spacer(1, 8))
         return elements
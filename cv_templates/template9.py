@@ -13,11 +13,23 @@ from reportlab.lib.units import inch, mm, cm
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT, TA_JUSTIFY
 
+from .output import INVARIANT
+from .parsing import parse_education, parse_experience
+from .stylesheets import shared_stylesheet
+
 class TemplateGenerator:
     def __init__(self):
+        self.load_styles()
+    
+    def load_styles(self, color_scheme=None):
+        """Use the shared stylesheet for this template, building it on first use"""
+        self.styles = shared_stylesheet(__name__, None, self._build_styles)
+    
+    def _build_styles(self):
         self.styles = getSampleStyleSheet()
         self.setup_custom_styles()
-        
+        return self.styles
+    
     def setup_custom_styles(self):
         """Setup finance-focused styles"""
         # Professional finance header
@@ -126,7 +138,8 @@ class TemplateGenerator:
                 rightMargin=20*mm,
                 leftMargin=20*mm,
                 topMargin=20*mm,
-                bottomMargin=20*mm
+                bottomMargin=20*mm,
+                invariant=INVARIANT
             )
             
             story = []
@@ -151,7 +164,6 @@ class TemplateGenerator:
                 story.extend(self._create_skills_section(cv_data['skills']))
             
             doc.build(story)
-            logging.info(f"Template9 CV generated: {filepath}")
             return True
             
         except Exception as e:
@@ -263,36 +275,28 @@ class TemplateGenerator:
     def _parse_experience_entry(self, experience_text):
         """Parse with financial achievements focus"""
         elements = []
-        lines = [line.strip() for line in experience_text.split('\n') if line.strip()]
+        entry = parse_experience(experience_text)
         
-        if not lines:
+        if not any(entry.values()):
             return elements
         
-        first_line = lines[0]
-        if ' at ' in first_line:
-            parts = first_line.split(' at ', 1)
-            position = parts[0].strip()
-            institution = parts[1].strip()
-        else:
-            position = first_line
-            institution = ""
+        position = entry['title']
+        institution = entry['company']
         
         elements.append(Paragraph(f"💼 {position}", self.styles['Position']))
         if institution:
             elements.append(Paragraph(institution, self.styles['Institution']))
         
+        # Date formatting
+        if entry['period']:
+            elements.append(Paragraph(f"📅 {entry['period']}", self.styles['Description']))
+        
         # Highlight financial achievements
-        for line in lines[1:]:
+        for line in entry['bullets']:
             # Check for financial metrics
             if any(indicator in line for indicator in ['$', '%', 'million', 'billion', 'thousand', 'ROI', 'profit', 'revenue', 'portfolio', 'assets']):
                 achievement_text = f"💰 {line}"
                 elements.append(Paragraph(achievement_text, self.styles['FinancialAchievement']))
-            elif any(keyword in line.lower() for keyword in ['jan', 'feb', 'mar', 'apr', 'may', 'jun',
-                                                            'jul', 'aug', 'sep', 'oct', 'nov', 'dec',
-                                                            '20', '19', 'present', 'current', '-']):
-                # Date formatting
-                date_text = f"📅 {line}"
-                elements.append(Paragraph(date_text, self.styles['Description']))
             else:
                 elements.append(Paragraph(f"• {line}", self.styles['Description']))
         
@@ -314,30 +318,23 @@ class TemplateGenerator:
     def _parse_education_entry(self, education_text):
         """Parse education with finance focus"""
         elements = []
-        lines = [line.strip() for line in education_text.split('\n') if line.strip()]
+        entry = parse_education(education_text)
         
-        if not lines:
+        if not any(entry.values()):
             return elements
         
-        first_line = lines[0]
-        if ' at ' in first_line or ' from ' in first_line:
-            parts = first_line.split(' at ' if ' at ' in first_line else ' from ', 1)
-            degree = parts[0].strip()
-            institution = parts[1].strip()
-        else:
-            degree = first_line
-            institution = ""
+        degree = entry['degree']
+        institution = entry['institution']
         
         elements.append(Paragraph(f"🎓 {degree}", self.styles['Position']))
         if institution:
             elements.append(Paragraph(institution, self.styles['Institution']))
         
         # Add additional details
-        for line in lines[1:]:
-            if any(keyword in line for keyword in ['20', '19']) and len(line) < 20:
-                elements.append(Paragraph(f"📅 {line}", self.styles['Description']))
-            else:
-                elements.append(Paragraph(line, self.styles['Description']))
+        if entry['period']:
+            elements.append(Paragraph(f"📅 {entry['period']}", self.styles['Description']))
+        for line in entry['details']:
+            elements.append(Paragraph(line, self.styles['Description']))
         
         elements.append(Spacer(1, 6))
         return elements
@@ -0,0 +1,120 @@
+"""
+Signed download URLs for generated CVs
+
+Twilio fetches WhatsApp media from a public URL, so finished CVs are served
+from /cv/<name>. The name is the CV's storage key (or, for CVs from before
+storage keys, its file path). Each link carries an expiry time and an
+HMAC-SHA256 signature over the name and that time, so links cannot be
+guessed or extended. Nothing is looked up in the database to check them.
+
+Files on local storage are streamed with Werkzeug's send_file. That answers
+If-None-Match and If-Modified-Since with 304 and serves Range requests, so
+Twilio's fetch and a user's repeat download cost little. With
+DOWNLOAD_OFFLOAD set, the front-end server sends the file instead:
+
+  x-sendfile        X-Sendfile header with the file's absolute path
+                    (Apache mod_xsendfile, lighttpd)
+  x-accel-redirect  X-Accel-Redirect to DOWNLOAD_ACCEL_PREFIX + key, which
+                    nginx maps to STORAGE_FOLDER in an internal location
+
+With S3 storage, the link redirects to a presigned URL, and the bucket
+handles conditional and range requests itself.
+"""
+
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import time
+from urllib.parse import quote, urlencode
+
+from flask import Response, abort, redirect, request
+from werkzeug.utils import send_file
+
+from storage import is_key, storage
+
+OFFLOAD_MODES = ('', 'x-sendfile', 'x-accel-redirect')
+
+
+class CVDownloads:
+    def __init__(self):
+        self.key = b''
+        self.ttl = 24 * 3600
+        self.base_url = None
+        self.offload = ''
+        self.accel_prefix = '/protected-cvs'
+
+    def init_app(self, app):
+        """Read the signing key, link lifetime and offload mode from the app config"""
+        self.key = (app.config['DOWNLOAD_SIGNING_KEY'] or app.secret_key).encode()
+        self.ttl = int(app.config['DOWNLOAD_URL_TTL_HOURS'] * 3600)
+        self.base_url = (app.config['PUBLIC_BASE_URL'] or '').rstrip('/') or None
+        self.accel_prefix = app.config['DOWNLOAD_ACCEL_PREFIX'].rstrip('/')
+
+        self.offload = (app.config['DOWNLOAD_OFFLOAD'] or '').lower()
+        if self.offload not in OFFLOAD_MODES:
+            logging.error(f"Unknown DOWNLOAD_OFFLOAD {self.offload!r}, serving files directly")
+            self.offload = ''
+
+    def url_for(self, name, ttl=None):
+        """Absolute signed URL for a stored CV, or None without PUBLIC_BASE_URL"""
+        if not self.base_url or not name:
+            return None
+
+        expires = int(time.time()) + (ttl or self.ttl)
+        query = urlencode({'expires': expires, 'signature': self.signature(name, expires)})
+        return f"{self.base_url}/cv/{quote(name)}?{query}"
+
+    def signature(self, name, expires):
+        digest = hmac.new(self.key, f'{name}\n{expires}'.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+    def verify(self, name, expires, signature):
+        """Whether a signature is valid for the name and has not expired"""
+        if not expires or not expires.isdigit() or int(expires) < time.time():
+            return False
+        return hmac.compare_digest(self.signature(name, int(expires)), signature or '')
+
+    def response(self, name):
+        """Serve a signed request for a CV, or abort with 403/404"""
+        expires = request.args.get('expires')
+        if not self.verify(name, expires, request.args.get('signature')):
+            abort(403)
+
+        # The link stops working at `expires`, so nothing should cache it for longer
+        return self.serve(name, max(0, int(expires) - int(time.time())))
+
+    def serve(self, name, max_age=0):
+        """Response with a stored CV, or abort with 404"""
+        if not storage.is_local and is_key(name):
+            return redirect(storage.presigned_url(name, max(max_age, 60)))
+
+        path = storage.local_path(name)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        download_name = os.path.basename(path)
+
+        if self.offload == 'x-accel-redirect' and is_key(name):
+            response = Response(mimetype='application/pdf')
+            response.headers['X-Accel-Redirect'] = f"{self.accel_prefix}/{quote(name)}"
+            response.headers['Content-Disposition'] = f"inline; filename*=UTF-8''{quote(download_name)}"
+        else:
+            response = send_file(
+                path,
+                request.environ,
+                mimetype='application/pdf',
+                download_name=download_name,
+                conditional=True,
+                etag=True,
+                max_age=max_age,
+                use_x_sendfile=self.offload == 'x-sendfile',
+            )
+
+        response.cache_control.public = None
+        response.cache_control.private = True
+        response.cache_control.max_age = max_age
+        return response
+
+
+cv_downloads = CVDownloads()
@@ -1,4 +1,11 @@
-from app import app
+def __getattr__(name):
+    # Spawned render workers re-import this module, so the app is only built when asked for
+    if name == 'app':
+        from app import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == '__main__':
+    from app import app
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,171 @@
+"""
+Downloads of inbound WhatsApp media
+
+Attachments arrive as URLs in the webhook (MediaUrl0 .. MediaUrl<NumMedia-1>,
+each with a MediaContentType). Fetching them inline with a bare
+requests.get could hold a webhook worker for as long as Twilio's media host
+took to answer. Every fetch now goes through one service:
+
+- one pooled requests.Session per process, retrying only connection errors
+  and 502/503/504 responses
+- separate connect and read timeouts, plus a deadline for the whole download
+- the body is streamed in chunks to a temp file under MEDIA_FOLDER, never
+  held in memory, and abandoned once it passes the byte cap
+- the declared content type is checked before anything is downloaded, and
+  the served one before the body is read
+
+With MEDIA_BACKGROUND set, slow work such as ingesting a photo runs in a
+small thread pool after the webhook has replied. Its result reaches the
+user as an outbound message.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+Attachment = namedtuple('Attachment', 'url content_type')
+
+
+class MediaError(Exception):
+    """Raised when an attachment cannot be downloaded or is not acceptable"""
+
+
+def attachments(form):
+    """Every media attachment in a Twilio webhook form, in order"""
+    count = form.get('NumMedia', '0')
+    count = int(count) if count.isdigit() else 0
+    found = []
+    for index in range(count):
+        url = form.get(f'MediaUrl{index}')
+        if url:
+            found.append(Attachment(url, form.get(f'MediaContentType{index}', '').lower()))
+    return found
+
+
+class MediaFetcher:
+    # Small enough that the deadline, checked between chunks, is not overshot by much
+    CHUNK_SIZE = 16 * 1024
+
+    def __init__(self):
+        self.app = None
+        self.folder = 'uploads/incoming'
+        self.max_bytes = 16 * 1024 * 1024
+        self.timeout = (3, 4)
+        self.deadline = 8
+        self.background = False
+        self.auth = None
+        self._session = requests.Session()
+        self._workers = None
+        self._lock = threading.Lock()
+        self._stats = {'fetched': 0, 'rejected': 0, 'failed': 0, 'bytes': 0}
+
+    def init_app(self, app):
+        """Create the pooled session, and the worker pool when MEDIA_BACKGROUND is set"""
+        self.app = app
+        self.folder = app.config['MEDIA_FOLDER']
+        self.max_bytes = app.config['MEDIA_MAX_BYTES']
+        self.timeout = (app.config['MEDIA_CONNECT_TIMEOUT'], app.config['MEDIA_READ_TIMEOUT'])
+        self.deadline = app.config['MEDIA_DOWNLOAD_DEADLINE']
+        self.background = app.config['MEDIA_BACKGROUND']
+        if app.config['TWILIO_ACCOUNT_SID'] and app.config['TWILIO_AUTH_TOKEN']:
+            # Twilio media URLs require HTTP basic auth when media protection is on
+            self.auth = (app.config['TWILIO_ACCOUNT_SID'], app.config['TWILIO_AUTH_TOKEN'])
+        os.makedirs(self.folder, exist_ok=True)
+
+        workers = app.config['MEDIA_WORKERS']
+        # One quick retry, so that retries fit inside the download deadline
+        retry = Retry(total=1, connect=1, read=0, status=1, backoff_factor=0.5,
+                      status_forcelist=(502, 503, 504), allowed_methods=('GET',),
+                      respect_retry_after_header=False)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(workers, 4), max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+        if self.background:
+            self._workers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media-fetch')
+
+    @contextmanager
+    def fetch(self, attachment, accept=('image/',), max_bytes=None):
+        """Download an attachment to a temp file and yield its path; the file is removed afterwards"""
+        path = os.path.join(self.folder, f'{uuid.uuid4().hex}.tmp')
+        try:
+            try:
+                size = self._download(attachment, accept, min(max_bytes or self.max_bytes, self.max_bytes), path)
+            except MediaError:
+                self._record('rejected')
+                raise
+            except (requests.RequestException, OSError) as e:
+                self._record('failed')
+                raise MediaError(f"download failed: {str(e)}")
+
+            self._record('fetched', size)
+            yield path
+        finally:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def submit(self, task, *args):
+        """Run a task in the media pool inside an app context, or here when MEDIA_BACKGROUND is off"""
+        if self._workers is None:
+            return task(*args)
+        self._workers.submit(self._run, task, *args)
+        return None
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _download(self, attachment, accept, max_bytes, path):
+        if attachment.content_type and not attachment.content_type.startswith(accept):
+            raise MediaError(f"unexpected content type {attachment.content_type}")
+
+        deadline = time.monotonic() + self.deadline
+        with self._session.get(attachment.url, stream=True, timeout=self.timeout, auth=self.auth) as response:
+            if response.status_code != 200:
+                raise MediaError(f"download returned HTTP {response.status_code}")
+
+            content_type = response.headers.get('Content-Type', '').lower()
+            if content_type and not content_type.startswith(accept):
+                raise MediaError(f"unexpected content type {content_type}")
+
+            length = response.headers.get('Content-Length')
+            if length and length.isdigit() and int(length) > max_bytes:
+                raise MediaError(f"attachment is {length} bytes, limit is {max_bytes}")
+
+            size = 0
+            with open(path, 'wb') as f:
+                for chunk in response.iter_content(self.CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise MediaError(f"attachment exceeds {max_bytes} bytes")
+                    if time.monotonic() > deadline:
+                        raise MediaError(f"download took longer than {self.deadline}s")
+                    f.write(chunk)
+        return size
+
+    def _record(self, outcome, size=0):
+        with self._lock:
+            self._stats[outcome] += 1
+            self._stats['bytes'] += size
+
+    def _run(self, task, *args):
+        try:
+            with self.app.app_context():
+                task(*args)
+        except Exception as e:
+            logging.error(f"Error in background media task: {str(e)}")
+
+
+media_fetcher = MediaFetcher()
@@ -0,0 +1,125 @@
+"""
+Webhook deduplication keyed on Twilio MessageSid
+
+Twilio retries a webhook delivery when we answer slowly. The reply to each
+MessageSid is stored in the same transaction as the state changes the
+message caused. A repeat delivery gets the stored reply back and never
+touches the conversation state machine. Deliveries for one phone number are
+serialised by the phone lock, so a retry only runs once the original has
+committed. Recent replies are kept in a bounded in-memory LRU. The
+processed_messages table shares them between workers and expires them
+after a TTL.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete
+
+from app import db
+from models import ProcessedMessage
+from unit_of_work import on_commit
+
+
+class MessageDeduplicator:
+    # Expired rows are purged after this many completed messages
+    PURGE_EVERY = 500
+
+    def __init__(self, max_entries=10000, ttl=timedelta(hours=24)):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._replies = OrderedDict()
+        self._lock = threading.Lock()
+        self._completed = 0
+
+    def init_app(self, app):
+        """Read cache settings from the app config"""
+        self.max_entries = app.config['DEDUP_CACHE_SIZE']
+        self.ttl = timedelta(hours=app.config['DEDUP_TTL_HOURS'])
+
+    def lookup(self, message_sid):
+        """Return the stored reply for an already processed message, or None"""
+        reply = self._get_cached(message_sid)
+        if reply is not None:
+            return reply
+
+        record = ProcessedMessage.query.filter_by(message_sid=message_sid).first()
+        if record is None:
+            return None
+        if record.created_at < datetime.utcnow() - self.ttl:
+            # Expired; the message will be processed and recorded again
+            db.session.delete(record)
+            db.session.flush()
+            return None
+
+        self._put_cached(message_sid, record.reply)
+        return record.reply
+
+    def record(self, message_sid, reply):
+        """Stage the reply for a message in the current unit of work"""
+        db.session.add(ProcessedMessage(
+            message_sid=message_sid,
+            reply=reply,
+            created_at=datetime.utcnow()
+        ))
+
+        on_commit(lambda: self._remember(message_sid, reply))
+
+    def _remember(self, message_sid, reply):
+        """Cache a committed reply and purge expired records now and then"""
+        self._put_cached(message_sid, reply)
+
+        with self._lock:
+            self._completed += 1
+            purge = self._completed % self.PURGE_EVERY == 0
+        if purge:
+            app = current_app._get_current_object()
+            threading.Thread(target=self._purge_in_background, args=(app,), daemon=True).start()
+
+    def _purge_in_background(self, app):
+        with app.app_context():
+            try:
+                self.purge_expired()
+            finally:
+                db.session.remove()
+
+    def purge_expired(self):
+        """Delete processed message records older than the TTL"""
+        try:
+            cutoff = datetime.utcnow() - self.ttl
+            deleted = db.session.execute(
+                delete(ProcessedMessage).where(ProcessedMessage.created_at < cutoff)
+            ).rowcount
+            db.session.commit()
+            if deleted:
+                logging.info(f"Purged {deleted} expired processed message record(s)")
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error purging processed messages: {str(e)}")
+
+    def _get_cached(self, message_sid):
+        with self._lock:
+            entry = self._replies.get(message_sid)
+            if entry is None:
+                return None
+
+            reply, stored_at = entry
+            if stored_at < datetime.utcnow() - self.ttl:
+                del self._replies[message_sid]
+                return None
+
+            self._replies.move_to_end(message_sid)
+            return reply
+
+    def _put_cached(self, message_sid, reply):
+        with self._lock:
+            self._replies[message_sid] = (reply, datetime.utcnow())
+            self._replies.move_to_end(message_sid)
+            while len(self._replies) > self.max_entries:
+                self._replies.popitem(last=False)
+
+
+message_deduplicator = MessageDeduplicator()
@@ -0,0 +1,192 @@
+"""
+Per-phone-number message serialization
+
+Messages from one user must be handled one at a time, in arrival order.
+Otherwise two workers read and rewrite the same conversation state and one
+update is lost. Messages from different users must still run in parallel.
+
+Inside a worker process, threads queue on a per-phone lock kept in one of a
+fixed number of shards. Across processes the lock is a Postgres advisory lock
+keyed on a hash of the phone number. It is a transaction-level lock taken in
+the session's own transaction, so it needs no second pooled connection and
+is released when the message's unit of work commits. On SQLite, which has
+no advisory locks, it is a row in the message_locks table. Every wait,
+in-process or in the database, gives up with LockTimeout at the same
+deadline. Contention is counted so we can see how often users race
+themselves.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, text
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import MessageLock
+
+
+class LockTimeout(Exception):
+    """Raised when a phone lock cannot be acquired in time"""
+
+
+class PhoneLockManager:
+    SHARDS = 64
+    # Give up waiting before Twilio's 15 second webhook timeout
+    WAIT_TIMEOUT = timedelta(seconds=12)
+    # A lock row older than this belongs to a crashed worker
+    STALE_AFTER = timedelta(minutes=2)
+
+    def __init__(self):
+        self._shards = [(threading.Lock(), {}) for _ in range(self.SHARDS)]
+        self._stats_lock = threading.Lock()
+        self._stats = {'acquired': 0, 'contended': 0, 'wait_seconds': 0.0}
+
+    @contextmanager
+    def hold(self, phone_number):
+        """Hold the lock for a phone number while handling one message
+
+        Work done inside the block must be committed inside it. On Postgres
+        the lock lives in the session's transaction, which is rolled back
+        when the block ends.
+        """
+        started = time.monotonic()
+        deadline = started + self.WAIT_TIMEOUT.total_seconds()
+        local_lock = self._checkout(phone_number)
+        contended = not local_lock.acquire(blocking=False)
+        # A handler stuck on this number must not block later requests forever
+        if contended and not local_lock.acquire(timeout=self.WAIT_TIMEOUT.total_seconds()):
+            self._checkin(phone_number)
+            raise LockTimeout(f"Timed out waiting for lock on {phone_number}")
+
+        try:
+            if db.engine.dialect.name == 'postgresql':
+                lock = self._advisory_lock
+            else:
+                lock = self._table_lock
+
+            with lock(phone_number, deadline) as db_contended:
+                self._record(contended or db_contended, time.monotonic() - started)
+                yield
+        finally:
+            local_lock.release()
+            self._checkin(phone_number)
+
+    def stats(self):
+        """Lock contention metrics for this worker process"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['contention_rate'] = round(stats['contended'] / stats['acquired'], 4) if stats['acquired'] else 0.0
+        stats['wait_seconds'] = round(stats['wait_seconds'], 3)
+        return stats
+
+    def _record(self, contended, waited):
+        with self._stats_lock:
+            self._stats['acquired'] += 1
+            if contended:
+                self._stats['contended'] += 1
+                self._stats['wait_seconds'] += waited
+
+        if contended:
+            logging.info(f"Waited {waited:.3f}s for phone lock")
+
+    def _shard(self, phone_number):
+        return self._shards[hash(phone_number) % self.SHARDS]
+
+    def _checkout(self, phone_number):
+        """Get the in-process lock for a phone number, creating it if needed"""
+        shard_lock, locks = self._shard(phone_number)
+        with shard_lock:
+            entry = locks.get(phone_number)
+            if entry is None:
+                entry = locks[phone_number] = [threading.Lock(), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _checkin(self, phone_number):
+        """Drop the in-process lock once nobody is waiting for it"""
+        shard_lock, locks = self._shard(phone_number)
+        with shard_lock:
+            entry = locks[phone_number]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del locks[phone_number]
+
+    def _lock_key(self, phone_number):
+        """Stable signed 64-bit key for a phone number"""
+        digest = hashlib.sha1(phone_number.encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big', signed=True)
+
+    @contextmanager
+    def _advisory_lock(self, phone_number, deadline):
+        """Postgres transaction-level advisory lock in the session's own transaction"""
+        key = self._lock_key(phone_number)
+        session = db.session
+        contended = not session.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {'key': key}).scalar()
+        if contended:
+            timeout_ms = max(1, int((deadline - time.monotonic()) * 1000))
+            try:
+                session.execute(text(f"SET LOCAL lock_timeout = {timeout_ms}"))
+                session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': key})
+                # The timeout was for the lock wait only, not the message's own statements
+                session.execute(text("SET LOCAL lock_timeout TO DEFAULT"))
+            except Exception as e:
+                session.rollback()
+                raise LockTimeout(f"Timed out waiting for lock on {phone_number}") from e
+
+        try:
+            yield contended
+        finally:
+            # Normally the unit of work has committed, which released the lock already
+            session.rollback()
+
+    @contextmanager
+    def _table_lock(self, phone_number, deadline):
+        """Lock row in message_locks, polled until it can be inserted"""
+        key = str(self._lock_key(phone_number))
+        owner = uuid.uuid4().hex
+        contended = False
+        delay = 0.005
+
+        while True:
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(insert(MessageLock.__table__).values(
+                        lock_key=key, owner=owner, acquired_at=datetime.utcnow()
+                    ))
+                break
+            except IntegrityError:
+                contended = True
+                self._break_stale_lock(key)
+                if time.monotonic() > deadline:
+                    raise LockTimeout(f"Timed out waiting for lock on {phone_number}")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.1)
+
+        try:
+            yield contended
+        finally:
+            with db.engine.begin() as conn:
+                conn.execute(delete(MessageLock.__table__).where(
+                    MessageLock.__table__.c.lock_key == key,
+                    MessageLock.__table__.c.owner == owner
+                ))
+
+    def _break_stale_lock(self, key):
+        """Remove a lock row left behind by a crashed worker"""
+        stale_before = datetime.utcnow() - self.STALE_AFTER
+        with db.engine.begin() as conn:
+            removed = conn.execute(delete(MessageLock.__table__).where(
+                MessageLock.__table__.c.lock_key == key,
+                MessageLock.__table__.c.acquired_at < stale_before
+            )).rowcount
+        if removed:
+            logging.warning(f"Removed stale message lock {key}")
+
+
+phone_locks = PhoneLockManager()
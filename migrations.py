@@ -0,0 +1,127 @@
+"""
+Lightweight schema upgrades
+
+db.create_all() creates missing tables but never alters existing ones. Columns
+added to existing models are listed here and added with ALTER TABLE on
+startup if the database does not have them yet. Columns removed from the
+models are dropped the same way, after their data has been moved.
+
+CVs saved before experience and education were stored as structured entries
+hold lists of raw text. Those rows are parsed once and rewritten.
+"""
+
+import json
+import logging
+
+from sqlalchemy import inspect, text
+
+from app import db
+from cv_templates.parsing import current_job_title, parse_education, parse_experience
+
+# (table, column, column DDL)
+ADDED_COLUMNS = [
+    ('cvs', 'color_scheme', "VARCHAR(20) DEFAULT 'blue'"),
+    ('conversation_states', 'version', "INTEGER NOT NULL DEFAULT 0"),
+    ('conversation_states', 'patch_count', "INTEGER NOT NULL DEFAULT 0"),
+    ('cvs', 'job_title', "VARCHAR(150)"),
+    ('render_jobs', 'claimed_by', "VARCHAR(32)"),
+    ('render_jobs', 'heartbeat_at', "TIMESTAMP"),
+]
+
+# (table, column)
+DROPPED_COLUMNS = [
+    # Superseded by the conversation_states table
+    ('users', 'conversation_state'),
+    ('users', 'conversation_data'),
+]
+
+
+def upgrade_schema():
+    """Bring an existing database in line with the models"""
+    inspector = inspect(db.engine)
+
+    for table, column, ddl in ADDED_COLUMNS:
+        if not inspector.has_table(table):
+            continue
+
+        if column in _columns(inspector, table):
+            continue
+
+        with db.engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+        logging.info(f"Added column {table}.{column}")
+
+    if inspector.has_table('cvs'):
+        _structure_cv_entries()
+
+    if {'conversation_state', 'conversation_data'} & _columns(inspector, 'users'):
+        _move_user_conversation_state(inspector)
+
+    for table, column in DROPPED_COLUMNS:
+        if column not in _columns(inspector, table):
+            continue
+
+        with db.engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+        logging.info(f"Dropped column {table}.{column}")
+
+
+def _columns(inspector, table):
+    inspector.clear_cache()
+    if not inspector.has_table(table):
+        return set()
+    return {col['name'] for col in inspector.get_columns(table)}
+
+
+def _move_user_conversation_state(inspector):
+    """Copy conversation state kept on users rows into conversation_states"""
+    user_columns = _columns(inspector, 'users')
+    state = "COALESCE(u.conversation_state, 'welcome')" if 'conversation_state' in user_columns else "'welcome'"
+    data = "COALESCE(u.conversation_data, '{}')" if 'conversation_data' in user_columns else "'{}'"
+
+    with db.engine.begin() as conn:
+        moved = conn.execute(text(f"""
+            INSERT INTO conversation_states (phone_number, state, data, version, patch_count, updated_at)
+            SELECT u.phone_number, {state}, {data}, 0, 0, u.last_active
+            FROM users u
+            WHERE NOT EXISTS (
+                SELECT 1 FROM conversation_states cs WHERE cs.phone_number = u.phone_number
+            )
+        """)).rowcount
+
+    if moved:
+        logging.info(f"Moved conversation state for {moved} user(s) to conversation_states")
+
+
+def _structure_cv_entries():
+    """Parse experience and education saved as raw text into structured entries"""
+    with db.engine.begin() as conn:
+        # Text entries serialise as ["...", ...], structured ones as [{...}, ...]
+        rows = conn.execute(text("""
+            SELECT id, experience, education FROM cvs
+            WHERE experience LIKE '["%' OR education LIKE '["%'
+        """)).fetchall()
+
+        structured = 0
+        for cv_id, experience, education in rows:
+            try:
+                experience = [parse_experience(entry) for entry in json.loads(experience or '[]')]
+                education = [parse_education(entry) for entry in json.loads(education or '[]')]
+            except (ValueError, TypeError) as e:
+                logging.error(f"Error parsing entries of CV {cv_id}: {str(e)}")
+                continue
+
+            conn.execute(
+                text("UPDATE cvs SET experience = :experience, education = :education, "
+                     "job_title = :job_title WHERE id = :id"),
+                {
+                    'id': cv_id,
+                    'experience': json.dumps(experience),
+                    'education': json.dumps(education),
+                    'job_title': current_job_title(experience)
+                }
+            )
+            structured += 1
+
+    if structured:
+        logging.info(f"Structured experience and education for {structured} CV(s)")
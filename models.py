@@ -35,14 +35,19 @@ class User(db.Model):
     name = Column(String(100))
     email = Column(String(120))
     is_premium = Column(Boolean, default=False)
-    conversation_state = Column(String(50), default='idle')
-    conversation_data = Column(Text)  # JSON string to store CV data being built
     created_at = Column(DateTime, default=datetime.utcnow)
     last_active = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     cvs = relationship('CV', backref='user', lazy=True)
     transactions = relationship('Transaction', backref='user', lazy=True)
+    # ConversationState is the only store of conversation progress
+    conversation = relationship(
+        'ConversationState',
+        primaryjoin='User.phone_number == foreign(ConversationState.phone_number)',
+        uselist=False,
+        viewonly=True
+    )
     
     def __repr__(self):
         return f'<User {self.phone_number}>'
@@ -77,9 +82,10 @@ class CV(db.Model):
     phone = Column(String(20))
     address = Column(Text)
     summary = Column(Text)
-    experience = Column(Text)  # JSON string
-    education = Column(Text)   # JSON string
+    experience = Column(Text)  # JSON list of {title, company, period, bullets, description}
+    education = Column(Text)   # JSON list of {degree, institution, period, details, description}
     skills = Column(Text)      # JSON string
+    job_title = Column(String(150))  # Title of the most recent experience entry
     profile_photo = Column(String(255))  # File path
     
     # Premium features
@@ -126,7 +132,105 @@ class ConversationState(db.Model):
     phone_number = Column(String(20), unique=True, nullable=False)
     state = Column(String(50), nullable=False)
     data = Column(Text)  # JSON string for storing conversation data
+    version = Column(Integer, nullable=False, default=0)  # Bumped on every write
+    patch_count = Column(Integer, nullable=False, default=0)  # Patches not yet folded into data
     updated_at = Column(DateTime, default=datetime.utcnow)
     
     def __repr__(self):
         return f'<ConversationState {self.phone_number}: {self.state}>'
+
+class RenderJob(db.Model):
+    __tablename__ = 'render_jobs'
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    template_id = Column(Integer, ForeignKey('templates.id'), nullable=False)
+    phone_number = Column(String(20), nullable=False)
+    
+    # Finalised CV data captured when the user picked a template
+    cv_data = Column(Text, nullable=False)  # JSON string
+    color_scheme = Column(String(20), default='blue')
+    
+    # Job status
+    status = Column(String(20), default='queued', index=True)  # queued, running, completed, failed
+    attempts = Column(Integer, default=0)
+    claimed_by = Column(String(32))  # Process rendering the job while it is running
+    heartbeat_at = Column(DateTime)  # Refreshed by that process until the render finishes
+    error = Column(Text)
+    cv_id = Column(Integer, ForeignKey('cvs.id'))
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    
+    def __repr__(self):
+        return f'<RenderJob {self.id}: {self.status}>'
+
+class ProcessedMessage(db.Model):
+    __tablename__ = 'processed_messages'
+    
+    id = Column(Integer, primary_key=True)
+    message_sid = Column(String(64), unique=True, nullable=False, index=True)
+    reply = Column(Text)  # Reply sent back; the row is written in the same commit as the message's effects
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<ProcessedMessage {self.message_sid}>'
+
+class MessageLock(db.Model):
+    __tablename__ = 'message_locks'
+    
+    # Serialises message handling per phone number on databases without advisory locks
+    lock_key = Column(String(64), primary_key=True)
+    owner = Column(String(64), nullable=False)
+    acquired_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<MessageLock {self.lock_key}>'
+
+class ConversationPatch(db.Model):
+    __tablename__ = 'conversation_patches'
+    
+    # Field-level changes applied on top of ConversationState.data until compaction
+    id = Column(Integer, primary_key=True)
+    phone_number = Column(String(20), nullable=False, index=True)
+    version = Column(Integer, nullable=False)  # State version the patch produced
+    op = Column(String(10), nullable=False)  # set, append
+    field = Column(String(50), nullable=False)
+    value = Column(Text)  # JSON encoded
+    
+    def __repr__(self):
+        return f'<ConversationPatch {self.phone_number} v{self.version}: {self.op} {self.field}>'
+
+class CatalogVersion(db.Model):
+    __tablename__ = 'catalog_versions'
+    
+    # Bumped whenever a cached catalog (e.g. templates) changes, so every worker reloads it
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CatalogVersion {self.name}: {self.version}>'
+
+class OutboxMessage(db.Model):
+    __tablename__ = 'outbox_messages'
+    
+    # Outbound WhatsApp messages, sent and retried by the outbound dispatcher
+    id = Column(Integer, primary_key=True)
+    phone_number = Column(String(20), nullable=False)
+    body = Column(Text)
+    media_url = Column(Text)
+    
+    # Delivery status
+    status = Column(String(20), default='pending', nullable=False)  # pending, sending, sent, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, index=True)
+    message_sid = Column(String(64))  # Twilio's SID once accepted
+    error = Column(Text)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    claimed_at = Column(DateTime)
+    sent_at = Column(DateTime)
+    
+    def __repr__(self):
+        return f'<OutboxMessage {self.id}: {self.status}>'
@@ -0,0 +1,308 @@
+"""
+Outbound WhatsApp messaging
+
+Messages the bot sends on its own, such as "your CV is ready", used to go
+out through a Twilio client created on the spot. Sends ran inline and any
+failure was only logged. Now every outbound message is written to the
+outbox_messages table, in the same transaction as the change that caused it,
+and a dispatcher thread delivers it:
+
+- one requests.Session per process, so connections to the Twilio API are
+  pooled and kept alive
+- the Messages resource is called directly under TWILIO_API_BASE, which can
+  point at scripts/fake_twilio.py for local testing
+- rate limits (429), server errors and network failures are retried with
+  exponential backoff and full jitter, honouring Retry-After
+- other 4xx responses, such as an invalid number, fail the message at once
+- a token bucket per sender number keeps us under the WhatsApp throughput
+  limit, so bursts are smoothed out instead of being rejected
+
+Messages are claimed with a conditional UPDATE, so several worker processes
+can share the outbox. Each process has its own token bucket, so the
+configured rate applies per process. A message left in 'sending' by a
+crashed process is retried after STALE_AFTER. It may then be delivered
+twice, which is preferable to not at all.
+"""
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import func, select, update
+
+from app import db
+from models import OutboxMessage
+from unit_of_work import on_commit
+
+outbox = OutboxMessage.__table__
+
+
+class DeliveryError(Exception):
+    """Raised when the API rejects a message; retryable errors carry a delay"""
+
+    def __init__(self, message, retryable, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Allows `rate` operations per second on average, with bursts of up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until one is available; returns the seconds waited"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class OutboundMessenger:
+    # Due messages claimed per dispatcher pass
+    BATCH_SIZE = 50
+    # Seconds between outbox polls when nothing wakes the dispatcher
+    POLL_INTERVAL = 5
+    BACKOFF_BASE = 2
+    BACKOFF_CAP = 300
+    STALE_AFTER = timedelta(minutes=5)
+
+    def __init__(self):
+        self.app = None
+        self.max_attempts = 6
+        self.timeout = 10
+        self.rate = 20
+        self.burst = 20
+        self._session = None
+        self._senders = None
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stats = {'sent': 0, 'retried': 0, 'failed': 0, 'throttled_seconds': 0.0}
+
+    def init_app(self, app):
+        """Create the pooled HTTP session and start the dispatcher"""
+        self.app = app
+        self.max_attempts = app.config['OUTBOUND_MAX_ATTEMPTS']
+        self.timeout = app.config['OUTBOUND_TIMEOUT']
+        self.rate = app.config['OUTBOUND_RATE_PER_SECOND']
+        self.burst = app.config['OUTBOUND_BURST']
+
+        workers = app.config['OUTBOUND_WORKERS']
+        self._session = requests.Session()
+        # Retries are ours, with backoff; the adapter only pools connections
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=0)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._senders = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='outbound-send')
+
+        threading.Thread(target=self._run, name='outbound-dispatch', daemon=True).start()
+
+    def queue(self, phone_number, body, media_url=None):
+        """Stage a message in the current transaction; it is sent once committed"""
+        message = OutboxMessage(
+            phone_number=phone_number,
+            body=body,
+            media_url=media_url,
+            status='pending',
+            attempts=0,
+            next_attempt_at=datetime.utcnow(),
+            created_at=datetime.utcnow()
+        )
+        db.session.add(message)
+        on_commit(self.wake)
+        return message
+
+    def wake(self):
+        """Have the dispatcher look for due messages now"""
+        self._wakeup.set()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['throttled_seconds'] = round(stats['throttled_seconds'], 2)
+        if self.app is not None:
+            try:
+                with self.app.app_context():
+                    stats['pending'] = db.session.scalar(
+                        select(func.count()).select_from(outbox).where(outbox.c.status.in_(('pending', 'sending')))
+                    )
+            except Exception as e:
+                logging.error(f"Error counting pending outbound messages: {str(e)}")
+        return stats
+
+    def _run(self):
+        recovered_at = None
+        while True:
+            try:
+                if recovered_at is None or time.monotonic() - recovered_at > self.STALE_AFTER.total_seconds():
+                    self._recover()
+                    recovered_at = time.monotonic()
+                claimed = self.dispatch_due()
+            except Exception as e:
+                logging.error(f"Error dispatching outbound messages: {str(e)}")
+                claimed = 0
+
+            # A full batch means more are probably due
+            if claimed < self.BATCH_SIZE:
+                self._wakeup.wait(self.POLL_INTERVAL)
+                self._wakeup.clear()
+
+    def _recover(self):
+        """Put messages left in 'sending' by a crashed process back in the queue"""
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                recovered = conn.execute(
+                    update(outbox)
+                    .where(outbox.c.status == 'sending',
+                           outbox.c.claimed_at < datetime.utcnow() - self.STALE_AFTER)
+                    .values(status='pending', next_attempt_at=datetime.utcnow())
+                ).rowcount
+        if recovered:
+            logging.info(f"Requeued {recovered} interrupted outbound message(s)")
+
+    def dispatch_due(self):
+        """Claim due messages, send them and wait for the batch; returns the number claimed"""
+        now = datetime.utcnow()
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                due = conn.execute(
+                    select(outbox.c.id)
+                    .where(outbox.c.status == 'pending', outbox.c.next_attempt_at <= now)
+                    .order_by(outbox.c.next_attempt_at, outbox.c.id)
+                    .limit(self.BATCH_SIZE)
+                ).scalars().all()
+
+                messages = []
+                for message_id in due:
+                    claimed = conn.execute(
+                        update(outbox)
+                        .where(outbox.c.id == message_id, outbox.c.status == 'pending')
+                        .values(status='sending', claimed_at=now, attempts=outbox.c.attempts + 1)
+                    ).rowcount
+                    # Another process may have claimed it first
+                    if claimed:
+                        messages.append(conn.execute(
+                            select(outbox.c.id, outbox.c.phone_number, outbox.c.body,
+                                   outbox.c.media_url, outbox.c.attempts)
+                            .where(outbox.c.id == message_id)
+                        ).one())
+
+        if messages:
+            wait([self._senders.submit(self._deliver, message) for message in messages])
+        return len(messages)
+
+    def _deliver(self, message):
+        """Send one claimed message and record the outcome"""
+        sender = self._whatsapp(self.app.config['TWILIO_PHONE_NUMBER'] or '')
+        waited = self._bucket(sender).acquire()
+
+        try:
+            message_sid = self.send(sender, self._whatsapp(message.phone_number), message.body, message.media_url)
+        except DeliveryError as e:
+            self._record_failure(message, e, waited)
+            return
+
+        self._update(message.id, status='sent', message_sid=message_sid, sent_at=datetime.utcnow(), error=None)
+        with self._lock:
+            self._stats['sent'] += 1
+            self._stats['throttled_seconds'] += waited
+
+    def send(self, sender, recipient, body, media_url=None):
+        """POST one message to the Messages resource; returns its SID"""
+        account_sid = self.app.config['TWILIO_ACCOUNT_SID']
+        auth_token = self.app.config['TWILIO_AUTH_TOKEN']
+        if not (account_sid and auth_token and sender):
+            raise DeliveryError("Twilio credentials are not configured", retryable=True)
+
+        url = f"{self.app.config['TWILIO_API_BASE'].rstrip('/')}/2010-04-01/Accounts/{account_sid}/Messages.json"
+        data = {'From': sender, 'To': recipient}
+        if body:
+            data['Body'] = body
+        if media_url:
+            data['MediaUrl'] = media_url
+
+        try:
+            response = self._session.post(url, data=data, auth=(account_sid, auth_token), timeout=self.timeout)
+        except requests.RequestException as e:
+            raise DeliveryError(f"request failed: {str(e)}", retryable=True)
+
+        if response.status_code in (200, 201):
+            return response.json().get('sid')
+
+        try:
+            detail = response.json()
+            reason = f"{detail.get('code')}: {detail.get('message')}"
+        except ValueError:
+            reason = response.text[:200]
+
+        retryable = response.status_code == 429 or response.status_code >= 500
+        retry_after = response.headers.get('Retry-After')
+        raise DeliveryError(
+            f"HTTP {response.status_code} ({reason})",
+            retryable=retryable,
+            retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None
+        )
+
+    def _record_failure(self, message, error, waited):
+        if error.retryable and message.attempts < self.max_attempts:
+            delay = max(self._backoff(message.attempts), error.retry_after or 0)
+            self._update(message.id, status='pending', error=str(error),
+                         next_attempt_at=datetime.utcnow() + timedelta(seconds=delay))
+            logging.warning(f"Outbound message {message.id} to {message.phone_number} failed "
+                            f"(attempt {message.attempts}), retrying in {delay:.1f}s: {str(error)}")
+            outcome = 'retried'
+        else:
+            self._update(message.id, status='failed', error=str(error))
+            logging.error(f"Outbound message {message.id} to {message.phone_number} failed "
+                          f"after {message.attempts} attempt(s): {str(error)}")
+            outcome = 'failed'
+
+        with self._lock:
+            self._stats[outcome] += 1
+            self._stats['throttled_seconds'] += waited
+
+    def _backoff(self, attempts):
+        """Full jitter: a random delay up to an exponentially growing cap"""
+        return random.uniform(0, min(self.BACKOFF_CAP, self.BACKOFF_BASE * 2 ** attempts))
+
+    def _update(self, message_id, **values):
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    conn.execute(update(outbox).where(outbox.c.id == message_id).values(**values))
+        except Exception as e:
+            # The claim goes stale and the message is retried after recovery
+            logging.error(f"Error recording outcome of outbound message {message_id}: {str(e)}")
+
+    def _bucket(self, sender):
+        with self._lock:
+            bucket = self._buckets.get(sender)
+            if bucket is None:
+                bucket = self._buckets[sender] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def _whatsapp(self, number):
+        return number if not number or number.startswith('whatsapp:') else f'whatsapp:{number}'
+
+
+outbound = OutboundMessenger()
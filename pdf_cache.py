@@ -0,0 +1,163 @@
+"""
+Content-addressed cache of rendered PDFs
+
+A render depends only on the CV content, the template (and its code), and
+the colour scheme. Those are hashed into a key and the PDF is stored once
+under that key. A repeat request is served by storing the cached file as
+the new CV instead of rendering again. Examples are a user regenerating the
+same CV or an admin previewing a template.
+
+Each CV is its own storage object (a hard link on local storage, a copy
+otherwise). Evicting a cache entry therefore never breaks an existing CV.
+The cache is bounded by total size and evicts the
+least recently used entries first, using file mtimes, which are refreshed
+on every hit.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import cv_templates
+
+# Fields that change the rendered PDF; bookkeeping fields are left out of the key
+RENDERED_FIELDS = ('full_name', 'email', 'phone', 'address', 'summary',
+                   'experience', 'education', 'skills', 'profile_photo')
+
+
+def _normalise(value):
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, (list, tuple)):
+        return [_normalise(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _normalise(item) for key, item in value.items()}
+    return value
+
+
+class PDFCache:
+    def __init__(self, folder='generated_cvs/cache', max_bytes=500 * 1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    def init_app(self, app):
+        """Read cache settings from the app config"""
+        self.folder = app.config['PDF_CACHE_FOLDER']
+        self.max_bytes = app.config['PDF_CACHE_MAX_MB'] * 1024 * 1024
+        os.makedirs(self.folder, exist_ok=True)
+
+    def key(self, cv_data, template_file, color_scheme=None):
+        """Hash of everything that determines the rendered PDF"""
+        info = cv_templates.template_info(template_file)
+        if not info.supports_color:
+            color_scheme = None
+        elif color_scheme not in info.color_schemes:
+            color_scheme = 'blue'
+
+        content = {field: _normalise(cv_data.get(field)) for field in RENDERED_FIELDS}
+        photo = content.get('profile_photo')
+        if photo:
+            # The photo's bytes matter, not just its name
+            content['profile_photo'] = self._file_digest(photo)
+
+        payload = json.dumps({
+            'cv': content,
+            'template': info.name,
+            'template_version': cv_templates.template_version(template_file),
+            'color_scheme': color_scheme
+        }, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.folder, f'{key}.pdf')
+
+    def fetch(self, key):
+        """Return the cached PDF path for a key, or None on a miss"""
+        cached = self.path_for(key)
+        try:
+            os.utime(cached)
+        except OSError:
+            self._record('misses')
+            return None
+
+        self._record('hits')
+        return cached
+
+    def store(self, key, pdf):
+        """Add freshly rendered PDF bytes to the cache and return the cached path"""
+        cached = self.path_for(key)
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            if not os.path.exists(cached):
+                tmp_path = f'{cached}.{os.getpid()}.{threading.get_ident()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(pdf)
+                os.replace(tmp_path, cached)
+                self._added(len(pdf))
+        except OSError as e:
+            logging.error(f"Error storing PDF in cache: {str(e)}")
+            return None
+
+        return cached
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits its size bound"""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.folder):
+                if entry.name.endswith('.pdf'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+                self._stats['evictions'] += 1
+
+            self._size = total
+
+    def stats(self):
+        """Hit/miss counters for this process and current cache size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size_bytes'] = self._size
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _added(self, size):
+        with self._lock:
+            self._stats['stores'] += 1
+            if self._size is not None:
+                self._size += size
+            over = self._size is None or self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def _record(self, outcome):
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def _file_digest(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return hashlib.file_digest(f, 'sha256').hexdigest()
+        except OSError:
+            return path
+
+
+pdf_cache = PDFCache()
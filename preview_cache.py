@@ -0,0 +1,228 @@
+"""
+Precomputed admin template previews
+
+Previews render the fixed SAMPLE_CV_DATA with every template and colour,
+so each one is built once, ahead of time, in the render pool. It is then
+served from disk. The file is named after its PDF cache key, which covers
+the sample data, the template code and the colour. That key is also the
+ETag, so browsers revalidate with a 304 instead of downloading again.
+
+A changed template gets a new key. Refreshing after an admin edit
+therefore just builds whatever is missing, and files left behind by older
+keys are pruned on a full rebuild.
+
+Every web worker imports the app, so nothing is rendered at startup unless
+PREVIEW_WARMUP is set. A preview is built the first time it is viewed, or
+all of them at once with `flask --app main build-previews`.
+"""
+
+import logging
+import os
+import threading
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select
+
+import cv_templates
+from app import db
+from models import Template
+from pdf_cache import pdf_cache
+from render_queue import render_queue
+from render_worker import write_pdf
+
+SAMPLE_CV_DATA = {
+    'full_name': 'John Smith',
+    'email': 'john.smith@email.com',
+    'phone': '+1 (555) 123-4567',
+    'address': '123 Main Street, City, State 12345',
+    'summary': 'Experienced professional with over 10 years in the industry. Proven track record of delivering high-quality results and leading successful teams. Passionate about innovation and continuous learning.',
+    'experience': [
+        {
+            'title': 'Senior Manager',
+            'company': 'Tech Corp',
+            'period': 'January 2020 - Present',
+            'bullets': ['Lead a team of 15 professionals in developing innovative solutions. Increased team productivity by 35% and reduced project delivery time by 20%. Managed multiple high-priority projects with budgets exceeding $2M.']
+        },
+        {
+            'title': 'Project Manager',
+            'company': 'StartUp Inc',
+            'period': 'March 2017 - December 2019',
+            'bullets': ['Oversaw product development lifecycle from conception to launch. Collaborated with cross-functional teams to deliver 5 successful product launches. Implemented agile methodologies that improved team efficiency by 25%.']
+        },
+        {
+            'title': 'Business Analyst',
+            'company': 'Global Solutions',
+            'period': 'June 2014 - February 2017',
+            'bullets': ['Analyzed business requirements and translated them into technical specifications. Worked closely with stakeholders to identify process improvements. Contributed to a 15% increase in operational efficiency.']
+        }
+    ],
+    'education': [
+        {
+            'degree': 'Master of Business Administration',
+            'institution': 'Harvard Business School',
+            'period': '2014',
+            'details': ['Concentration in Strategy and Operations']
+        },
+        {
+            'degree': 'Bachelor of Science in Computer Science',
+            'institution': 'Stanford University',
+            'period': '2012',
+            'details': ['Graduated Magna Cum Laude, GPA: 3.8/4.0']
+        }
+    ],
+    'skills': [
+        'Project Management',
+        'Strategic Planning',
+        'Team Leadership',
+        'Data Analysis',
+        'Process Improvement',
+        'Agile Methodologies',
+        'Budget Management',
+        'Stakeholder Relations',
+        'Risk Assessment',
+        'Performance Optimization'
+    ]
+}
+
+
+class PreviewCache:
+    # Longest a request waits for a preview that has not been built yet
+    RENDER_TIMEOUT = 60
+
+    def __init__(self, folder='generated_cvs/previews'):
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._building = set()
+
+    def init_app(self, app):
+        """Set up the preview folder, and build missing previews in the background if PREVIEW_WARMUP is set"""
+        # send_file resolves relative paths against the app root, not the working directory
+        self.folder = os.path.abspath(app.config['PREVIEW_FOLDER'])
+        os.makedirs(self.folder, exist_ok=True)
+        app.cli.add_command(build_previews_command)
+
+        if not app.config['PREVIEW_WARMUP']:
+            return
+
+        with app.app_context():
+            try:
+                template_files = self.template_files()
+            except Exception as e:
+                logging.error(f"Error listing templates for preview warm-up: {str(e)}")
+                return
+            finally:
+                db.session.remove()
+
+        self.rebuild(template_files, background=True)
+
+    def template_files(self):
+        return db.session.execute(select(Template.template_file)).scalars().all()
+
+    def colors_for(self, template_file):
+        """Colour schemes a template is previewed in ([None] for single-colour templates)"""
+        try:
+            info = cv_templates.template_info(template_file)
+        except ValueError:
+            return []
+        return list(info.color_schemes) or [None]
+
+    def key(self, template_file, color_scheme=None):
+        return pdf_cache.key(SAMPLE_CV_DATA, template_file, color_scheme)
+
+    def path_for(self, key):
+        return os.path.join(self.folder, f'{key}.pdf')
+
+    def get(self, template_file, color_scheme=None):
+        """Return (path, etag) for a preview, building it now if it is missing"""
+        key = self.key(template_file, color_scheme)
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            pdf = render_queue.render(template_file, SAMPLE_CV_DATA, color_scheme or 'blue').result(self.RENDER_TIMEOUT)
+            if pdf is None:
+                return None, None
+            self._store(key, pdf)
+        return path, key
+
+    def refresh(self, template_file):
+        """Build the previews for a template that was added or changed"""
+        self.rebuild([template_file], background=True)
+
+    def rebuild(self, template_files, force=False, background=False):
+        """Build previews for the given templates in every colour
+
+        force re-renders previews that already exist and prunes files that
+        no longer belong to any template. Returns the number of previews queued.
+        """
+        jobs = []
+        wanted = set()
+        for template_file in set(template_files):
+            for color_scheme in self.colors_for(template_file):
+                key = self.key(template_file, color_scheme)
+                wanted.add(key)
+                if force or not os.path.exists(self.path_for(key)):
+                    jobs.append((key, template_file, color_scheme))
+
+        if force:
+            self._prune(wanted)
+
+        if background:
+            threading.Thread(target=self._build, args=(jobs,), name='preview-rebuild', daemon=True).start()
+        else:
+            self._build(jobs)
+        return len(jobs)
+
+    def stats(self, template_files):
+        """How many of the previews for the given templates are ready"""
+        keys = [self.key(f, c) for f in set(template_files) for c in self.colors_for(f)]
+        ready = sum(1 for key in keys if os.path.exists(self.path_for(key)))
+        return {'ready': ready, 'total': len(keys)}
+
+    def _build(self, jobs):
+        futures = []
+        for key, template_file, color_scheme in jobs:
+            with self._lock:
+                if key in self._building:
+                    continue
+                self._building.add(key)
+            futures.append((key, template_file, render_queue.render(template_file, SAMPLE_CV_DATA, color_scheme or 'blue')))
+
+        for key, template_file, future in futures:
+            try:
+                pdf = future.result()
+                if pdf is None:
+                    logging.error(f"Preview render failed for {template_file}")
+                else:
+                    self._store(key, pdf)
+            except Exception as e:
+                logging.error(f"Error building preview for {template_file}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._building.discard(key)
+
+        if futures:
+            logging.info(f"Built {len(futures)} template preview(s)")
+
+    def _store(self, key, pdf):
+        os.makedirs(self.folder, exist_ok=True)
+        write_pdf(self.path_for(key), pdf)
+
+    def _prune(self, wanted):
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith('.pdf') and entry.name[:-4] not in wanted:
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+
+
+@click.command('build-previews')
+@click.option('--force', is_flag=True, help='Re-render previews that already exist.')
+@with_appcontext
+def build_previews_command(force):
+    """Build the template previews in the render pool and wait for them"""
+    built = preview_cache.rebuild(preview_cache.template_files(), force=force)
+    click.echo(f"Built {built} template preview(s)")
+
+
+preview_cache = PreviewCache()
@@ -0,0 +1,111 @@
+"""
+Profile photo ingestion
+
+WhatsApp delivers camera photos of several megabytes, and templates
+embedded them as-is, which bloated every PDF that used one. Photos are now
+processed once, when they arrive:
+
+- downloaded by media_fetcher, which streams it to a temp file under
+  a byte cap and time limits
+- decoded once and rotated according to their EXIF orientation
+- centre-cropped to a square, which is the shape of every template's
+  photo box
+- downscaled to cover the largest photo box at print DPI
+- recompressed as a baseline JPEG
+
+The result is stored under a key derived from the hash of the original
+bytes, so sending the same photo again reuses the processed file. Renders
+embed that small file instead of the original.
+"""
+
+import hashlib
+import io
+import logging
+import os
+
+from PIL import Image, ImageOps
+
+import cv_templates
+from media_fetcher import MediaError, media_fetcher
+from storage import photo_key, storage, StorageError
+
+
+class PhotoError(Exception):
+    """Raised when a photo cannot be downloaded or decoded"""
+
+
+class ProfilePhotoProcessor:
+    JPEG_QUALITY = 85
+    # Refuse to decode anything larger than this (decompression bombs)
+    MAX_PIXELS = 40_000_000
+
+    def __init__(self):
+        self.max_bytes = 10 * 1024 * 1024
+        self.size = cv_templates.photo_pixels()
+
+    def init_app(self, app):
+        """Read the photo size limit from the app config"""
+        self.max_bytes = app.config['PHOTO_MAX_BYTES']
+
+    def ingest(self, attachments):
+        """Download, process and store the first usable photo among the attachments; returns its storage key or None"""
+        for attachment in attachments:
+            try:
+                with media_fetcher.fetch(attachment, accept=('image/',), max_bytes=self.max_bytes) as path:
+                    return self.process(path)
+            except (MediaError, PhotoError) as e:
+                logging.warning(f"Rejected profile photo {attachment.url}: {str(e)}")
+            except StorageError as e:
+                logging.error(f"Error storing profile photo: {str(e)}")
+                return None
+            except Exception as e:
+                logging.error(f"Error processing profile photo: {str(e)}")
+        return None
+
+    def process(self, path):
+        """Turn a downloaded image file into the embedded JPEG, reusing an earlier result if there is one"""
+        with open(path, 'rb') as f:
+            key = photo_key(hashlib.file_digest(f, 'sha256').hexdigest())
+        if storage.exists(key):
+            return key
+
+        try:
+            source = Image.open(path)
+        except Exception as e:
+            raise PhotoError(f"not a readable image ({str(e)})")
+
+        with source:
+            width, height = source.size
+            if width * height > self.MAX_PIXELS:
+                raise PhotoError(f"image is {width}x{height}, too large to decode")
+
+            # Let the JPEG decoder downscale by a power of two while decoding
+            source.draft('RGB', (self.size, self.size))
+            image = ImageOps.exif_transpose(source)
+            image = self._to_rgb(image)
+
+            edge = min(self.size, image.width, image.height)
+            image = ImageOps.fit(image, (edge, edge), Image.LANCZOS)
+
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=self.JPEG_QUALITY, optimize=True)
+        # Renders read the photo from disk, so keep it on this host too
+        storage.put(key, output.getvalue(), 'image/jpeg', keep_local=True)
+
+        logging.info(f"Processed profile photo {width}x{height} ({os.path.getsize(path)} bytes) "
+                     f"-> {edge}x{edge} ({output.tell()} bytes)")
+        return key
+
+    def _to_rgb(self, image):
+        """Flatten transparency onto white and convert to RGB"""
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            return background
+        if image.mode != 'RGB':
+            return image.convert('RGB')
+        return image
+
+
+profile_photos = ProfilePhotoProcessor()
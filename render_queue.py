@@ -0,0 +1,364 @@
+"""
+Background CV render queue
+
+Rendering a CV with ReportLab takes hundreds of milliseconds, far too long to
+do inside the Twilio webhook. Finalised CVs are stored as RenderJob rows and
+rendered in a process pool. When a render finishes, the CV row is recorded
+and a WhatsApp message for the user goes into the outbox in the same
+transaction.
+
+Jobs live in the database. A running job records the process rendering it,
+which refreshes heartbeat_at every HEARTBEAT_INTERVAL until the render
+finishes. A recovery thread in every process requeues running jobs whose
+heartbeat is older than STALE_AFTER, so work interrupted by a deploy or a
+crash is rendered again by whichever process claims it next. Claims are
+conditional UPDATEs, so only one process renders each job.
+`flask --app main recover-renders` runs one recovery pass and waits for it.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import func, update
+
+from app import db
+from cv_templates.parsing import current_job_title
+from models import RenderJob, CV, Template
+from outbound import outbound
+from downloads import cv_downloads
+from pdf_cache import pdf_cache
+import render_worker
+from storage import cv_key as new_cv_key, storage, StorageError
+from unit_of_work import on_commit
+
+
+class RenderQueue:
+    MAX_ATTEMPTS = 3
+    # Seconds between heartbeats and recovery passes
+    HEARTBEAT_INTERVAL = 30
+    # A running job whose heartbeat is this old lost its process
+    STALE_AFTER = timedelta(minutes=2)
+
+    def __init__(self):
+        self.app = None
+        self.worker_id = uuid.uuid4().hex
+        self._executor = None
+        self._completions = ThreadPoolExecutor(max_workers=2, thread_name_prefix='render-done')
+        self._lock = threading.Lock()
+        self._running = set()
+
+    def init_app(self, app):
+        """Bind the queue to the app and start the heartbeat and recovery thread"""
+        self.app = app
+        app.cli.add_command(recover_renders_command)
+        threading.Thread(target=self._run, name='render-recovery', daemon=True).start()
+
+    def _get_executor(self):
+        """Create the render process pool on first use"""
+        with self._lock:
+            if self._executor is None:
+                # Spawned workers start clean instead of inheriting DB connections
+                context = multiprocessing.get_context('spawn')
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.app.config['RENDER_WORKERS'],
+                    mp_context=context,
+                    initializer=render_worker.init_worker
+                )
+            return self._executor
+
+    def shutdown(self):
+        """Wait for every submitted render, and its completion, to finish"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self._completions.shutdown(wait=True)
+
+    def render(self, template_file, cv_data, color_scheme='blue'):
+        """Render in the process pool; returns a future of the PDF bytes"""
+        executor = self._get_executor()
+        try:
+            return executor.submit(render_worker.render_cv_bytes, template_file, cv_data, color_scheme)
+        except BrokenProcessPool:
+            # A worker died, which breaks the whole pool; start a fresh one
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            logging.warning("Render pool was broken by a dead worker, starting a new one")
+            return self._get_executor().submit(render_worker.render_cv_bytes, template_file, cv_data, color_scheme)
+
+    def enqueue(self, user, template, cv_data):
+        """Stage a render job for a finalised CV; it reaches the pool once committed"""
+        job = RenderJob(
+            user_id=user.id,
+            template_id=template.id,
+            phone_number=user.phone_number,
+            cv_data=json.dumps(cv_data),
+            color_scheme=cv_data.get('color_scheme', 'blue'),
+            status='running',
+            attempts=1,
+            claimed_by=self.worker_id,
+            created_at=datetime.utcnow(),
+            started_at=datetime.utcnow(),
+            heartbeat_at=datetime.utcnow()
+        )
+        db.session.add(job)
+        db.session.flush()
+
+        # The job is claimed by this process from the start, so dispatching it needs no further writes
+        job_id = job.id
+        template_file = template.template_file
+        color_scheme = job.color_scheme
+        on_commit(lambda: self._dispatch(job_id, template_file, cv_data, color_scheme))
+        return job
+
+    def submit(self, job_id):
+        """Claim a queued job and start rendering it"""
+        claimed = db.session.execute(
+            update(RenderJob)
+            .where(RenderJob.id == job_id, RenderJob.status == 'queued')
+            .values(status='running', claimed_by=self.worker_id, started_at=datetime.utcnow(),
+                    heartbeat_at=datetime.utcnow(), attempts=RenderJob.attempts + 1)
+        ).rowcount
+        db.session.commit()
+
+        if not claimed:
+            # Another worker process got there first
+            return False
+
+        job = db.session.get(RenderJob, job_id)
+        template = db.session.get(Template, job.template_id)
+        self._dispatch(job_id, template.template_file, json.loads(job.cv_data), job.color_scheme)
+        return True
+
+    def _dispatch(self, job_id, template_file, cv_data, color_scheme):
+        """Hand a claimed job to the render pipeline without blocking the caller
+
+        This runs in the webhook thread as a post-commit callback, so fetching
+        the photo and hashing it for the cache key happen in _start instead.
+        """
+        with self._lock:
+            self._running.add(job_id)
+        self._completions.submit(self._start, job_id, template_file, cv_data, color_scheme)
+
+    def _start(self, job_id, template_file, cv_data, color_scheme):
+        """Send a job to the render process pool, unless an identical PDF is cached"""
+        cv_key = new_cv_key(cv_data['full_name'])
+        try:
+            # Workers read the photo from this host's disk, whatever the storage backend
+            render_data = dict(cv_data, profile_photo=storage.local_path(cv_data.get('profile_photo')))
+            cache_key = pdf_cache.key(render_data, template_file, color_scheme)
+
+            cached = pdf_cache.fetch(cache_key)
+            if not cached:
+                # The worker renders into memory and sends back the bytes
+                future = self.render(template_file, render_data, color_scheme)
+        except Exception as e:
+            # Counts as a failed attempt, so the job is retried or failed as usual
+            logging.error(f"Error starting render job {job_id}: {str(e)}")
+            self._finish(job_id, cv_key)
+            return
+
+        if cached:
+            logging.info(f"Render job {job_id} served from the PDF cache ({template_file})")
+            self._finish(job_id, cv_key, cached=cached)
+            return
+
+        future.add_done_callback(
+            lambda f: self._completions.submit(self._finish, job_id, cv_key, f, cache_key)
+        )
+        logging.info(f"Render job {job_id} submitted ({template_file})")
+
+    def _finish(self, job_id, cv_key, future=None, cache_key=None, cached=None):
+        """Store the PDF, record the outcome of the render and notify the user
+
+        cached is the path of an identical PDF in the cache, used when there
+        was no render.
+        """
+        with self.app.app_context():
+            pdf = None
+            if future is not None:
+                try:
+                    pdf = future.result()
+                except Exception as e:
+                    logging.error(f"Render job {job_id} crashed: {str(e)}")
+            file_size = self._save_pdf(cv_key, pdf, cache_key, cached) if pdf or cached else None
+
+            resubmitted = False
+            try:
+                job = db.session.get(RenderJob, job_id)
+                template = db.session.get(Template, job.template_id)
+
+                if job.status != 'running' or job.claimed_by != self.worker_id:
+                    # Our heartbeat went stale and another process took the job over
+                    logging.warning(f"Render job {job_id} is no longer ours, dropping the result")
+
+                elif file_size is not None:
+                    cv = self._record_cv(job, template, cv_key, file_size)
+                    job.status = 'completed'
+                    job.cv_id = cv.id
+                    job.completed_at = datetime.utcnow()
+                    # Twilio fetches the PDF from the signed link and sends it as a document
+                    outbound.queue(job.phone_number, self._ready_message(job, template),
+                                   media_url=cv_downloads.url_for(cv_key))
+                    db.session.commit()
+                    outbound.wake()
+
+                    logging.info(f"Render job {job_id} completed: {cv_key}")
+
+                elif job.attempts < self.MAX_ATTEMPTS:
+                    job.status = 'queued'
+                    job.error = 'Render failed'
+                    db.session.commit()
+                    resubmitted = self.submit(job_id)
+
+                else:
+                    job.status = 'failed'
+                    job.error = 'Render failed'
+                    job.completed_at = datetime.utcnow()
+                    outbound.queue(job.phone_number,
+                                   "❌ Sorry, there was an error generating your CV. Please try again.")
+                    db.session.commit()
+                    outbound.wake()
+
+                    logging.error(f"Render job {job_id} failed after {job.attempts} attempts")
+
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Error finishing render job {job_id}: {str(e)}")
+            finally:
+                db.session.remove()
+                if not resubmitted:
+                    with self._lock:
+                        self._running.discard(job_id)
+
+    def _save_pdf(self, cv_key, pdf, cache_key=None, cached=None):
+        """Store a CV from rendered bytes or a cached file; returns its size, or None on failure"""
+        if cached is None and cache_key:
+            cached = pdf_cache.store(cache_key, pdf)
+
+        try:
+            if cached:
+                storage.put_file(cv_key, cached, 'application/pdf')
+                return os.path.getsize(cached)
+            storage.put(cv_key, pdf, 'application/pdf')
+            return len(pdf)
+        except (StorageError, OSError) as e:
+            logging.error(f"Error storing rendered CV as {cv_key}: {str(e)}")
+            return None
+
+    def _record_cv(self, job, template, cv_key, file_size):
+        """Save the generated CV to the database"""
+        cv_data = json.loads(job.cv_data)
+
+        new_cv = CV()
+        new_cv.user_id = job.user_id
+        new_cv.template_id = template.id
+        new_cv.full_name = cv_data['full_name']
+        new_cv.email = cv_data['email']
+        new_cv.phone = cv_data['phone']
+        new_cv.address = cv_data['address']
+        new_cv.summary = cv_data['summary']
+        new_cv.experience = json.dumps(cv_data['experience'])
+        new_cv.education = json.dumps(cv_data['education'])
+        new_cv.skills = json.dumps(cv_data['skills'])
+        new_cv.job_title = current_job_title(cv_data['experience'])
+        new_cv.profile_photo = cv_data.get('profile_photo')
+        new_cv.file_path = cv_key
+        new_cv.file_size = file_size
+        new_cv.is_premium = template.is_premium
+        new_cv.color_scheme = job.color_scheme
+
+        db.session.add(new_cv)
+        db.session.flush()
+        return new_cv
+
+    def _ready_message(self, job, template):
+        """Build the message sent when a CV is ready"""
+        msg = "🎉 Your CV is ready!\n\n"
+        msg += f"Template: {template.name}\n"
+        msg += f"Color: {job.color_scheme.title()}\n"
+        return msg
+
+    def _run(self):
+        while True:
+            try:
+                self._heartbeat()
+            except Exception as e:
+                logging.error(f"Error refreshing render job heartbeats: {str(e)}")
+            self.recover_jobs()
+            time.sleep(self.HEARTBEAT_INTERVAL)
+
+    def _heartbeat(self):
+        """Mark the jobs this process is rendering as still alive"""
+        with self._lock:
+            running = list(self._running)
+        if not running:
+            return
+
+        with self.app.app_context():
+            try:
+                db.session.execute(
+                    update(RenderJob)
+                    .where(RenderJob.id.in_(running), RenderJob.status == 'running',
+                           RenderJob.claimed_by == self.worker_id)
+                    .values(heartbeat_at=datetime.utcnow())
+                )
+                db.session.commit()
+            finally:
+                db.session.remove()
+
+    def recover_jobs(self):
+        """Requeue jobs whose process stopped heartbeating and resubmit everything queued
+
+        Returns how many jobs were resubmitted.
+        """
+        with self.app.app_context():
+            try:
+                stale_before = datetime.utcnow() - self.STALE_AFTER
+                requeued = db.session.execute(
+                    update(RenderJob)
+                    .where(RenderJob.status == 'running',
+                           func.coalesce(RenderJob.heartbeat_at, RenderJob.started_at) < stale_before)
+                    .values(status='queued', claimed_by=None)
+                ).rowcount
+                db.session.commit()
+                if requeued:
+                    logging.warning(f"Requeued {requeued} interrupted render job(s)")
+
+                queued = [job_id for (job_id,) in db.session.query(RenderJob.id)
+                          .filter_by(status='queued').order_by(RenderJob.id).all()]
+                for job_id in queued:
+                    self.submit(job_id)
+
+                if queued:
+                    logging.info(f"Resumed {len(queued)} render job(s)")
+                return len(queued)
+
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Error recovering render jobs: {str(e)}")
+                return 0
+            finally:
+                db.session.remove()
+
+
+@click.command('recover-renders')
+def recover_renders_command():
+    """Resume interrupted and queued render jobs and wait for them to finish"""
+    resumed = render_queue.recover_jobs()
+    render_queue.shutdown()
+    click.echo(f"Resumed {resumed} render job(s)")
+
+
+render_queue = RenderQueue()
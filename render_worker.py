@@ -0,0 +1,63 @@
+"""
+Render worker entry points
+
+Functions in this module run inside the render process pool, so they must not
+import the Flask app or touch the database. They receive plain data and
+render into memory. The caller decides where the bytes go: an HTTP
+response, the PDF cache, or a file.
+"""
+
+import io
+import logging
+import os
+import threading
+
+import cv_templates
+
+
+def init_worker():
+    """Process pool initializer: build the shared stylesheets before the first job arrives"""
+    try:
+        cv_templates.prewarm_styles()
+    except Exception as e:
+        logging.error(f"Error prewarming template styles: {str(e)}")
+
+
+def render_cv_bytes(template_file, cv_data, color_scheme='blue'):
+    """Render a CV into memory and return the PDF bytes, or None on failure"""
+    try:
+        generator = cv_templates.get_generator(template_file)
+        buffer = io.BytesIO()
+
+        if cv_templates.template_info(template_file).supports_color:
+            success = generator.generate(cv_data, buffer, color_scheme=color_scheme)
+        else:
+            success = generator.generate(cv_data, buffer)
+
+        return buffer.getvalue() if success else None
+
+    except Exception as e:
+        logging.error(f"Error rendering CV with {template_file}: {str(e)}")
+        return None
+
+
+def write_pdf(filepath, pdf):
+    """Write PDF bytes so readers never see a partially written file"""
+    tmp_path = f'{filepath}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(pdf)
+    os.replace(tmp_path, filepath)
+
+
+def render_cv(template_file, cv_data, filepath, color_scheme='blue'):
+    """Render a CV to a file and return True on success"""
+    pdf = render_cv_bytes(template_file, cv_data, color_scheme)
+    if pdf is None:
+        return False
+
+    try:
+        write_pdf(filepath, pdf)
+        return True
+    except OSError as e:
+        logging.error(f"Error writing CV to {filepath}: {str(e)}")
+        return False
@@ -0,0 +1,369 @@
+"""
+Retention for generated CVs, profile photos and temporary files
+
+Nothing deleted old files, so disk use on the nodes only grew. A sweeper
+thread now runs every RETENTION_SWEEP_HOURS and:
+
+- expires CVs past the retention for their tier, RETENTION_FREE_DAYS or,
+  when the CV or its owner is premium, RETENTION_PREMIUM_DAYS. The row is
+  kept for the admin history with file_path and profile_photo cleared.
+- deletes orphans, meaning stored CVs and photos that nothing points at any
+  more. References come from CV.file_path, CV.profile_photo, render jobs
+  still waiting and unfinished conversations. A conversation idle for
+  RETENTION_ABANDONED_DAYS is abandoned, and its photo no longer counts.
+  Nothing younger than RETENTION_ORPHAN_GRACE_HOURS is an orphan, so
+  uploads and renders in progress are safe.
+- removes .tmp files left by interrupted writes and media downloads and,
+  with S3 storage, local copies of objects unused for RETENTION_CACHE_DAYS
+
+Deletes go out in batches of RETENTION_BATCH_SIZE (one DeleteObjects call
+on S3). A token bucket holds them to RETENTION_DELETES_PER_SECOND, so the
+first sweep over a large backlog does not swamp the disk or the bucket.
+
+The sweep counts files and bytes in every area it lists, and the admin
+settings page shows that usage. Each process runs its own sweeper. A sweep
+only deletes what is already unreferenced, so overlapping sweeps just
+repeat work.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, or_, select, update
+
+from app import db
+from models import CV, ConversationPatch, ConversationState, RenderJob, User
+from outbound import TokenBucket
+from storage import LocalStorage, is_key, storage
+
+cvs = CV.__table__
+users = User.__table__
+jobs = RenderJob.__table__
+states = ConversationState.__table__
+patches = ConversationPatch.__table__
+
+AREAS = ('cvs', 'photos', 'legacy', 'pdf_cache', 'previews', 'storage_cache')
+LEGACY_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png')
+
+
+def _photo_of(data):
+    try:
+        return (json.loads(data) or {}).get('profile_photo')
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+class RetentionSweeper:
+    # A .tmp file this old belongs to a write that was interrupted
+    TEMP_GRACE = timedelta(hours=1)
+    # S3 DeleteObjects takes at most this many keys
+    MAX_BATCH = 1000
+
+    def __init__(self):
+        self.app = None
+        self.free_days = 30
+        self.premium_days = 365
+        self.abandoned_days = 7
+        self.orphan_grace = timedelta(hours=24)
+        self.cache_days = 7
+        self.interval = 6 * 3600
+        self.batch_size = 100
+        self._bucket = TokenBucket(20, 100)
+        self._sweep_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._report = None
+
+    def init_app(self, app):
+        """Read the retention settings and start the sweeper"""
+        self.app = app
+        self.free_days = app.config['RETENTION_FREE_DAYS']
+        self.premium_days = app.config['RETENTION_PREMIUM_DAYS']
+        self.abandoned_days = app.config['RETENTION_ABANDONED_DAYS']
+        self.orphan_grace = timedelta(hours=app.config['RETENTION_ORPHAN_GRACE_HOURS'])
+        self.cache_days = app.config['RETENTION_CACHE_DAYS']
+        self.interval = app.config['RETENTION_SWEEP_HOURS'] * 3600
+        self.batch_size = max(1, min(app.config['RETENTION_BATCH_SIZE'], self.MAX_BATCH))
+        self._bucket = TokenBucket(app.config['RETENTION_DELETES_PER_SECOND'], self.batch_size)
+
+        # RETENTION_SWEEP_HOURS=0 leaves sweeping to the admin page
+        if self.interval > 0:
+            self._start()
+
+    def request_sweep(self):
+        """Have the sweeper run now instead of at its next scheduled time"""
+        self._start()
+        self._wakeup.set()
+
+    def report(self):
+        """Usage and deletions from the last sweep in this process, or None before the first"""
+        return self._report
+
+    @property
+    def running(self):
+        return self._sweep_lock.locked()
+
+    def sweep(self):
+        """Expire old CVs, delete orphans and temp files, and measure disk usage"""
+        if not self._sweep_lock.acquire(blocking=False):
+            return None
+
+        try:
+            started = time.monotonic()
+            report = {
+                'started_at': datetime.utcnow(),
+                'usage': {area: {'files': 0, 'bytes': 0} for area in AREAS},
+                'deleted': {'expired_cvs': 0, 'orphans': 0, 'temp_files': 0, 'cache_copies': 0},
+                'freed_bytes': 0,
+                'errors': 0,
+            }
+
+            try:
+                self._expire_cvs(report)
+            except Exception as e:
+                logging.error(f"Error expiring old CVs: {str(e)}")
+                report['errors'] += 1
+
+            try:
+                references = self._references()
+            except Exception as e:
+                # Without the references nothing can be called an orphan, so only measure
+                logging.error(f"Error loading file references, not deleting orphans: {str(e)}")
+                report['errors'] += 1
+                references = None
+
+            steps = [
+                ('stored CVs', lambda: self._sweep_objects('cvs/', 'cvs', references, report)),
+                ('stored photos', lambda: self._sweep_objects('photos/', 'photos', references, report)),
+                ('legacy files', lambda: self._sweep_legacy(references, report)),
+                ('local caches', lambda: self._sweep_caches(report)),
+                ('temp files', lambda: self._sweep_temp(report)),
+            ]
+            for name, step in steps:
+                try:
+                    step()
+                except Exception as e:
+                    logging.error(f"Error sweeping {name}: {str(e)}")
+                    report['errors'] += 1
+
+            report['finished_at'] = datetime.utcnow()
+            report['seconds'] = round(time.monotonic() - started, 2)
+            self._report = report
+
+            deleted = sum(report['deleted'].values())
+            logging.info(f"Retention sweep deleted {deleted} file(s), freeing "
+                         f"{report['freed_bytes'] / (1024 * 1024):.1f} MB, in {report['seconds']}s")
+            return report
+        finally:
+            self._sweep_lock.release()
+
+    def _expire_cvs(self, report):
+        """Clear CVs older than their tier's retention and delete their files"""
+        now = datetime.utcnow()
+        premium = or_(func.coalesce(cvs.c.is_premium, False), func.coalesce(users.c.is_premium, False))
+        cutoff = case(
+            (premium, now - timedelta(days=self.premium_days)),
+            else_=now - timedelta(days=self.free_days)
+        )
+        expired = (
+            select(cvs.c.id, cvs.c.file_path, cvs.c.file_size)
+            .select_from(cvs.join(users, users.c.id == cvs.c.user_id))
+            .where(cvs.c.file_path.isnot(None), cvs.c.created_at < cutoff)
+            .order_by(cvs.c.id)
+            .limit(self.batch_size)
+        )
+
+        while True:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    rows = conn.execute(expired).all()
+                    if rows:
+                        conn.execute(
+                            update(cvs)
+                            .where(cvs.c.id.in_([row.id for row in rows]))
+                            .values(file_path=None, profile_photo=None)
+                        )
+
+            # The rows are cleared first, so a failed delete leaves an orphan for the next sweep
+            self._delete([(row.file_path, row.file_size or 0) for row in rows], storage.delete_many,
+                         report, 'expired_cvs')
+            if len(rows) < self.batch_size:
+                return
+
+    def _references(self):
+        """Every stored key, and legacy path made absolute, that something still points at"""
+        active_since = datetime.utcnow() - timedelta(days=self.abandoned_days)
+        with self.app.app_context():
+            with db.engine.connect() as conn:
+                names = set(conn.execute(select(cvs.c.file_path).where(cvs.c.file_path.isnot(None))).scalars())
+                names.update(conn.execute(
+                    select(cvs.c.profile_photo).where(cvs.c.profile_photo.isnot(None))
+                ).scalars())
+
+                for data in conn.execute(
+                    select(jobs.c.cv_data).where(jobs.c.status.in_(('queued', 'running')))
+                ).scalars():
+                    names.add(_photo_of(data))
+
+                # Photos of conversations still in progress, folded or still in the patch log
+                for data in conn.execute(select(states.c.data).where(states.c.updated_at >= active_since)).scalars():
+                    names.add(_photo_of(data))
+                for value in conn.execute(
+                    select(patches.c.value)
+                    .select_from(patches.join(states, states.c.phone_number == patches.c.phone_number))
+                    .where(patches.c.field == 'profile_photo', states.c.updated_at >= active_since)
+                ).scalars():
+                    try:
+                        names.add(json.loads(value))
+                    except (TypeError, ValueError):
+                        continue
+
+        return {name if is_key(name) else os.path.abspath(name) for name in names if isinstance(name, str) and name}
+
+    def _sweep_objects(self, prefix, area, references, report):
+        """Measure the stored objects under a prefix and delete the orphans"""
+        orphaned_before = time.time() - self.orphan_grace.total_seconds()
+        pending = []
+        for key, size, modified in storage.list(prefix):
+            if references is not None and key not in references and modified < orphaned_before:
+                pending.append((key, size))
+                if len(pending) >= self.batch_size:
+                    self._delete(pending, storage.delete_many, report, 'orphans', area)
+                    pending = []
+            else:
+                self._count(report, area, size)
+        self._delete(pending, storage.delete_many, report, 'orphans', area)
+
+    def _sweep_legacy(self, references, report):
+        """Measure files saved before storage keys and delete the ones no row points at"""
+        config = self.app.config
+        # Folders of their own that sit inside the legacy ones
+        own = {os.path.abspath(config[name])
+               for name in ('PDF_CACHE_FOLDER', 'PREVIEW_FOLDER', 'STORAGE_CACHE_FOLDER', 'STORAGE_FOLDER', 'MEDIA_FOLDER')}
+        files = self._files(config['CV_FOLDER'], skip=own) + self._files(config['UPLOAD_FOLDER'], skip=own)
+        orphaned_before = time.time() - self.orphan_grace.total_seconds()
+
+        pending = []
+        for path, size, modified in files:
+            if path.endswith('.tmp'):
+                continue
+            if (references is not None and path not in references and modified < orphaned_before
+                    and path.lower().endswith(LEGACY_EXTENSIONS)):
+                pending.append((path, size))
+                if len(pending) >= self.batch_size:
+                    self._delete(pending, storage.delete_many, report, 'orphans', 'legacy')
+                    pending = []
+            else:
+                self._count(report, 'legacy', size)
+        self._delete(pending, storage.delete_many, report, 'orphans', 'legacy')
+
+    def _sweep_caches(self, report):
+        """Measure the PDF and preview caches, and drop stale local copies of S3 objects"""
+        config = self.app.config
+        for area, folder in (('pdf_cache', config['PDF_CACHE_FOLDER']), ('previews', config['PREVIEW_FOLDER'])):
+            for path, size, _ in self._files(folder):
+                if not path.endswith('.tmp'):
+                    self._count(report, area, size)
+
+        if storage.is_local:
+            return
+        cache = LocalStorage(config['STORAGE_CACHE_FOLDER'])
+        unused_before = time.time() - self.cache_days * 86400
+        pending = []
+        for key, size, used in cache.list():
+            if used < unused_before:
+                pending.append((key, size))
+                if len(pending) >= self.batch_size:
+                    self._delete(pending, cache.delete_many, report, 'cache_copies', 'storage_cache')
+                    pending = []
+            else:
+                self._count(report, 'storage_cache', size)
+        self._delete(pending, cache.delete_many, report, 'cache_copies', 'storage_cache')
+
+    def _sweep_temp(self, report):
+        """Delete .tmp files from writes that never finished"""
+        config = self.app.config
+        folders = {os.path.abspath(config[name])
+                   for name in ('CV_FOLDER', 'UPLOAD_FOLDER', 'PDF_CACHE_FOLDER', 'PREVIEW_FOLDER', 'STORAGE_CACHE_FOLDER',
+                                'MEDIA_FOLDER')}
+        if storage.is_local:
+            folders.add(storage.backend.root)
+
+        abandoned_before = time.time() - self.TEMP_GRACE.total_seconds()
+        # Nested folders are walked once, as part of the outermost one
+        outermost = [f for f in folders if not any(f.startswith(other + os.sep) for other in folders)]
+        stale = [(path, size) for folder in outermost for path, size, modified in self._files(folder)
+                 if path.endswith('.tmp') and modified < abandoned_before]
+        for start in range(0, len(stale), self.batch_size):
+            self._delete(stale[start:start + self.batch_size], self._unlink_all, report, 'temp_files')
+
+    def _delete(self, batch, delete_many, report, outcome, area=None):
+        """Delete a batch at the configured rate; what could not be deleted still counts as usage"""
+        if not batch:
+            return
+        for _ in batch:
+            self._bucket.acquire()
+
+        failed = set(delete_many([name for name, _ in batch]))
+        for name, size in batch:
+            if name in failed:
+                report['errors'] += 1
+                if area:
+                    self._count(report, area, size)
+            else:
+                report['deleted'][outcome] += 1
+                report['freed_bytes'] += size
+
+    def _count(self, report, area, size):
+        report['usage'][area]['files'] += 1
+        report['usage'][area]['bytes'] += size
+
+    def _files(self, folder, skip=()):
+        """(absolute path, size, mtime) of every file under a folder, leaving out the skipped subfolders"""
+        found = []
+        for directory, subdirs, files in os.walk(os.path.abspath(folder)):
+            subdirs[:] = [d for d in subdirs if os.path.join(directory, d) not in skip]
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((path, stat.st_size, stat.st_mtime))
+        return found
+
+    def _unlink_all(self, paths):
+        failed = []
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logging.error(f"Error deleting {path}: {str(e)}")
+                failed.append(path)
+        return failed
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='retention-sweep', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        # Stagger the first sweep so processes started together do not all sweep at once
+        self._wakeup.wait(random.uniform(60, 600))
+        while True:
+            self._wakeup.clear()
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"Error in retention sweep: {str(e)}")
+            self._wakeup.wait(self.interval if self.interval > 0 else None)
+
+
+retention = RetentionSweeper()
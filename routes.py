@@ -4,6 +4,13 @@ import logging
 from datetime import datetime
 
 from whatsapp_bot import WhatsAppBot
+from message_dedup import message_deduplicator
+from message_lock import phone_locks, LockTimeout
+from conversation_store import conversation_store
+from pdf_cache import pdf_cache
+from outbound import outbound
+from downloads import cv_downloads
+from media_fetcher import attachments, media_fetcher
 
 main_bp = Blueprint('main', __name__)
 bot = WhatsAppBot()
@@ -19,15 +26,27 @@ def webhook():
         # Get the message data
         incoming_msg = request.form.get('Body', '').strip()
         from_number = request.form.get('From', '')
-        media_url = request.form.get('MediaUrl0', '')
+        media = attachments(request.form)
+        message_sid = request.form.get('MessageSid', '')
         
-        logging.info(f"Received message from {from_number}: {incoming_msg}")
+        logging.info(f"Received message from {from_number}: {incoming_msg} ({len(media)} attachment(s))")
         
         # Create Twilio response object
         response = MessagingResponse()
         
-        # Process the message through the bot
-        reply_message = bot.process_message(from_number, incoming_msg, media_url)
+        # Handle one message per phone number at a time, in arrival order
+        phone_number = from_number.replace('whatsapp:', '').strip()
+        with phone_locks.hold(phone_number):
+            # Twilio retries slow deliveries; answer repeats from the stored reply
+            if message_sid:
+                cached_reply = message_deduplicator.lookup(message_sid)
+                if cached_reply is not None:
+                    logging.info(f"Duplicate delivery of {message_sid}")
+                    response.message().body(cached_reply)
+                    return str(response)
+            
+            # Process the message through the bot
+            reply_message = bot.process_message(from_number, incoming_msg, media, message_sid)
         
         # Add the reply to the response
         msg = response.message()
@@ -37,6 +56,12 @@ def webhook():
         
         return str(response)
     
+    except LockTimeout:
+        # An earlier message from this number is still being handled. Twilio only
+        # redelivers on a non-2xx status, and the MessageSid dedup makes that safe.
+        logging.warning(f"Timed out waiting for lock on {from_number}")
+        return str(MessagingResponse()), 503
+    
     except Exception as e:
         logging.error(f"Error in webhook: {str(e)}")
         response = MessagingResponse()
@@ -44,10 +69,20 @@ def webhook():
         msg.body("Sorry, something went wrong. Please try again later.")
         return str(response)
 
+@main_bp.route('/cv/<path:name>')
+def download_cv(name):
+    """Serve a generated CV from a signed, expiring link"""
+    return cv_downloads.response(name)
+
 @main_bp.route('/status')
 def status():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'service': 'WhatsApp CV Maker Bot'
+        'service': 'WhatsApp CV Maker Bot',
+        'phone_locks': phone_locks.stats(),
+        'state_cache': conversation_store.cache.stats(),
+        'pdf_cache': pdf_cache.stats(),
+        'outbox': outbound.stats(),
+        'media': media_fetcher.stats()
     })
@@ -0,0 +1,301 @@
+"""
+Benchmark CV rendering across templates, colour schemes and CV sizes
+
+Every template is rendered with every colour scheme it supports, with a
+small, a typical and a huge synthetic CV, and, for templates that show a
+profile photo, with and without one. Templates without colour schemes
+render the same PDF for every colour, so they are measured once.
+
+For each combination the script records:
+
+  wall_ms      median render time over --iterations rounds
+  wall_min_ms  fastest render, used for baseline comparisons
+  peak_kb      peak Python memory during one render (tracemalloc)
+  pages        page count of the PDF
+  bytes        size of the PDF
+
+Renders run in this process through render_worker.render_cv_bytes, after one
+warm-up render per template, so imports and stylesheet setup are excluded.
+Each round renders every combination once, so a slow spell on a busy machine
+is spread over all combinations instead of skewing a few. The garbage
+collector is paused during timed renders, as timeit does.
+
+With --baseline, results are compared with an earlier --output file. The
+script exits non-zero if a render that worked in the baseline now fails, or
+if any combination got slower, or used more memory, by more than --threshold
+percent. Wall time changes under --min-delta-ms are ignored as timer noise.
+Renders that already failed in the baseline are listed as known failures.
+Without a baseline, any failed render makes the script exit non-zero.
+
+Usage:
+    python scripts/bench_render.py [--iterations N] [--output FILE]
+                                   [--baseline FILE] [--threshold PCT] [--min-delta-ms MS]
+                                   [--templates template1,template5] [--sizes small,typical]
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv_templates
+import render_worker
+
+SIZES = ('small', 'typical', 'huge')
+
+# Metrics compared against the baseline
+COMPARED = {'wall_min_ms': 'wall time', 'peak_kb': 'peak memory'}
+
+PAGE = re.compile(rb'/Type\s*/Page(?!s)')
+
+BULLETS = [
+    'Led the migration of the settlement platform to an event-driven design.',
+    'Cut month-end reconciliation time from five days to one.',
+    'Mentored six engineers, three of whom were promoted.',
+    'Increased test coverage from 40% to 85% across core services.',
+    'Negotiated vendor contracts saving $120,000 a year.',
+    'Introduced on-call runbooks that halved incident resolution time.',
+]
+
+
+def experience_entry(i, bullets):
+    return {
+        'title': f'Senior Engineer {i}',
+        'company': f'Company {i} Holdings',
+        'period': f'Jan {2020 - i} - Dec {2021 - i}',
+        'bullets': [BULLETS[j % len(BULLETS)] for j in range(bullets)],
+    }
+
+
+def education_entry(i):
+    return {
+        'degree': f'BSc Computer Science {i}',
+        'institution': f'University {i}',
+        'period': str(2010 - i),
+        'details': ['First class honours'],
+    }
+
+
+def synthetic_cv(size):
+    """A CV with the given amount of content"""
+    entries, bullets, qualifications, skills, summary = {
+        'small': (1, 1, 1, 3, 1),
+        'typical': (3, 3, 2, 10, 3),
+        'huge': (25, 6, 8, 60, 20),
+    }[size]
+
+    return {
+        'full_name': 'Jane Doe',
+        'email': 'jane.doe@example.com',
+        'phone': '+263 77 123 4567',
+        'address': '12 Samora Machel Avenue, Harare, Zimbabwe',
+        'summary': ' '.join(['Engineer who builds reliable payment and messaging systems.'] * summary),
+        'experience': [experience_entry(i, bullets) for i in range(entries)],
+        'education': [education_entry(i) for i in range(qualifications)],
+        'skills': [f'Skill {i}' for i in range(skills)],
+        'profile_photo': None,
+    }
+
+
+def synthetic_photo(directory):
+    """A JPEG like the ones profile_photos stores"""
+    from PIL import Image
+
+    edge = cv_templates.photo_pixels()
+    image = Image.linear_gradient('L').resize((edge, edge)).convert('RGB')
+    path = os.path.join(directory, 'photo.jpg')
+    image.save(path, 'JPEG', quality=85)
+    return path
+
+
+def combinations(templates, sizes, photo_path):
+    for template_name in templates:
+        info = cv_templates.template_info(template_name)
+        for color_scheme in info.color_schemes or [None]:
+            for size in sizes:
+                for photo in ([False, True] if info.photo_size and photo_path else [False]):
+                    yield template_name, color_scheme, size, photo
+
+
+def time_render(template_name, color_scheme, cv_data):
+    """Render once with the collector paused; returns (seconds, PDF bytes or None)"""
+    gc.collect()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        pdf = render_worker.render_cv_bytes(template_name, cv_data, color_scheme or 'blue')
+        return time.perf_counter() - started, pdf
+    finally:
+        gc.enable()
+
+
+def peak_memory(template_name, color_scheme, cv_data):
+    """Peak traced memory in bytes during one render"""
+    tracemalloc.start()
+    try:
+        render_worker.render_cv_bytes(template_name, cv_data, color_scheme or 'blue')
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(cases, rounds):
+    """Time every case once per round; returns a result dict per case"""
+    timings = [[] for _ in cases]
+    pdfs = [None] * len(cases)
+    failed = set()
+
+    for _ in range(rounds):
+        for i, (template_name, color_scheme, size, photo, cv_data) in enumerate(cases):
+            if i in failed:
+                continue
+            elapsed, pdf = time_render(template_name, color_scheme, cv_data)
+            if pdf is None:
+                failed.add(i)
+                continue
+            timings[i].append(elapsed)
+            pdfs[i] = pdf
+
+    results = []
+    for i, (template_name, color_scheme, size, photo, cv_data) in enumerate(cases):
+        result = {'template': template_name, 'color_scheme': color_scheme, 'size': size, 'photo': photo}
+        if i in failed:
+            result['error'] = 'render failed'
+        else:
+            # Measured separately, since tracing slows the render down
+            peak = peak_memory(template_name, color_scheme, cv_data)
+            result.update({
+                'wall_ms': round(statistics.median(timings[i]) * 1000, 2),
+                'wall_min_ms': round(min(timings[i]) * 1000, 2),
+                'peak_kb': round(peak / 1024, 1),
+                'pages': len(PAGE.findall(pdfs[i])),
+                'bytes': len(pdfs[i]),
+            })
+        results.append(result)
+    return results
+
+
+def result_key(result):
+    return (result['template'], result['color_scheme'], result['size'], result['photo'])
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Regressions against the baseline, as a list of strings"""
+    previous = {result_key(r): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get(result_key(result))
+        if result.get('error'):
+            if not before or not before.get('error'):
+                regressions.append(f"{describe(result)}: {result['error']}")
+            continue
+
+        if not before or before.get('error'):
+            continue
+
+        for metric, label in COMPARED.items():
+            if not before[metric] or result[metric] <= before[metric] * (1 + threshold / 100):
+                continue
+            if metric == 'wall_min_ms' and result[metric] - before[metric] <= min_delta_ms:
+                continue
+            change = (result[metric] / before[metric] - 1) * 100
+            regressions.append(f"{describe(result)}: {label} {before[metric]} -> {result[metric]} (+{change:.0f}%)")
+    return regressions
+
+
+def describe(result):
+    photo = ' +photo' if result['photo'] else ''
+    return f"{result['template']} {result['color_scheme'] or '-'} {result['size']}{photo}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=5, help='timed rounds over all combinations')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=25.0, help='allowed regression in percent')
+    parser.add_argument('--min-delta-ms', type=float, default=10.0,
+                        help='wall time regressions smaller than this are ignored as noise')
+    parser.add_argument('--templates', help='comma-separated templates to run (default: all)')
+    parser.add_argument('--sizes', help=f"comma-separated CV sizes to run (default: {','.join(SIZES)})")
+    parser.add_argument('--no-photo', action='store_true', help='skip the renders with a profile photo')
+    args = parser.parse_args()
+
+    templates = args.templates.split(',') if args.templates else list(cv_templates.TEMPLATES)
+    sizes = args.sizes.split(',') if args.sizes else list(SIZES)
+    unknown = set(sizes) - set(SIZES)
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        photo_path = None if args.no_photo else synthetic_photo(directory)
+
+        for template_name in templates:
+            # Warm up: import the template and build its stylesheets
+            render_worker.render_cv_bytes(template_name, synthetic_cv('small'))
+
+        cases = []
+        for template_name, color_scheme, size, photo in combinations(templates, sizes, photo_path):
+            cv_data = synthetic_cv(size)
+            if photo:
+                cv_data['profile_photo'] = photo_path
+            cases.append((template_name, color_scheme, size, photo, cv_data))
+
+        print(f"rendering {len(cases)} combinations x {args.iterations} rounds...")
+        results = run(cases, args.iterations)
+
+    print(f"\n{'template':<12} {'colour':<8} {'size':<8} {'photo':<6} {'median ms':>10} {'min ms':>8} "
+          f"{'peak KB':>9} {'pages':>6} {'bytes':>9}")
+    for r in results:
+        row = f"{r['template']:<12} {r['color_scheme'] or '-':<8} {r['size']:<8} {'yes' if r['photo'] else 'no':<6}"
+        if r.get('error'):
+            print(f"{row} FAILED")
+        else:
+            print(f"{row} {r['wall_ms']:>10} {r['wall_min_ms']:>8} {r['peak_kb']:>9} {r['pages']:>6} {r['bytes']:>9}")
+
+    report = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'iterations': args.iterations,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nwrote {len(results)} results to {args.output}")
+
+    failed = [r for r in results if r.get('error')]
+    if failed:
+        print(f"\n{len(failed)} render(s) failed:")
+        for result in failed:
+            print(f"  {describe(result)}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:g}% against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nno regressions over {args.threshold:g}% against {args.baseline}")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
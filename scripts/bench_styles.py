@@ -0,0 +1,69 @@
+"""
+Measure per-render stylesheet setup cost for every CV template
+
+For each template and colour scheme, the script compares setting up a
+generator with an empty stylesheet cache (what every render used to pay)
+with setting one up once the shared stylesheet exists.
+
+Usage:
+    python scripts/bench_styles.py [--iterations N] [--json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv_templates
+from cv_templates.stylesheets import clear_stylesheets
+
+
+def time_setup(generator_class, color_scheme, iterations, cold):
+    """Average seconds to construct a generator and load its styles"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        if cold:
+            clear_stylesheets()
+        generator = generator_class()
+        generator.load_styles(color_scheme)
+    return (time.perf_counter() - started) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200, help='setups per measurement')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    results = []
+    for template_name, info in cv_templates.TEMPLATES.items():
+        generator_class = cv_templates.get_template_generator(template_name)
+        for color_scheme in info.color_schemes or [None]:
+            cold = time_setup(generator_class, color_scheme, args.iterations, cold=True)
+            warm = time_setup(generator_class, color_scheme, args.iterations, cold=False)
+            results.append({
+                'template': template_name,
+                'color_scheme': color_scheme or '-',
+                'uncached_us': round(cold * 1e6, 1),
+                'cached_us': round(warm * 1e6, 1),
+                'speedup': round(cold / warm, 1) if warm else None
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'template':<12} {'colour':<8} {'uncached µs':>12} {'cached µs':>10} {'speedup':>8}")
+    for r in results:
+        print(f"{r['template']:<12} {r['color_scheme']:<8} {r['uncached_us']:>12} {r['cached_us']:>10} {r['speedup']:>7}x")
+
+    total_cold = sum(r['uncached_us'] for r in results) / len(results)
+    total_warm = sum(r['cached_us'] for r in results) / len(results)
+    print(f"\nmean setup per render: {total_cold:.1f} µs uncached, {total_warm:.1f} µs cached")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Count database writes per inbound webhook message
+
+Drives a full CV conversation through the webhook against a throwaway SQLite
+database. Every INSERT/UPDATE/DELETE is recorded, and the script reports how
+many statements and which tables each message wrote. The CV is never
+finalised, so no render is queued. Writes made by background threads (the
+render queue's startup recovery, the last_active flusher) are counted against
+whichever message is in flight when they run.
+
+Usage:
+    python scripts/bench_webhook_writes.py [--json]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from collections import Counter
+
+CONVERSATION = [
+    'hi',
+    '1',
+    'Jane Doe',
+    'jane@example.com',
+    '+263 77 123 4567',
+    'Harare, Zimbabwe',
+    'Experienced engineer who ships reliable software.',
+    'Software Engineer at Acme\nJan 2020 - Present\nBuilt and ran payment services.',
+    'Junior Developer at Beta\nMar 2017 - Dec 2019\nMaintained internal tools.',
+    'done',
+    'BSc Computer Science from University of Zimbabwe\n2016',
+    'done',
+    'Python, SQL, Leadership',
+]
+
+WRITE_PATTERN = re.compile(r'^\s*(INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+"?(\w+)"?', re.IGNORECASE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_writes_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from sqlalchemy import event
+    from app import app, db
+
+    writes = []
+
+    with app.app_context():
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def record_write(conn, cursor, statement, parameters, context, executemany):
+            match = WRITE_PATTERN.match(statement)
+            if match:
+                writes.append(match.group(2))
+
+    client = app.test_client()
+    results = []
+    for index, body in enumerate(CONVERSATION):
+        writes.clear()
+        client.post('/webhook', data={
+            'Body': body,
+            'From': 'whatsapp:+263771234567',
+            'MessageSid': f'SMbench{index:04d}'
+        })
+        tables = Counter(writes)
+        results.append({'message': body.split('\n')[0][:40], 'writes': len(writes), 'tables': dict(tables)})
+
+    total = sum(r['writes'] for r in results)
+    users_writes = sum(r['tables'].get('users', 0) for r in results)
+    summary = {
+        'messages': len(results),
+        'total_writes': total,
+        'writes_per_message': round(total / len(results), 2),
+        'users_row_writes': users_writes,
+    }
+
+    if args.json:
+        print(json.dumps({'messages': results, 'summary': summary}, indent=2))
+        return
+
+    for r in results:
+        tables = ', '.join(f"{table}={count}" for table, count in sorted(r['tables'].items()))
+        print(f"{r['message']:<42} {r['writes']:>3}  {tables}")
+    print()
+    print(f"{summary['messages']} messages, {summary['total_writes']} writes, "
+          f"{summary['writes_per_message']} per message, {summary['users_row_writes']} users row writes")
+
+
+if __name__ == '__main__':
+    main()
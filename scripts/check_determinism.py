@@ -0,0 +1,20 @@
+"""
+Check that every CV template renders byte-identical PDFs
+
+Runs tests/test_determinism.py, which renders each template in each colour
+scheme twice in one process and once in a freshly spawned one, and compares
+the SHA-256 of every PDF. Exits non-zero if any render differs or fails.
+
+Usage:
+    python scripts/check_determinism.py [pytest options]
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([os.path.join(ROOT, 'tests', 'test_determinism.py'), *sys.argv[1:]]))
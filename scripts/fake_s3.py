@@ -0,0 +1,241 @@
+"""
+Local stand-in for an S3-compatible object store
+
+Implements the object calls storage.S3Storage makes, with path-style URLs
+(/<bucket>/<key>) and objects kept in memory:
+
+    PUT     store an object
+    GET     read it, including Range requests and presigned URLs
+    HEAD    size and ETag
+    DELETE  remove it
+
+and, on the bucket (/<bucket>), ListObjectsV2 (GET ?list-type=2, paged by
+--page-size) and DeleteObjects (POST ?delete).
+
+Requests must carry SigV4 credentials for --access-key, either in the
+Authorization header or as a presigned query. Signatures are not checked,
+so use real S3 or MinIO to test signing. Run the app against it with:
+
+    python scripts/fake_s3.py --port 9000
+    STORAGE_BACKEND=s3 S3_ENDPOINT_URL=http://127.0.0.1:9000 S3_BUCKET=cvs \\
+        S3_ACCESS_KEY_ID=test S3_SECRET_ACCESS_KEY=test python main.py
+
+GET / lists the stored keys with their sizes.
+"""
+
+import argparse
+import base64
+import calendar
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+NS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+
+class FakeS3:
+    """Objects by (bucket, key), shared by the handler threads"""
+
+    def __init__(self, access_key, page_size=1000, quiet=False):
+        self.access_key = access_key
+        self.page_size = page_size
+        self.quiet = quiet
+        self.objects = {}
+        self.lock = threading.Lock()
+
+    def authorised(self, headers, query):
+        credential = ''
+        authorization = headers.get('Authorization', '')
+        if authorization.startswith('AWS4-HMAC-SHA256 '):
+            match = re.search(r'Credential=([^,]+)', authorization)
+            credential = match.group(1) if match else ''
+        elif 'X-Amz-Signature' in query:
+            credential = query.get('X-Amz-Credential', [''])[0]
+            expires = int(query.get('X-Amz-Expires', ['0'])[0])
+            signed_at = calendar.timegm(time.strptime(query.get('X-Amz-Date', [''])[0], '%Y%m%dT%H%M%SZ'))
+            if signed_at + expires < time.time():
+                return False
+        return credential.split('/')[0] == self.access_key
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _target(self):
+            url = urlsplit(self.path)
+            bucket, _, key = unquote(url.path).lstrip('/').partition('/')
+            return bucket, key, parse_qs(url.query, keep_blank_values=True)
+
+        def _check(self, bucket_call=None):
+            """(bucket, key) of an authorised object request, or the bucket for a bucket_call query"""
+            bucket, key, query = self._target()
+            if not fake.authorised(self.headers, query):
+                self._reply(403, b'<Error><Code>AccessDenied</Code></Error>')
+                return None
+            if bucket and not key and bucket_call in query:
+                return bucket, query
+            if not bucket or not key:
+                self._reply(400, b'<Error><Code>InvalidRequest</Code></Error>')
+                return None
+            return bucket, key
+
+        def do_PUT(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length)
+            target = self._check()
+            if target is None:
+                return
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            with fake.lock:
+                fake.objects[target] = {
+                    'body': body,
+                    'etag': etag,
+                    'content_type': self.headers.get('Content-Type', 'binary/octet-stream'),
+                    'modified': time.time(),
+                }
+            self._reply(200, b'', {'ETag': etag})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length)
+            target = self._check(bucket_call='delete')
+            if target is None:
+                return
+            bucket, _ = target
+            if self.headers.get('Content-MD5') != base64.b64encode(hashlib.md5(body).digest()).decode():
+                return self._reply(400, b'<Error><Code>InvalidDigest</Code></Error>')
+
+            keys = [element.text for element in ET.fromstring(body).iter('Key')]
+            with fake.lock:
+                for key in keys:
+                    fake.objects.pop((bucket, key), None)
+            self._reply(200, f'<DeleteResult xmlns="{NS}"></DeleteResult>'.encode(), {'Content-Type': 'application/xml'})
+
+        def do_GET(self):
+            if urlsplit(self.path).path == '/':
+                with fake.lock:
+                    listing = {f'{bucket}/{key}': len(obj['body']) for (bucket, key), obj in fake.objects.items()}
+                return self._reply(200, json.dumps(listing).encode(), {'Content-Type': 'application/json'})
+            if not self._target()[1]:
+                return self._list()
+            self._get(send_body=True)
+
+        def _list(self):
+            target = self._check(bucket_call='list-type')
+            if target is None:
+                return
+            bucket, query = target
+            prefix = query.get('prefix', [''])[0]
+            after = query.get('continuation-token', [''])[0]
+            with fake.lock:
+                keys = sorted((key, obj) for (name, key), obj in fake.objects.items()
+                              if name == bucket and key.startswith(prefix) and key > after)
+
+            page, truncated = keys[:fake.page_size], len(keys) > fake.page_size
+            contents = ''.join(
+                f"<Contents><Key>{escape(key)}</Key>"
+                f"<LastModified>{time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(obj['modified']))}</LastModified>"
+                f"<Size>{len(obj['body'])}</Size></Contents>"
+                for key, obj in page
+            )
+            token = f"<NextContinuationToken>{escape(page[-1][0])}</NextContinuationToken>" if truncated else ''
+            body = (f'<ListBucketResult xmlns="{NS}"><Name>{bucket}</Name><Prefix>{escape(prefix)}</Prefix>'
+                    f'<KeyCount>{len(page)}</KeyCount><IsTruncated>{str(truncated).lower()}</IsTruncated>'
+                    f'{token}{contents}</ListBucketResult>')
+            self._reply(200, body.encode(), {'Content-Type': 'application/xml'})
+
+        def do_HEAD(self):
+            self._get(send_body=False)
+
+        def do_DELETE(self):
+            target = self._check()
+            if target is None:
+                return
+            with fake.lock:
+                fake.objects.pop(target, None)
+            self._reply(204, b'')
+
+        def _get(self, send_body):
+            target = self._check()
+            if target is None:
+                return
+            with fake.lock:
+                obj = fake.objects.get(target)
+            if obj is None:
+                return self._reply(404, b'<Error><Code>NoSuchKey</Code></Error>', send_body=send_body)
+
+            headers = {
+                'Content-Type': obj['content_type'],
+                'ETag': obj['etag'],
+                'Last-Modified': formatdate(obj['modified'], usegmt=True),
+                'Accept-Ranges': 'bytes',
+            }
+            if self.headers.get('If-None-Match') == obj['etag']:
+                return self._reply(304, b'', headers, send_body=False)
+
+            body, status = obj['body'], 200
+            match = RANGE.match(self.headers.get('Range', ''))
+            if match and (match.group(1) or match.group(2)):
+                size = len(body)
+                if match.group(1):
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                else:
+                    start, end = max(0, size - int(match.group(2))), size - 1
+                if start > end:
+                    return self._reply(416, b'', {'Content-Range': f'bytes */{size}'}, send_body=send_body)
+                body, status = body[start:end + 1], 206
+                headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+            self._reply(status, body, headers, send_body=send_body)
+
+        def _reply(self, status, body, headers=None, send_body=True):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if status != 304 and status != 204:
+                self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if send_body and body:
+                self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            if not fake.quiet:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--access-key', default='test', help='access key ID requests must be signed with')
+    parser.add_argument('--page-size', type=int, default=1000, help='keys per ListObjectsV2 page')
+    parser.add_argument('--quiet', action='store_true', help='do not log every request')
+    args = parser.parse_args()
+
+    fake = FakeS3(args.access_key, args.page_size, args.quiet)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(fake))
+    print(f"fake S3 API listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    print(f"holding {len(fake.objects)} object(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+Local stand-in for the Twilio Messages API
+
+Accepts POST /2010-04-01/Accounts/<sid>/Messages.json like Twilio does, so
+the outbound dispatcher can be exercised without sending real messages:
+
+    python scripts/fake_twilio.py --port 8099 --fail-rate 0.2
+    TWILIO_API_BASE=http://127.0.0.1:8099 TWILIO_ACCOUNT_SID=ACtest \\
+        TWILIO_AUTH_TOKEN=secret TWILIO_PHONE_NUMBER=whatsapp:+14155238886 python main.py
+
+Failures can be injected to check the retry and throttling paths:
+
+  --fail-rate     fraction of requests answered with 500
+  --limit         messages per second allowed per sender; anything over it
+                  is answered with 429 and Retry-After, as Twilio does
+  --latency-ms    delay before every response
+  --invalid       recipient numbers answered with 400 (code 21211)
+
+GET /messages lists what was accepted and GET /stats counts the responses.
+"""
+
+import argparse
+import base64
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+MESSAGES_PATH = re.compile(r'^/2010-04-01/Accounts/(?P<sid>\w+)/Messages\.json$')
+
+
+class FakeTwilio:
+    """Accepted messages and response counters, shared by the handler threads"""
+
+    def __init__(self, args):
+        self.args = args
+        self.messages = []
+        self.responses = Counter()
+        self.recent = defaultdict(deque)  # sender -> send times in the last second
+        self.lock = threading.Lock()
+
+    def handle(self, sid, auth, form):
+        """Return (status, body dict, headers) for a Messages POST"""
+        if self.args.auth_token and auth != (sid, self.args.auth_token):
+            return 401, {'code': 20003, 'message': 'Authenticate'}, {}
+
+        sender, recipient = form.get('From', ''), form.get('To', '')
+        if not sender or not recipient:
+            return 400, {'code': 21604, 'message': "A 'To' and 'From' phone number is required"}, {}
+        if recipient.replace('whatsapp:', '') in self.args.invalid:
+            return 400, {'code': 21211, 'message': f"The 'To' number {recipient} is not a valid phone number"}, {}
+
+        if random.random() < self.args.fail_rate:
+            return 500, {'code': 20500, 'message': 'Internal Server Error'}, {}
+
+        with self.lock:
+            if self.args.limit:
+                now = time.monotonic()
+                recent = self.recent[sender]
+                while recent and recent[0] <= now - 1:
+                    recent.popleft()
+                if len(recent) >= self.args.limit:
+                    return 429, {'code': 20429, 'message': 'Too Many Requests'}, {'Retry-After': '1'}
+                recent.append(now)
+
+            message = {
+                'sid': f'SM{uuid.uuid4().hex}',
+                'account_sid': sid,
+                'from': sender,
+                'to': recipient,
+                'body': form.get('Body', ''),
+                'media_url': form.get('MediaUrl'),
+                'status': 'queued',
+                'received_at': time.time(),
+            }
+            self.messages.append(message)
+        return 201, message, {}
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+        def do_POST(self):
+            match = MESSAGES_PATH.match(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+            if not match:
+                return self._reply(404, {'code': 20404, 'message': 'Not Found'})
+
+            if fake.args.latency_ms:
+                time.sleep(fake.args.latency_ms / 1000)
+            status, body, headers = fake.handle(match.group('sid'), self._auth(), form)
+            self._reply(status, body, headers)
+
+        def do_GET(self):
+            with fake.lock:
+                if self.path == '/messages':
+                    return self._reply(200, {'messages': list(fake.messages)}, count=False)
+                if self.path == '/stats':
+                    return self._reply(200, {'accepted': len(fake.messages), 'responses': dict(fake.responses)},
+                                       count=False)
+            self._reply(404, {'code': 20404, 'message': 'Not Found'}, count=False)
+
+        def _auth(self):
+            header = self.headers.get('Authorization', '')
+            if not header.startswith('Basic '):
+                return None
+            username, _, password = base64.b64decode(header[6:]).decode().partition(':')
+            return username, password
+
+        def _reply(self, status, body, headers=None, count=True):
+            if count:
+                with fake.lock:
+                    fake.responses[status] += 1
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            if not fake.args.quiet:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--auth-token', help='reject requests not authenticated with this token')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of requests answered with 500')
+    parser.add_argument('--limit', type=float, default=0, help='messages per second per sender before 429')
+    parser.add_argument('--latency-ms', type=float, default=0, help='delay before every response')
+    parser.add_argument('--invalid', action='append', default=[], help='recipient number to reject with 400')
+    parser.add_argument('--seed', type=int, help='random seed for --fail-rate')
+    parser.add_argument('--quiet', action='store_true', help='do not log every request')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    fake = FakeTwilio(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(fake))
+    print(f"fake Twilio API listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    print(f"accepted {len(fake.messages)} message(s); responses: {dict(fake.responses)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""
+Fuzz and benchmark the experience/education entry parser
+
+Three passes:
+
+  fuzz        random entries built from dates, headings, bullets and noise;
+              every result must have the expected shape and only contain
+              text from the input
+  pathological
+              very long lines, thousands of lines, repeated separators and
+              near-miss dates; each must parse within --budget seconds
+  benchmark   the old per-template keyword scan against the compiled
+              parser, cold and memoized
+
+Exits non-zero if any check fails.
+
+Usage:
+    python scripts/fuzz_parsing.py [--cases N] [--seed N] [--budget SECONDS] [--json]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cv_templates.parsing import clear_cache, parse_education, parse_experience
+
+MONTHS = ['Jan', 'February', 'Mar.', 'april', 'MAY', 'Sept', 'December']
+TITLES = ['Senior Engineer', 'Cashier', 'Head - Sales', 'BSc Computer Science', 'Teacher (Maths)',
+          'Data Analyst, Risk', 'Nurse', 'Director @ Large', 'Über-Manager', 'ИНЖЕНЕР']
+ORGS = ['Acme Payments', 'OK Stores', 'University of Zimbabwe', 'Ministry of Health', 'Beta | Labs']
+SEPARATORS = [' at ', ' from ', ' @ ', ' | ', ' - ', ', ', ' AT ', '  at  ']
+NOISE = ['Increased revenue by 20% in 2019', 'Managed $2M budget', '- Led a team of 15',
+         '• Built the platform', '* Mentored 3 juniors', '2019 was a big year for the team',
+         'Covered 19 districts', '---', '   ', '\t', '()', '1999-2000-2001', 'to present']
+
+KEYWORDS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec',
+            '20', '19', 'present', 'current', '-']
+
+
+def random_date(rng):
+    year = str(rng.randint(1950, 2030))
+    if rng.random() < 0.5:
+        return f"{rng.choice(MONTHS)} {year}"
+    if rng.random() < 0.2:
+        return f"{rng.randint(1, 12):02d}/{year[2:]}"
+    return year
+
+
+def random_entry(rng):
+    """A plausible (or deliberately odd) entry as a user might type it"""
+    lines = []
+    heading = rng.choice(TITLES)
+    if rng.random() < 0.6:
+        heading += rng.choice(SEPARATORS) + rng.choice(ORGS)
+    if rng.random() < 0.15:
+        heading += f" ({random_date(rng)} - {rng.choice(['Present', random_date(rng)])})"
+    lines.append(heading)
+
+    if rng.random() < 0.3:
+        lines.append(rng.choice(ORGS))
+    if rng.random() < 0.7:
+        end = rng.choice(['Present', 'current', 'now', random_date(rng)])
+        lines.append(f"{random_date(rng)}{rng.choice([' - ', '-', ' – ', ' to '])}{end}")
+    for _ in range(rng.randint(0, 6)):
+        lines.append(rng.choice(NOISE))
+
+    if rng.random() < 0.1:
+        rng.shuffle(lines)
+    return rng.choice(['\n', '\r\n', '\n\n']).join(lines)
+
+
+def pathological_inputs():
+    return {
+        'long_line': 'Engineer at Acme ' + 'x' * 200_000,
+        'many_lines': '\n'.join(f'Line {i} of the description' for i in range(20_000)),
+        'digits': '2' * 200_000,
+        'repeated_years': '2019 - ' * 30_000,
+        'repeated_months': 'jan ' * 50_000 + '2020',
+        'repeated_at': ' at '.join(['a'] * 50_000),
+        'repeated_dashes': ' - '.join(['-'] * 50_000),
+        'near_miss_ranges': '\n'.join('Jan 20' + '0' * i + ' - Presen' for i in range(2_000)),
+        'only_newlines': '\n' * 100_000,
+        'bullets': '\n'.join('• ' * 50 + 'x' for _ in range(5_000)),
+        'unicode': '\n'.join('–—•·▪●' * 1_000 for _ in range(50)),
+    }
+
+
+def check_shape(entry, fields, lines_key, text):
+    """Problems with a parsed entry, as a list of strings"""
+    problems = []
+    for field in fields:
+        if not isinstance(entry[field], str):
+            problems.append(f"{field} is {type(entry[field]).__name__}")
+        elif entry[field] and entry[field] not in text:
+            problems.append(f"{field} {entry[field]!r} is not in the input")
+    if not isinstance(entry[lines_key], list) or not all(isinstance(line, str) and line for line in entry[lines_key]):
+        problems.append(f"{lines_key} is not a list of non-empty strings")
+    if text.strip() and not entry[fields[0]]:
+        problems.append(f"{fields[0]} is empty for non-empty input")
+    return problems
+
+
+def fuzz(cases, seed):
+    rng = random.Random(seed)
+    failures = []
+    for i in range(cases):
+        text = random_entry(rng)
+        try:
+            experience = parse_experience(text)
+            education = parse_education(text)
+        except Exception as e:
+            failures.append((text, f"raised {e!r}"))
+            continue
+        problems = check_shape(experience, ('title', 'company', 'period'), 'bullets', text)
+        problems += check_shape(education, ('degree', 'institution', 'period'), 'details', text)
+        if problems:
+            failures.append((text, '; '.join(problems)))
+    return failures
+
+
+def pathological(budget):
+    results = []
+    for name, text in pathological_inputs().items():
+        clear_cache()
+        started = time.perf_counter()
+        error = None
+        try:
+            parse_experience(text)
+            parse_education(text)
+        except Exception as e:
+            error = repr(e)
+        elapsed = time.perf_counter() - started
+        results.append({
+            'input': name,
+            'chars': len(text),
+            'seconds': round(elapsed, 4),
+            'ok': error is None and elapsed <= budget,
+            'error': error
+        })
+    return results
+
+
+def keyword_scan(text):
+    """What each template used to do on every render"""
+    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    if not lines:
+        return None
+    first = lines[0]
+    title, company = first.split(' at ', 1) if ' at ' in first else (first, '')
+    duration, description = '', []
+    for line in lines[1:]:
+        if not duration and any(keyword in line.lower() for keyword in KEYWORDS):
+            duration = line
+        else:
+            description.append(line)
+    return title, company, duration, description
+
+
+def benchmark(seed, entries=2_000, renders=10):
+    """Microseconds per entry, parsing a CV once per render"""
+    rng = random.Random(seed)
+    texts = [random_entry(rng) for _ in range(entries)]
+    total = entries * renders
+
+    started = time.perf_counter()
+    for _ in range(renders):
+        for text in texts:
+            keyword_scan(text)
+    keyword = time.perf_counter() - started
+
+    clear_cache()
+    started = time.perf_counter()
+    for text in texts:
+        parse_experience(text)
+    cold = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(renders):
+        for text in texts:
+            parse_experience(text)
+    memoized = time.perf_counter() - started
+
+    return {
+        'entries': entries,
+        'renders': renders,
+        'keyword_scan_us': round(keyword / total * 1e6, 2),
+        'compiled_cold_us': round(cold / entries * 1e6, 2),
+        'compiled_memoized_us': round(memoized / total * 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', type=int, default=20_000, help='random entries to fuzz')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    parser.add_argument('--budget', type=float, default=1.0, help='seconds allowed per pathological input')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    failures = fuzz(args.cases, args.seed)
+    slow = pathological(args.budget)
+    bench = benchmark(args.seed)
+    ok = not failures and all(r['ok'] for r in slow)
+
+    if args.json:
+        print(json.dumps({
+            'fuzz': {'cases': args.cases, 'failures': [{'input': t, 'problem': p} for t, p in failures[:20]]},
+            'pathological': slow,
+            'benchmark': bench,
+            'ok': ok
+        }, indent=2))
+        return 0 if ok else 1
+
+    print(f"fuzz: {args.cases - len(failures)}/{args.cases} entries ok")
+    for text, problem in failures[:20]:
+        print(f"  FAIL {problem}: {text!r}")
+
+    print(f"\n{'pathological input':<20} {'chars':>9} {'seconds':>9}")
+    for r in slow:
+        status = 'ok' if r['ok'] else f"FAIL {r['error'] or 'over budget'}"
+        print(f"{r['input']:<20} {r['chars']:>9} {r['seconds']:>9}  {status}")
+
+    print(f"\nper entry, {bench['entries']} entries x {bench['renders']} renders:")
+    print(f"  keyword scan       {bench['keyword_scan_us']:>8} µs")
+    print(f"  compiled, cold     {bench['compiled_cold_us']:>8} µs")
+    print(f"  compiled, memoized {bench['compiled_memoized_us']:>8} µs")
+
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
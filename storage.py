@@ -0,0 +1,502 @@
+"""
+Storage for generated CVs and profile photos
+
+CVs and photos used to live in two flat directories, with CVs named
+CV_<name>_<timestamp>.pdf. Directory operations slow down once those hold
+hundreds of thousands of files, and two renders for the same name in the
+same second overwrote each other. Files are now addressed by object keys:
+
+  cvs/<t[:2]>/<t[2:4]>/<t>/CV_<name>.pdf    t is a random token per CV
+  photos/<d[:2]>/<d[2:4]>/<d>.jpg           d is the SHA-256 of the original
+
+The two hash-prefix levels spread the files over 65,536 directories, and
+keys never collide. The final path segment keeps the readable file name for
+downloads.
+
+Keys are stored in CV.file_path, CV.profile_photo and the conversation data.
+The storage singleton hands them to the configured backend:
+
+  local  files under STORAGE_FOLDER
+  s3     an S3-compatible API (AWS, MinIO, scripts/fake_s3.py) called with
+         SigV4-signed requests over a pooled session, using path-style URLs
+
+Rows written before keys existed hold file paths under CV_FOLDER or
+UPLOAD_FOLDER. Those are recognised as legacy paths and served from the
+local disk.
+"""
+
+import base64
+import calendar
+import hashlib
+import hmac
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from urllib.parse import quote, urlsplit
+from xml.sax.saxutils import escape
+
+import requests
+from requests.adapters import HTTPAdapter
+from werkzeug.security import safe_join
+
+KEY_PREFIXES = ('cvs/', 'photos/')
+
+# Longest validity S3 allows for a presigned URL
+MAX_PRESIGN_SECONDS = 7 * 24 * 3600
+
+S3_NS = '{http://s3.amazonaws.com/doc/2006-03-01/}'
+
+
+class StorageError(Exception):
+    """Raised when an object cannot be stored, read or found"""
+
+
+def cv_key(full_name):
+    """A new, unique key for a CV rendered for full_name"""
+    safe_name = "".join(c for c in full_name if c.isalnum() or c in (' ', '-', '_')).strip() or 'CV'
+    token = uuid.uuid4().hex
+    return f"cvs/{token[:2]}/{token[2:4]}/{token}/CV_{safe_name}.pdf"
+
+
+def photo_key(digest):
+    """Key of the processed photo for an original with this SHA-256"""
+    return f"photos/{digest[:2]}/{digest[2:4]}/{digest}.jpg"
+
+
+def is_key(value):
+    """Whether a stored value is an object key rather than a legacy file path"""
+    return bool(value) and value.startswith(KEY_PREFIXES)
+
+
+def _atomic_write(path, write):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class LocalStorage:
+    """Objects as files under a root directory"""
+
+    name = 'local'
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def path(self, key):
+        path = safe_join(self.root, key)
+        if path is None:
+            raise StorageError(f"invalid key {key!r}")
+        return path
+
+    def put(self, key, data, content_type=None, keep_local=False):
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+
+        try:
+            _atomic_write(self.path(key), write)
+        except OSError as e:
+            raise StorageError(f"cannot write {key}: {str(e)}")
+
+    def put_file(self, key, source, content_type=None):
+        """Store a local file, as a hard link where the filesystem allows it"""
+        def link(tmp_path):
+            try:
+                os.link(source, tmp_path)
+            except OSError:
+                shutil.copyfile(source, tmp_path)
+
+        try:
+            _atomic_write(self.path(key), link)
+        except OSError as e:
+            raise StorageError(f"cannot store {source} as {key}: {str(e)}")
+
+    def open(self, key):
+        try:
+            return open(self.path(key), 'rb')
+        except OSError as e:
+            raise StorageError(f"cannot open {key}: {str(e)}")
+
+    def exists(self, key):
+        return os.path.isfile(self.path(key))
+
+    def size(self, key):
+        try:
+            return os.path.getsize(self.path(key))
+        except OSError as e:
+            raise StorageError(f"cannot stat {key}: {str(e)}")
+
+    def delete(self, key):
+        path = self.path(key)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return False
+
+        # Drop shard directories left empty, but never the root
+        directory = os.path.dirname(path)
+        while directory != self.root and directory.startswith(self.root):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
+        return True
+
+    def delete_many(self, keys):
+        """Delete several objects; returns the keys that could not be deleted"""
+        failed = []
+        for key in keys:
+            try:
+                self.delete(key)
+            except (OSError, StorageError) as e:
+                logging.error(f"Error deleting {key}: {str(e)}")
+                failed.append(key)
+        return failed
+
+    def list(self, prefix=''):
+        """Yield (key, size, modified) for objects under a prefix, modified as a Unix time"""
+        top = os.path.join(self.root, prefix) if prefix else self.root
+        for directory, _, files in os.walk(top):
+            for name in files:
+                # In-flight writes are not objects yet
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield os.path.relpath(path, self.root).replace(os.sep, '/'), stat.st_size, stat.st_mtime
+
+    def local_path(self, key):
+        return self.path(key)
+
+    def presigned_url(self, key, expires_in):
+        # Local files are served by the app itself
+        return None
+
+
+class S3Storage:
+    """Objects in an S3-compatible bucket, with a local copy kept for renders"""
+
+    name = 's3'
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, endpoint, bucket, region, access_key, secret_key, cache_folder, timeout=30):
+        self.endpoint = endpoint.rstrip('/')
+        self.host = urlsplit(self.endpoint).netloc
+        self.bucket = bucket
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.cache = LocalStorage(cache_folder)
+        self.timeout = timeout
+
+        self._session = requests.Session()
+        self._session.mount(self.endpoint, HTTPAdapter(pool_connections=1, pool_maxsize=16, max_retries=2))
+
+    def put(self, key, data, content_type=None, keep_local=False):
+        headers = {'Content-Type': content_type} if content_type else {}
+        self._request('PUT', key, data=data, headers=headers, payload_hash=hashlib.sha256(data).hexdigest())
+        if keep_local:
+            self.cache.put(key, data)
+
+    def put_file(self, key, source, content_type=None):
+        headers = {'Content-Type': content_type} if content_type else {}
+        with open(source, 'rb') as f:
+            # Streamed, so the body is not hashed up front
+            self._request('PUT', key, data=f, headers=headers, payload_hash='UNSIGNED-PAYLOAD')
+
+    def open(self, key):
+        response = self._request('GET', key, stream=True)
+        response.raw.decode_content = True
+        return response.raw
+
+    def exists(self, key):
+        return self._request('HEAD', key, missing_ok=True) is not None
+
+    def size(self, key):
+        response = self._request('HEAD', key, missing_ok=True)
+        if response is None:
+            raise StorageError(f"{key} does not exist")
+        return int(response.headers.get('Content-Length', 0))
+
+    def delete(self, key):
+        self.cache.delete(key)
+        self._request('DELETE', key)
+        return True
+
+    def delete_many(self, keys):
+        """Delete up to 1000 objects in one DeleteObjects call; returns the keys that failed"""
+        if not keys:
+            return []
+        self.cache.delete_many(keys)
+
+        objects = ''.join(f"<Object><Key>{escape(key)}</Key></Object>" for key in keys)
+        body = f"<Delete><Quiet>true</Quiet>{objects}</Delete>".encode()
+        headers = {
+            'Content-Type': 'application/xml',
+            'Content-MD5': base64.b64encode(hashlib.md5(body).digest()).decode(),
+        }
+        response = self._request('POST', None, data=body, headers=headers, query={'delete': ''},
+                                 payload_hash=hashlib.sha256(body).hexdigest())
+
+        # Quiet mode only reports the failures
+        failed = []
+        for error in ET.fromstring(response.content).iter(f'{S3_NS}Error'):
+            key = error.findtext(f'{S3_NS}Key')
+            logging.error(f"Error deleting {key}: {error.findtext(f'{S3_NS}Code')}")
+            failed.append(key)
+        return failed
+
+    def list(self, prefix=''):
+        """Yield (key, size, modified) for objects under a prefix, modified as a Unix time"""
+        query = {'list-type': '2', 'prefix': prefix}
+        while True:
+            response = self._request('GET', None, query=query)
+            root = ET.fromstring(response.content)
+            for item in root.iter(f'{S3_NS}Contents'):
+                modified = time.strptime(item.findtext(f'{S3_NS}LastModified')[:19], '%Y-%m-%dT%H:%M:%S')
+                yield item.findtext(f'{S3_NS}Key'), int(item.findtext(f'{S3_NS}Size')), calendar.timegm(modified)
+
+            token = root.findtext(f'{S3_NS}NextContinuationToken')
+            if root.findtext(f'{S3_NS}IsTruncated') != 'true' or not token:
+                return
+            query = dict(query, **{'continuation-token': token})
+
+    def local_path(self, key):
+        """Path of a local copy of the object, downloading it on first use"""
+        path = self.cache.path(key)
+        try:
+            # The retention sweep drops copies that have not been used for a while
+            os.utime(path)
+            return path
+        except OSError:
+            pass
+
+        def download(tmp_path):
+            with self._request('GET', key, stream=True) as response, open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(self.CHUNK_SIZE):
+                    f.write(chunk)
+
+        try:
+            _atomic_write(path, download)
+        except OSError as e:
+            raise StorageError(f"cannot cache {key}: {str(e)}")
+        return path
+
+    def presigned_url(self, key, expires_in):
+        """A GET URL for the object that works without credentials for expires_in seconds"""
+        expires_in = max(1, min(int(expires_in), MAX_PRESIGN_SECONDS))
+        now = datetime.utcnow()
+        scope = f"{now:%Y%m%d}/{self.region}/s3/aws4_request"
+        query = {
+            'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+            'X-Amz-Credential': f"{self.access_key}/{scope}",
+            'X-Amz-Date': f"{now:%Y%m%dT%H%M%SZ}",
+            'X-Amz-Expires': str(expires_in),
+            'X-Amz-SignedHeaders': 'host',
+        }
+        path = self._path(key)
+        query['X-Amz-Signature'] = self._signature(
+            'GET', path, _canonical_query(query), {'host': self.host}, 'UNSIGNED-PAYLOAD', now
+        )
+        return f"{self.endpoint}{path}?{_canonical_query(query)}"
+
+    def _path(self, key):
+        if key is None:
+            return f"/{quote(self.bucket)}"
+        return f"/{quote(self.bucket)}/{quote(key, safe='/~')}"
+
+    def _request(self, method, key, data=None, headers=None, payload_hash=None, stream=False, missing_ok=False,
+                 query=None):
+        """Send a SigV4-signed request for an object, or the bucket when key is None; raises StorageError on failure"""
+        now = datetime.utcnow()
+        path = self._path(key)
+        query = _canonical_query(query or {})
+        payload_hash = payload_hash or hashlib.sha256(b'').hexdigest()
+
+        signed = {'host': self.host, 'x-amz-content-sha256': payload_hash, 'x-amz-date': f"{now:%Y%m%dT%H%M%SZ}"}
+        signature = self._signature(method, path, query, signed, payload_hash, now)
+        scope = f"{now:%Y%m%d}/{self.region}/s3/aws4_request"
+
+        request_headers = dict(headers or {})
+        request_headers.update({
+            'x-amz-content-sha256': payload_hash,
+            'x-amz-date': signed['x-amz-date'],
+            'Authorization': (f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+                              f"SignedHeaders={';'.join(sorted(signed))}, Signature={signature}"),
+        })
+
+        try:
+            response = self._session.request(method, f"{self.endpoint}{path}{'?' + query if query else ''}", data=data,
+                                             headers=request_headers, stream=stream, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise StorageError(f"{method} {key or self.bucket} failed: {str(e)}")
+
+        if response.status_code == 404 and missing_ok:
+            response.close()
+            return None
+        if response.status_code >= 300:
+            detail = '' if stream or method == 'HEAD' else response.text[:200]
+            response.close()
+            raise StorageError(f"{method} {key or self.bucket} returned HTTP {response.status_code} {detail}".rstrip())
+        return response
+
+    def _signature(self, method, path, query, headers, payload_hash, now):
+        signed_headers = ';'.join(sorted(headers))
+        canonical_headers = ''.join(f"{name}:{headers[name].strip()}\n" for name in sorted(headers))
+        canonical_request = '\n'.join([method, path, query, canonical_headers, signed_headers, payload_hash])
+
+        scope = f"{now:%Y%m%d}/{self.region}/s3/aws4_request"
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256', f"{now:%Y%m%dT%H%M%SZ}", scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest()
+        ])
+
+        key = f"AWS4{self.secret_key}".encode()
+        for part in (f"{now:%Y%m%d}", self.region, 's3', 'aws4_request'):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        return hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+
+def _canonical_query(params):
+    return '&'.join(f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}" for name, value in sorted(params.items()))
+
+
+class Storage:
+    """Routes keys to the configured backend and legacy paths to the local disk"""
+
+    def __init__(self):
+        self.backend = LocalStorage('storage')
+        self.legacy_folders = []
+
+    def init_app(self, app):
+        """Create the backend named by STORAGE_BACKEND"""
+        backend = app.config['STORAGE_BACKEND']
+        if backend == 's3':
+            self.backend = S3Storage(
+                endpoint=app.config['S3_ENDPOINT_URL'],
+                bucket=app.config['S3_BUCKET'],
+                region=app.config['S3_REGION'],
+                access_key=app.config['S3_ACCESS_KEY_ID'],
+                secret_key=app.config['S3_SECRET_ACCESS_KEY'],
+                cache_folder=app.config['STORAGE_CACHE_FOLDER']
+            )
+        else:
+            if backend != 'local':
+                logging.error(f"Unknown STORAGE_BACKEND {backend!r}, using local storage")
+            self.backend = LocalStorage(app.config['STORAGE_FOLDER'])
+            os.makedirs(self.backend.root, exist_ok=True)
+
+        # Files saved before object keys existed
+        self.legacy_folders = [os.path.abspath(app.config['CV_FOLDER']), os.path.abspath(app.config['UPLOAD_FOLDER'])]
+
+    @property
+    def is_local(self):
+        return isinstance(self.backend, LocalStorage)
+
+    def put(self, key, data, content_type=None, keep_local=False):
+        """Store bytes under a key; keep_local also keeps a copy on this host's disk"""
+        self.backend.put(key, data, content_type, keep_local)
+        return key
+
+    def put_file(self, key, source, content_type=None):
+        """Store the contents of a local file under a key"""
+        self.backend.put_file(key, source, content_type)
+        return key
+
+    def open(self, key):
+        """A readable binary stream of the object"""
+        if not is_key(key):
+            try:
+                return open(self._legacy_path(key), 'rb')
+            except OSError as e:
+                raise StorageError(f"cannot open {key}: {str(e)}")
+        return self.backend.open(key)
+
+    def exists(self, key):
+        if not is_key(key):
+            return os.path.isfile(self._legacy_path(key))
+        return self.backend.exists(key)
+
+    def size(self, key):
+        if not is_key(key):
+            try:
+                return os.path.getsize(self._legacy_path(key))
+            except OSError as e:
+                raise StorageError(f"cannot stat {key}: {str(e)}")
+        return self.backend.size(key)
+
+    def delete(self, key):
+        if not is_key(key):
+            try:
+                os.unlink(self._legacy_path(key))
+                return True
+            except FileNotFoundError:
+                return False
+        return self.backend.delete(key)
+
+    def delete_many(self, keys):
+        """Delete a batch of keys and legacy paths; returns the ones that could not be deleted"""
+        failed = []
+        legacy = [key for key in keys if not is_key(key)]
+        for path in legacy:
+            try:
+                self.delete(path)
+            except (OSError, StorageError) as e:
+                logging.error(f"Error deleting {path}: {str(e)}")
+                failed.append(path)
+
+        keys = [key for key in keys if is_key(key)]
+        try:
+            failed.extend(self.backend.delete_many(keys))
+        except StorageError as e:
+            logging.error(f"Error deleting {len(keys)} object(s): {str(e)}")
+            failed.extend(keys)
+        return failed
+
+    def list(self, prefix=''):
+        """Yield (key, size, modified) for every stored object under a prefix"""
+        return self.backend.list(prefix)
+
+    def local_path(self, key):
+        """A file on this host with the object's contents, or None if there is none"""
+        if not key:
+            return None
+        try:
+            if not is_key(key):
+                path = self._legacy_path(key)
+                return path if os.path.isfile(path) else None
+            return self.backend.local_path(key)
+        except StorageError as e:
+            logging.error(f"Error fetching {key} from storage: {str(e)}")
+            return None
+
+    def presigned_url(self, key, expires_in):
+        """A direct URL to the object, or None when the app serves it itself"""
+        if not is_key(key):
+            return None
+        return self.backend.presigned_url(key, expires_in)
+
+    def _legacy_path(self, path):
+        """Absolute path of a legacy file, which must lie in one of the old folders"""
+        path = os.path.abspath(path)
+        if not any(path.startswith(folder + os.sep) for folder in self.legacy_folders):
+            raise StorageError(f"{path} is not a storage key or a legacy file")
+        return path
+
+
+storage = Storage()
@@ -0,0 +1,117 @@
+"""
+In-process template catalog
+
+The bot lists, numbers and looks up templates on almost every step of the CV
+flow. The active templates are kept in memory, ordered by id, so the list
+reads the same every time it is shown. The cache is versioned through the
+'templates' row of catalog_versions. Admin changes bump that version in the
+same transaction as the edit. The conversation store reads the version as
+part of its per-message query and calls sync(), so a worker only goes back to
+the templates table after something actually changed.
+"""
+
+import logging
+import threading
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from models import Template, CatalogVersion
+
+catalog_versions = CatalogVersion.__table__
+
+
+class CatalogTemplate:
+    """Immutable snapshot of a templates row"""
+
+    __slots__ = ('id', 'name', 'description', 'is_premium', 'template_file', 'is_active')
+
+    def __init__(self, id, name, description, is_premium, template_file, is_active):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.is_premium = bool(is_premium)
+        self.template_file = template_file
+        self.is_active = bool(is_active)
+
+    def __repr__(self):
+        return f'<CatalogTemplate {self.name}>'
+
+
+class TemplateCatalog:
+    NAME = 'templates'
+
+    def __init__(self):
+        self.version = None
+        self._templates = ()
+        self._by_id = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Make sure the version row exists"""
+        with app.app_context():
+            try:
+                db.session.execute(self._insert_ignore().values(name=self.NAME, version=0))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Error initialising template catalog version: {str(e)}")
+            finally:
+                db.session.remove()
+
+    def version_column(self):
+        """Scalar subquery with the current catalog version, for piggybacking on other reads"""
+        return (
+            select(catalog_versions.c.version)
+            .where(catalog_versions.c.name == self.NAME)
+            .scalar_subquery()
+        )
+
+    def sync(self, version):
+        """Reload the catalog if the database version differs from the cached one"""
+        if version is not None and version == self.version:
+            return
+
+        rows = db.session.execute(
+            select(Template.id, Template.name, Template.description, Template.is_premium,
+                   Template.template_file, Template.is_active)
+            .order_by(Template.id)
+        ).all()
+        templates = tuple(CatalogTemplate(*row) for row in rows)
+
+        with self._lock:
+            self._templates = templates
+            self._by_id = {template.id: template for template in templates}
+            self.version = version
+        logging.debug(f"Template catalog loaded ({len(templates)} templates, version {version})")
+
+    def bump(self):
+        """Stage a version bump in the current transaction; every worker reloads after commit"""
+        db.session.execute(
+            update(catalog_versions)
+            .where(catalog_versions.c.name == self.NAME)
+            .values(version=catalog_versions.c.version + 1)
+        )
+
+    def available(self, include_premium):
+        """Active templates in display order"""
+        self._ensure_loaded()
+        return [t for t in self._templates if t.is_active and (include_premium or not t.is_premium)]
+
+    def get(self, template_id):
+        """Look up a template by id, active or not"""
+        self._ensure_loaded()
+        return self._by_id.get(template_id)
+
+    def _ensure_loaded(self):
+        if self.version is None and not self._templates:
+            self.sync(db.session.execute(select(self.version_column())).scalar())
+
+    def _insert_ignore(self):
+        if db.engine.dialect.name == 'postgresql':
+            return postgresql.insert(catalog_versions).on_conflict_do_nothing()
+        return sqlite.insert(catalog_versions).on_conflict_do_nothing()
+
+
+template_catalog = TemplateCatalog()
@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app is configured from the environment at import time, so point it at
+# throwaway locations before anything imports it
+_workdir = tempfile.mkdtemp(prefix='whatsapp-cv-maker-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_workdir, 'test.db')}"
+os.environ['STORAGE_FOLDER'] = os.path.join(_workdir, 'storage')
+os.environ['STORAGE_CACHE_FOLDER'] = os.path.join(_workdir, 'storage-cache')
+os.environ['MEDIA_FOLDER'] = os.path.join(_workdir, 'incoming')
+os.environ['PDF_CACHE_FOLDER'] = os.path.join(_workdir, 'pdf-cache')
+os.environ['PREVIEW_FOLDER'] = os.path.join(_workdir, 'previews')
+os.environ['RETENTION_SWEEP_HOURS'] = '0'
+os.environ['PREVIEW_WARMUP'] = 'false'
+os.environ['MEDIA_BACKGROUND'] = 'false'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules such as message_lock import the app, which imports them back, so
+# the app has to be loaded first
+from app import app as flask_app  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    flask_app.config['TESTING'] = True
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
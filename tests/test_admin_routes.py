@@ -0,0 +1,15 @@
+from flask import url_for
+
+from preview_cache import preview_cache
+
+
+def test_anonymous_preview_rebuild_redirects_to_login(app, client, monkeypatch):
+    rebuilds = []
+    monkeypatch.setattr(preview_cache, 'rebuild', lambda *args, **kwargs: rebuilds.append(args))
+
+    response = client.post('/admin/templates/previews/rebuild')
+
+    assert response.status_code == 302
+    with app.test_request_context():
+        assert response.headers['Location'].startswith(url_for('admin_auth.login'))
+    assert rebuilds == []
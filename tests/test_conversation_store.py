@@ -0,0 +1,192 @@
+import time
+
+import pytest
+from sqlalchemy import update
+
+from activity_tracker import last_active_buffer
+from app import db
+from conversation_store import ConversationCache, StaleStateError, conversation_store
+from models import ConversationPatch, ConversationState
+from unit_of_work import unit_of_work
+
+
+def load(app, phone_number):
+    with app.app_context(), unit_of_work():
+        return conversation_store.load(phone_number)
+
+
+def save(app, phone_number, change):
+    with app.app_context(), unit_of_work():
+        user, conv_state = conversation_store.load(phone_number)
+        change(conv_state)
+        conversation_store.save(user, conv_state)
+        return user, conv_state
+
+
+def new_cv(conv_state):
+    conv_state.state = 'collect_experience'
+    conv_state.cv_data = {'full_name': 'Jane Doe', 'experience': []}
+
+
+def test_rolled_back_message_leaves_last_active_alone(app, monkeypatch):
+    phone_number = '+263770003005'
+    user, _ = save(app, phone_number, new_cv)
+    touches = []
+    monkeypatch.setattr(last_active_buffer, 'touch', lambda user_id, when=None: touches.append(user_id))
+
+    with app.app_context():
+        with pytest.raises(RuntimeError):
+            with unit_of_work():
+                user, conv_state = conversation_store.load(phone_number)
+                conv_state.set_field('email', 'lost@example.com')
+                conversation_store.save(user, conv_state)
+                raise RuntimeError('later step failed')
+
+    assert touches == []
+    save(app, phone_number, lambda s: s.set_field('email', 'kept@example.com'))
+    assert touches == [user.id]
+
+
+def test_cache_hit_serves_the_committed_version(app):
+    phone_number = '+263770003003'
+    save(app, phone_number, new_cv)
+    hits = conversation_store.cache.stats()['hits']
+
+    user, conv_state = load(app, phone_number)
+
+    assert conversation_store.cache.stats()['hits'] == hits + 1
+    assert conv_state.cv_data['full_name'] == 'Jane Doe'
+
+
+def test_cache_entry_behind_the_database_is_reloaded(app):
+    phone_number = '+263770003006'
+    user, conv_state = save(app, phone_number, new_cv)
+    stale = conversation_store.cache.stats()['stale']
+
+    # Another worker committed a newer version with a rewritten blob
+    with app.app_context():
+        db.session.execute(
+            update(ConversationState)
+            .where(ConversationState.phone_number == phone_number)
+            .values(version=ConversationState.version + 1, patch_count=0,
+                    data='{"full_name": "Changed Elsewhere", "experience": []}')
+        )
+        db.session.commit()
+
+    user, conv_state = load(app, phone_number)
+
+    assert conversation_store.cache.stats()['stale'] == stale + 1
+    assert conv_state.cv_data['full_name'] == 'Changed Elsewhere'
+
+
+def test_failed_message_leaves_nothing_in_the_cache(app):
+    phone_number = '+263770003007'
+    save(app, phone_number, new_cv)
+
+    with app.app_context():
+        with pytest.raises(RuntimeError):
+            with unit_of_work():
+                user, conv_state = conversation_store.load(phone_number)
+                conv_state.set_field('full_name', 'Never Committed')
+                conversation_store.save(user, conv_state)
+                raise RuntimeError('later step failed')
+
+    assert load(app, phone_number)[1].cv_data['full_name'] == 'Jane Doe'
+
+
+def test_cache_entries_expire_after_the_ttl():
+    cache = ConversationCache(ttl=0.01)
+    cache.checkin('+263770003008', 1, {'full_name': 'Jane'})
+    time.sleep(0.02)
+
+    assert cache.checkout('+263770003008') is None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_least_recently_used_entry_is_evicted_at_capacity():
+    cache = ConversationCache(max_entries=2)
+    cache.checkin('a', 1, {})
+    cache.checkin('b', 1, {})
+    cache.checkin('a', 2, {})
+    cache.checkin('c', 1, {})
+
+    assert cache.checkout('b') is None
+    assert cache.checkout('a') == (2, {})
+    assert cache.checkout('c') == (1, {})
+
+
+def patches_for(app, phone_number):
+    with app.app_context():
+        return [(p.op, p.field) for p in ConversationPatch.query
+                .filter_by(phone_number=phone_number).order_by(ConversationPatch.id)]
+
+
+def test_step_writes_only_the_changed_fields(app):
+    phone_number = '+263770003009'
+    save(app, phone_number, new_cv)
+    save(app, phone_number, lambda s: s.set_field('email', 'jane@example.com'))
+    save(app, phone_number, lambda s: s.append_field('experience', {'title': 'Engineer'}))
+
+    assert patches_for(app, phone_number) == [('set', 'email'), ('append', 'experience')]
+
+
+def test_patches_replay_onto_the_compacted_data(app):
+    phone_number = '+263770003001'
+    save(app, phone_number, new_cv)
+    save(app, phone_number, lambda s: s.set_field('email', 'jane@example.com'))
+    save(app, phone_number, lambda s: s.append_field('experience', {'title': 'Engineer'}))
+
+    # A cold cache has to rebuild the data from the blob plus the patch log
+    conversation_store.cache.checkout(phone_number)
+    user, conv_state = load(app, phone_number)
+
+    assert conv_state.patch_count == 2
+    assert conv_state.cv_data == {'full_name': 'Jane Doe', 'email': 'jane@example.com',
+                                  'experience': [{'title': 'Engineer'}]}
+
+
+def test_patch_log_is_compacted_past_the_limit(app, monkeypatch):
+    phone_number = '+263770003002'
+    monkeypatch.setattr(conversation_store, 'COMPACT_AFTER', 3)
+    save(app, phone_number, new_cv)
+    for index in range(4):
+        save(app, phone_number, lambda s, i=index: s.append_field('experience', {'title': f'Job {i}'}))
+
+    conversation_store.cache.checkout(phone_number)
+    user, conv_state = load(app, phone_number)
+
+    assert conv_state.patch_count < 3
+    assert len(patches_for(app, phone_number)) == conv_state.patch_count
+    assert [e['title'] for e in conv_state.cv_data['experience']] == ['Job 0', 'Job 1', 'Job 2', 'Job 3']
+
+
+def test_replacing_the_data_drops_the_patch_log(app):
+    phone_number = '+263770003010'
+    save(app, phone_number, new_cv)
+    save(app, phone_number, lambda s: s.set_field('email', 'jane@example.com'))
+
+    def finish(conv_state):
+        conv_state.state = 'menu'
+        conv_state.cv_data = {}
+
+    save(app, phone_number, finish)
+    conversation_store.cache.checkout(phone_number)
+
+    assert patches_for(app, phone_number) == []
+    assert load(app, phone_number)[1].cv_data == {}
+
+
+def test_concurrent_save_is_rejected(app):
+    phone_number = '+263770003004'
+    save(app, phone_number, new_cv)
+
+    with app.app_context():
+        with pytest.raises(StaleStateError):
+            with unit_of_work():
+                user, conv_state = conversation_store.load(phone_number)
+                # Another worker saves the same version first
+                save(app, phone_number, lambda s: s.set_field('email', 'first@example.com'))
+                conv_state.set_field('email', 'second@example.com')
+                conversation_store.save(user, conv_state)
+
+    assert load(app, phone_number)[1].cv_data['email'] == 'first@example.com'
@@ -0,0 +1,82 @@
+"""
+Every CV template must render byte-identical PDFs
+
+The PDF cache, ETags and golden-file comparisons depend on it. Each
+template is rendered in each colour scheme it supports, twice in this
+process and once more in a freshly spawned one.
+"""
+
+import hashlib
+import io
+import multiprocessing
+
+import pytest
+
+pytest.importorskip('reportlab')
+
+import cv_templates  # noqa: E402
+from cv_templates.output import INVARIANT  # noqa: E402
+from render_worker import render_cv_bytes  # noqa: E402
+
+SAMPLE_CV = {
+    'full_name': 'Jane Doe',
+    'email': 'jane.doe@example.com',
+    'phone': '+263 77 123 4567',
+    'address': 'Harare, Zimbabwe',
+    'summary': 'Software engineer with eight years of experience building reliable payment '
+               'and messaging systems. Enjoys mentoring and making complex systems simple.',
+    'experience': [
+        {'title': 'Senior Engineer', 'company': 'Acme Payments', 'period': 'Jan 2020 - Present',
+         'bullets': ['Led the move to event-driven settlement.']},
+        {'title': 'Software Engineer', 'company': 'Beta Labs', 'period': 'Mar 2016 - Dec 2019',
+         'bullets': ['Built the messaging platform used by 2M users.']},
+    ],
+    'education': [
+        {'degree': 'BSc Computer Science', 'institution': 'University of Zimbabwe', 'period': '2015',
+         'details': ['First class honours']},
+    ],
+    'skills': ['Python', 'PostgreSQL', 'Distributed Systems', 'Leadership'],
+}
+
+CASES = [(name, color) for name, info in cv_templates.TEMPLATES.items()
+         for color in (info.color_schemes or [None])]
+
+pytestmark = pytest.mark.skipif(not INVARIANT, reason='PDF_INVARIANT=0 turns deterministic output off')
+
+
+def digest(pdf):
+    assert pdf is not None, 'render failed'
+    return hashlib.sha256(pdf).hexdigest()
+
+
+@pytest.fixture(scope='module')
+def cv_data(tmp_path_factory):
+    """The sample CV, with a profile photo when Pillow is available"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return dict(SAMPLE_CV, profile_photo=None)
+
+    photo = tmp_path_factory.mktemp('photo') / 'photo.jpg'
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (40, 90, 160)).save(buffer, 'JPEG')
+    photo.write_bytes(buffer.getvalue())
+    return dict(SAMPLE_CV, profile_photo=str(photo))
+
+
+@pytest.fixture(scope='module')
+def fresh_digests(cv_data):
+    """Digest of every case rendered in a newly spawned process"""
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        pdfs = pool.starmap(render_cv_bytes, [(name, cv_data, color or 'blue') for name, color in CASES])
+    return {case: digest(pdf) for case, pdf in zip(CASES, pdfs)}
+
+
+@pytest.mark.parametrize('template_file,color_scheme', CASES)
+def test_template_renders_byte_identical_pdfs(template_file, color_scheme, cv_data, fresh_digests):
+    first = digest(render_cv_bytes(template_file, cv_data, color_scheme or 'blue'))
+    second = digest(render_cv_bytes(template_file, cv_data, color_scheme or 'blue'))
+
+    assert first == second
+    assert first == fresh_digests[(template_file, color_scheme)]
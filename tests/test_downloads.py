@@ -0,0 +1,74 @@
+from urllib.parse import urlsplit
+
+import pytest
+
+from downloads import cv_downloads
+from storage import cv_key, storage
+
+PDF = b'%PDF-1.4 ' + b'x' * 1024
+
+
+@pytest.fixture
+def stored_cv(app, monkeypatch):
+    monkeypatch.setattr(cv_downloads, 'base_url', 'http://localhost')
+    key = cv_key('Jane Doe')
+    storage.put(key, PDF, content_type='application/pdf')
+    return key
+
+
+def link(name, **kwargs):
+    url = urlsplit(cv_downloads.url_for(name, **kwargs))
+    return f'{url.path}?{url.query}'
+
+
+def test_signed_link_serves_the_pdf(client, stored_cv):
+    response = client.get(link(stored_cv))
+
+    assert response.status_code == 200
+    assert response.data == PDF
+    assert response.mimetype == 'application/pdf'
+    assert 'private' in response.headers['Cache-Control']
+
+
+def test_tampered_signature_is_rejected(client, stored_cv):
+    response = client.get(link(stored_cv).replace('signature=', 'signature=x'))
+
+    assert response.status_code == 403
+
+
+def test_signature_does_not_carry_over_to_another_name(client, stored_cv):
+    other = cv_key('John Doe')
+    storage.put(other, PDF, content_type='application/pdf')
+    query = link(stored_cv).split('?')[1]
+
+    assert client.get(f'/cv/{other}?{query}').status_code == 403
+
+
+def test_expired_link_is_rejected(client, stored_cv):
+    assert client.get(link(stored_cv, ttl=-60)).status_code == 403
+
+
+def test_missing_cv_is_not_found(client, stored_cv):
+    missing = cv_key('Nobody')
+    assert client.get(link(missing)).status_code == 404
+
+
+def test_range_request_returns_partial_content(client, stored_cv):
+    response = client.get(link(stored_cv), headers={'Range': 'bytes=0-7'})
+
+    assert response.status_code == 206
+    assert response.data == PDF[:8]
+    assert response.headers['Content-Range'] == f'bytes 0-7/{len(PDF)}'
+
+
+def test_repeat_download_is_answered_with_not_modified(client, stored_cv):
+    etag = client.get(link(stored_cv)).headers['ETag']
+
+    response = client.get(link(stored_cv), headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+
+
+def test_no_link_without_a_public_base_url(monkeypatch):
+    monkeypatch.setattr(cv_downloads, 'base_url', None)
+    assert cv_downloads.url_for('cvs/ab/cd/abcd/CV_Jane.pdf') is None
@@ -0,0 +1,57 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from media_fetcher import Attachment, MediaError, media_fetcher
+
+TWILIO_WEBHOOK_TIMEOUT = 15
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.end_headers()
+        if self.path == '/slow':
+            # Trickles forever, well within the read timeout each time
+            try:
+                while True:
+                    self.wfile.write(b'x' * 1024)
+                    self.wfile.flush()
+                    time.sleep(0.1)
+            except OSError:
+                return
+        self.wfile.write(b'\xff\xd8' + b'x' * 2048)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def media_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MediaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+
+def test_default_download_fits_inside_the_webhook_timeout(app):
+    worst_case = app.config['MEDIA_DOWNLOAD_DEADLINE'] + app.config['MEDIA_READ_TIMEOUT']
+    assert worst_case < TWILIO_WEBHOOK_TIMEOUT
+
+
+def test_download_is_streamed_to_a_temp_file(app, media_server):
+    with media_fetcher.fetch(Attachment(f'{media_server}/ok', 'image/jpeg')) as path:
+        with open(path, 'rb') as f:
+            assert f.read(2) == b'\xff\xd8'
+
+
+def test_trickling_download_is_abandoned_at_the_deadline(app, media_server, monkeypatch):
+    monkeypatch.setattr(media_fetcher, 'deadline', 1)
+    started = time.monotonic()
+    with pytest.raises(MediaError, match='longer than'):
+        with media_fetcher.fetch(Attachment(f'{media_server}/slow', 'image/jpeg')):
+            pass
+    assert time.monotonic() - started < 3
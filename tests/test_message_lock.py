@@ -0,0 +1,33 @@
+import threading
+from datetime import timedelta
+
+import pytest
+
+from message_lock import LockTimeout, phone_locks
+
+
+def test_waiter_times_out_behind_a_stuck_handler(app, monkeypatch):
+    monkeypatch.setattr(phone_locks, 'WAIT_TIMEOUT', timedelta(seconds=0.5))
+    holding = threading.Event()
+    release = threading.Event()
+
+    def stuck_handler():
+        with app.app_context(), phone_locks.hold('+263770000001'):
+            holding.set()
+            release.wait(10)
+
+    worker = threading.Thread(target=stuck_handler)
+    worker.start()
+    try:
+        assert holding.wait(5)
+        with app.app_context():
+            with pytest.raises(LockTimeout):
+                with phone_locks.hold('+263770000001'):
+                    pass
+    finally:
+        release.set()
+        worker.join(5)
+
+    # The lock is usable again once the stuck handler finishes
+    with app.app_context(), phone_locks.hold('+263770000001'):
+        pass
@@ -0,0 +1,133 @@
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from sqlalchemy import select
+
+from app import db
+from models import OutboxMessage
+from outbound import DeliveryError, outbound, outbox
+
+
+class TwilioHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        if self.path.endswith('/busy/Messages.json'):
+            self.send_response(429)
+            self.send_header('Retry-After', '7')
+            body = b'{"code": 20429, "message": "Too Many Requests"}'
+        elif self.path.endswith('/invalid/Messages.json'):
+            self.send_response(400)
+            body = b'{"code": 21211, "message": "Invalid To number"}'
+        else:
+            self.send_response(201)
+            body = b'{"sid": "SM123"}'
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def twilio(app, monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), TwilioHandler)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    monkeypatch.setitem(app.config, 'TWILIO_API_BASE', f'http://127.0.0.1:{server.server_address[1]}')
+    monkeypatch.setitem(app.config, 'TWILIO_AUTH_TOKEN', 'token')
+    monkeypatch.setitem(app.config, 'TWILIO_PHONE_NUMBER', '+14155238886')
+    yield lambda account_sid: monkeypatch.setitem(app.config, 'TWILIO_ACCOUNT_SID', account_sid)
+    server.shutdown()
+
+
+def claimed(app, attempts):
+    """An outbox row as dispatch_due hands it to _deliver; 'sending' keeps the dispatcher off it"""
+    with app.app_context():
+        message = OutboxMessage(phone_number='+263770004000', body='Your CV is ready', status='sending',
+                                attempts=attempts, next_attempt_at=datetime.utcnow(),
+                                claimed_at=datetime.utcnow(), created_at=datetime.utcnow())
+        db.session.add(message)
+        db.session.commit()
+        message_id = message.id
+        return db.session.execute(
+            select(outbox.c.id, outbox.c.phone_number, outbox.c.body, outbox.c.media_url, outbox.c.attempts)
+            .where(outbox.c.id == message_id)
+        ).one()
+
+
+def stored(app, message_id):
+    with app.app_context():
+        return db.session.execute(select(outbox).where(outbox.c.id == message_id)).one()
+
+
+def test_send_returns_the_sid(twilio):
+    twilio('ok')
+    assert outbound.send('whatsapp:+14155238886', 'whatsapp:+263770004000', 'Hi') == 'SM123'
+
+
+def test_rate_limit_is_retryable_with_retry_after(twilio):
+    twilio('busy')
+    with pytest.raises(DeliveryError) as error:
+        outbound.send('whatsapp:+14155238886', 'whatsapp:+263770004000', 'Hi')
+
+    assert error.value.retryable
+    assert error.value.retry_after == 7
+
+
+def test_client_error_is_not_retryable(twilio):
+    twilio('invalid')
+    with pytest.raises(DeliveryError) as error:
+        outbound.send('whatsapp:+14155238886', 'whatsapp:+263770004000', 'Hi')
+
+    assert not error.value.retryable
+    assert '21211' in str(error.value)
+
+
+def test_delivered_message_is_marked_sent(app, twilio):
+    twilio('ok')
+    message = claimed(app, attempts=1)
+
+    outbound._deliver(message)
+
+    row = stored(app, message.id)
+    assert (row.status, row.message_sid, row.error) == ('sent', 'SM123', None)
+
+
+def test_retryable_failure_is_rescheduled_no_sooner_than_retry_after(app, twilio):
+    twilio('busy')
+    message = claimed(app, attempts=1)
+    before = datetime.utcnow()
+
+    outbound._deliver(message)
+
+    row = stored(app, message.id)
+    assert row.status == 'pending'
+    assert row.next_attempt_at >= before + timedelta(seconds=7)
+    assert 'HTTP 429' in row.error
+
+
+def test_client_error_fails_the_message_at_once(app, twilio):
+    twilio('invalid')
+    message = claimed(app, attempts=1)
+
+    outbound._deliver(message)
+
+    assert stored(app, message.id).status == 'failed'
+
+
+def test_message_fails_after_the_last_attempt(app, twilio):
+    twilio('busy')
+    message = claimed(app, attempts=outbound.max_attempts)
+
+    outbound._deliver(message)
+
+    assert stored(app, message.id).status == 'failed'
+
+
+def test_backoff_grows_exponentially_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr('outbound.random.uniform', lambda low, high: high)
+
+    assert [outbound._backoff(attempts) for attempts in (1, 2, 3)] == [4, 8, 16]
+    assert outbound._backoff(20) == outbound.BACKOFF_CAP
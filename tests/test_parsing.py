@@ -0,0 +1,73 @@
+import pytest
+
+from cv_templates.parsing import (cache_info, clear_cache, current_job_title, describe_education,
+                                  describe_experience, is_period, parse_education, parse_experience)
+
+
+def test_experience_with_company_on_the_heading():
+    entry = parse_experience('Senior Manager at Tech Corp\nJan 2020 - Present\n• Led a team of 15 people')
+
+    assert entry == {'title': 'Senior Manager', 'company': 'Tech Corp', 'period': 'Jan 2020 - Present',
+                     'bullets': ['Led a team of 15 people'], 'description': 'Led a team of 15 people'}
+
+
+def test_experience_with_dates_on_the_heading():
+    entry = parse_experience('Engineer at Acme (2019 - 2021)\nBuilt the billing system')
+
+    assert (entry['title'], entry['company'], entry['period']) == ('Engineer', 'Acme', '2019 - 2021')
+    assert entry['bullets'] == ['Built the billing system']
+
+
+def test_education_with_institution_on_its_own_line():
+    entry = parse_education('Bachelor of Science\nStanford University\n2012')
+
+    assert (entry['degree'], entry['institution'], entry['period']) == \
+        ('Bachelor of Science', 'Stanford University', '2012')
+    assert entry['details'] == []
+
+
+def test_dict_entries_are_normalised():
+    entry = parse_experience({'title': 'Engineer', 'company': 'Acme',
+                              'description': '- Shipped things\n\n* Fixed things'})
+
+    assert entry['period'] == ''
+    assert entry['bullets'] == ['Shipped things', 'Fixed things']
+    assert entry['description'] == 'Shipped things Fixed things'
+
+
+def test_empty_entry():
+    assert parse_experience('  \n ')['title'] == ''
+
+
+@pytest.mark.parametrize('line', ['2012', 'Jan 2020 - Present', '(03/2018 to 11/2020)',
+                                  'since 2015', 'Sept. 2019 – now'])
+def test_period_lines(line):
+    assert is_period(line)
+
+
+@pytest.mark.parametrize('line', ['Led a team of 15 people', 'Managed budgets across 20 departments'])
+def test_text_lines_are_not_periods(line):
+    assert not is_period(line)
+
+
+def test_descriptions():
+    assert describe_experience(parse_experience('Engineer at Acme\n2019 - 2021')) == \
+        'Engineer at Acme (2019 - 2021)'
+    assert describe_education(parse_education('BSc at UZ')) == 'BSc, UZ'
+
+
+def test_current_job_title_skips_empty_entries():
+    assert current_job_title([{'title': ''}, 'Analyst at Bank\n2020']) == 'Analyst'
+    assert current_job_title([]) is None
+
+
+def test_text_entries_are_memoized():
+    clear_cache()
+    text = 'Engineer at Acme\n2019 - 2021'
+
+    first = parse_experience(text)
+    first['bullets'].append('changed by a caller')
+    second = parse_experience(text)
+
+    assert cache_info()['experience']['hits'] == 1
+    assert second['bullets'] == []
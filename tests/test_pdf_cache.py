@@ -0,0 +1,74 @@
+import os
+
+from pdf_cache import PDFCache
+
+CV = {'full_name': 'Jane Doe', 'email': 'jane@example.com', 'skills': ['Python', 'SQL'],
+      'experience': [{'title': 'Engineer', 'company': 'Acme'}]}
+
+
+def test_key_ignores_whitespace_and_bookkeeping_fields():
+    cache = PDFCache()
+    padded = dict(CV, full_name='  Jane Doe ', skills=['Python ', ' SQL'], step='review')
+
+    assert cache.key(padded, 'template1') == cache.key(CV, 'template1')
+
+
+def test_key_changes_with_content_and_template():
+    cache = PDFCache()
+    key = cache.key(CV, 'template1')
+
+    assert cache.key(dict(CV, email='other@example.com'), 'template1') != key
+    assert cache.key(CV, 'template2') != key
+
+
+def test_colour_only_counts_for_colour_templates():
+    cache = PDFCache()
+
+    assert cache.key(CV, 'template1', 'red') == cache.key(CV, 'template1', 'green')
+    assert cache.key(CV, 'template3', 'red') != cache.key(CV, 'template3', 'green')
+    # Unknown schemes fall back to the default
+    assert cache.key(CV, 'template3', 'plaid') == cache.key(CV, 'template3', 'blue')
+
+
+def test_key_follows_the_photo_bytes(tmp_path):
+    cache = PDFCache()
+    photo = tmp_path / 'photo.jpg'
+    photo.write_bytes(b'first')
+    first = cache.key(dict(CV, profile_photo=str(photo)), 'template3')
+
+    photo.write_bytes(b'second')
+    assert cache.key(dict(CV, profile_photo=str(photo)), 'template3') != first
+
+    moved = tmp_path / 'moved.jpg'
+    moved.write_bytes(b'second')
+    assert cache.key(dict(CV, profile_photo=str(moved)), 'template3') == \
+        cache.key(dict(CV, profile_photo=str(photo)), 'template3')
+
+
+def test_store_then_fetch(tmp_path):
+    cache = PDFCache(folder=str(tmp_path))
+    key = cache.key(CV, 'template1')
+
+    assert cache.fetch(key) is None
+    cached = cache.store(key, b'%PDF-1.4 cached')
+
+    assert cache.fetch(key) == cached
+    with open(cached, 'rb') as f:
+        assert f.read() == b'%PDF-1.4 cached'
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_evicts_least_recently_used_past_the_bound(tmp_path):
+    cache = PDFCache(folder=str(tmp_path), max_bytes=25)
+    old = cache.store('old', b'x' * 10)
+    used = cache.store('used', b'x' * 10)
+    os.utime(old, (1, 1))
+    os.utime(used, (2, 2))
+    cache.fetch('used')
+
+    cache.store('new', b'x' * 10)
+
+    assert not os.path.exists(old)
+    assert os.path.exists(used)
+    assert cache.stats()['evictions'] == 1
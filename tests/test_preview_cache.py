@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+from concurrent.futures import Future
+
+from preview_cache import preview_cache
+from render_queue import render_queue
+
+PDF = b'%PDF-1.4\n% preview\n%%EOF\n'
+
+
+def rendered(*args):
+    future = Future()
+    future.set_result(PDF)
+    return future
+
+
+def test_preview_served_when_started_outside_the_app_root(app, client, monkeypatch, tmp_path):
+    monkeypatch.setattr(preview_cache, 'folder', preview_cache.folder)
+    monkeypatch.setattr(preview_cache, 'rebuild', lambda *args, **kwargs: 0)
+    monkeypatch.setattr(render_queue, 'render', rendered)
+    monkeypatch.setitem(app.config, 'PREVIEW_FOLDER', 'previews')
+    monkeypatch.chdir(tmp_path)
+    preview_cache.init_app(app)
+
+    response = client.get('/admin/templates/1/preview')
+
+    assert response.status_code == 200
+    assert response.data == PDF
+    assert (tmp_path / 'previews' / f"{preview_cache.key('template1.py')}.pdf").exists()
+
+
+def test_startup_renders_nothing_without_warmup(app, monkeypatch):
+    renders = []
+    monkeypatch.setattr(preview_cache, 'folder', preview_cache.folder)
+    monkeypatch.setattr(render_queue, 'render', lambda *args: renders.append(args))
+    monkeypatch.setitem(app.config, 'PREVIEW_WARMUP', False)
+
+    preview_cache.init_app(app)
+
+    assert renders == []
+    assert render_queue._executor is None
+
+
+def test_importing_main_does_not_build_the_app():
+    # Spawned render workers re-import the main module
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "import sys, main; assert 'app' not in sys.modules"
+    subprocess.run([sys.executable, '-c', code], cwd=root, check=True)
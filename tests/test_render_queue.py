@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from models import CV, RenderJob, User
+from render_queue import render_queue
+from storage import storage
+
+PDF = b'%PDF-1.4\n% rendered\n%%EOF\n'
+
+
+def cv_data(name):
+    return {
+        'full_name': name,
+        'email': 'jane@example.com',
+        'phone': '+263 77 123 4567',
+        'address': 'Harare',
+        'summary': 'Engineer.',
+        'experience': [],
+        'education': [],
+        'skills': ['Python'],
+        'profile_photo': None,
+        'color_scheme': 'blue',
+    }
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Results for the next renders, in order; each is PDF bytes or an exception"""
+    results = []
+
+    def render(template_file, data, color_scheme='blue'):
+        future = Future()
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+        return future
+
+    monkeypatch.setattr(render_queue, 'render', render)
+    return results
+
+
+def add_job(app, phone_number, name, **values):
+    with app.app_context():
+        user = User(phone_number=phone_number)
+        db.session.add(user)
+        db.session.flush()
+        job = RenderJob(user_id=user.id, template_id=1, phone_number=phone_number,
+                        cv_data=json.dumps(cv_data(name)), color_scheme='blue', **values)
+        db.session.add(job)
+        db.session.commit()
+        return job.id
+
+
+def wait_for(app, job_id, status, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        with app.app_context():
+            job = db.session.get(RenderJob, job_id)
+            if job.status == status or time.monotonic() > deadline:
+                return job
+        time.sleep(0.05)
+
+
+def test_job_left_running_by_a_dead_process_is_rendered_again(app, renders):
+    renders.append(PDF)
+    stale = datetime.utcnow() - render_queue.STALE_AFTER - timedelta(seconds=1)
+    job_id = add_job(app, '+263770002001', 'Dead Owner', status='running', attempts=1,
+                     claimed_by='0' * 32, started_at=stale, heartbeat_at=stale)
+
+    render_queue.recover_jobs()
+
+    job = wait_for(app, job_id, 'completed')
+    assert job.status == 'completed'
+    assert job.claimed_by == render_queue.worker_id
+    assert job.attempts == 2
+    with app.app_context():
+        assert db.session.get(CV, job.cv_id).full_name == 'Dead Owner'
+
+
+def test_render_killed_mid_job_is_retried(app, renders):
+    renders.extend([BrokenProcessPool('worker killed'), PDF])
+    job_id = add_job(app, '+263770002002', 'Killed Worker', status='queued', attempts=0)
+
+    with app.app_context():
+        assert render_queue.submit(job_id)
+
+    job = wait_for(app, job_id, 'completed')
+    assert job.status == 'completed'
+    assert job.attempts == 2
+    assert job_id not in render_queue._running
+
+
+def test_job_with_a_fresh_heartbeat_is_left_alone(app, renders):
+    job_id = add_job(app, '+263770002003', 'Live Owner', status='running', attempts=1,
+                     claimed_by='1' * 32, started_at=datetime.utcnow() - timedelta(hours=1),
+                     heartbeat_at=datetime.utcnow())
+
+    render_queue.recover_jobs()
+
+    with app.app_context():
+        job = db.session.get(RenderJob, job_id)
+        assert (job.status, job.claimed_by) == ('running', '1' * 32)
+
+
+def test_photo_is_fetched_off_the_calling_thread(app, renders, monkeypatch):
+    renders.append(PDF)
+    fetched_on = []
+
+    def local_path(key):
+        fetched_on.append(threading.current_thread().name)
+        return None
+
+    monkeypatch.setattr(storage, 'local_path', local_path)
+    job_id = add_job(app, '+263770002004', 'Photo Thread', status='queued', attempts=0)
+    with app.app_context():
+        render_queue.submit(job_id)
+
+    assert wait_for(app, job_id, 'completed').status == 'completed'
+    assert fetched_on and fetched_on[0] != threading.current_thread().name
+
+
+def test_pool_broken_by_a_killed_worker_is_replaced(app):
+    # Kill a real worker process, which breaks the whole pool
+    with pytest.raises(BrokenProcessPool):
+        render_queue._get_executor().submit(os._exit, 1).result(60)
+
+    pdf = render_queue.render('template1.py', cv_data('After The Crash')).result(60)
+    assert pdf.startswith(b'%PDF')
@@ -0,0 +1,124 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from models import CV, ConversationState, Template, User
+from retention import retention
+from storage import cv_key, photo_key, storage
+
+OLD = time.time() - 3 * 86400
+
+
+@pytest.fixture
+def sweeper(app, monkeypatch, tmp_path):
+    """Legacy folders under tmp_path, so the sweep never walks the working tree"""
+    cv_folder, upload_folder = tmp_path / 'generated_cvs', tmp_path / 'uploads'
+    cv_folder.mkdir()
+    upload_folder.mkdir()
+    monkeypatch.setitem(app.config, 'CV_FOLDER', str(cv_folder))
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(upload_folder))
+    monkeypatch.setattr(storage, 'legacy_folders', [str(cv_folder), str(upload_folder)])
+    return retention
+
+
+def stored(key, modified=None):
+    storage.put(key, b'data')
+    if modified is not None:
+        os.utime(storage.backend.path(key), (modified, modified))
+    return key
+
+
+def add_cv(app, phone_number, age_days, is_premium=False):
+    with app.app_context():
+        template = Template.query.first() or Template(name='Classic', template_file='template1')
+        user = User(phone_number=phone_number, is_premium=is_premium)
+        db.session.add_all([template, user])
+        db.session.flush()
+        cv = CV(user_id=user.id, template_id=template.id, full_name='Jane Doe',
+                file_path=stored(cv_key('Jane Doe')), file_size=4,
+                created_at=datetime.utcnow() - timedelta(days=age_days))
+        db.session.add(cv)
+        db.session.commit()
+        return cv.id, cv.file_path
+
+
+def file_path_of(app, cv_id):
+    with app.app_context():
+        return db.session.get(CV, cv_id).file_path
+
+
+def test_cvs_expire_by_tier(app, sweeper):
+    free_id, free_key = add_cv(app, '+263770005001', age_days=40)
+    premium_id, premium_key = add_cv(app, '+263770005002', age_days=40, is_premium=True)
+    recent_id, recent_key = add_cv(app, '+263770005003', age_days=1)
+
+    report = sweeper.sweep()
+
+    assert report['deleted']['expired_cvs'] >= 1
+    assert file_path_of(app, free_id) is None
+    assert not storage.exists(free_key)
+    assert file_path_of(app, premium_id) == premium_key and storage.exists(premium_key)
+    assert file_path_of(app, recent_id) == recent_key and storage.exists(recent_key)
+
+
+def test_only_old_unreferenced_objects_are_orphans(app, sweeper):
+    referenced_id, referenced = add_cv(app, '+263770005004', age_days=1)
+    os.utime(storage.backend.path(referenced), (OLD, OLD))
+    orphan = stored(cv_key('Orphan'), modified=OLD)
+    fresh = stored(cv_key('Fresh'))
+
+    sweeper.sweep()
+
+    assert not storage.exists(orphan)
+    assert storage.exists(referenced)
+    assert storage.exists(fresh)
+
+
+def test_photo_of_an_active_conversation_is_kept(app, sweeper):
+    active = stored(photo_key('a' * 64), modified=OLD)
+    abandoned = stored(photo_key('b' * 64), modified=OLD)
+    with app.app_context():
+        db.session.add_all([
+            ConversationState(phone_number='+263770005005', state='cv_photo',
+                              data=json.dumps({'profile_photo': active})),
+            ConversationState(phone_number='+263770005006', state='cv_photo',
+                              data=json.dumps({'profile_photo': abandoned}),
+                              updated_at=datetime.utcnow() - timedelta(days=30)),
+        ])
+        db.session.commit()
+
+    sweeper.sweep()
+
+    assert storage.exists(active)
+    assert not storage.exists(abandoned)
+
+
+def test_unreferenced_legacy_files_are_deleted(app, sweeper):
+    legacy = os.path.join(app.config['CV_FOLDER'], 'CV_Jane_Doe_20200101.pdf')
+    with open(legacy, 'wb') as f:
+        f.write(b'%PDF')
+    os.utime(legacy, (OLD, OLD))
+
+    sweeper.sweep()
+
+    assert not os.path.exists(legacy)
+
+
+def test_stale_temp_files_are_removed(app, sweeper):
+    os.makedirs(app.config['MEDIA_FOLDER'], exist_ok=True)
+    stale = os.path.join(app.config['MEDIA_FOLDER'], 'download.stale.tmp')
+    fresh = os.path.join(app.config['MEDIA_FOLDER'], 'download.fresh.tmp')
+    for path in (stale, fresh):
+        with open(path, 'wb') as f:
+            f.write(b'partial')
+    os.utime(stale, (OLD, OLD))
+
+    report = sweeper.sweep()
+
+    assert not os.path.exists(stale)
+    assert os.path.exists(fresh)
+    assert report['deleted']['temp_files'] >= 1
@@ -0,0 +1,80 @@
+from sqlalchemy import select
+
+from app import db
+from models import Template
+from template_catalog import template_catalog
+from unit_of_work import unit_of_work
+
+
+def add_template(app, name, **fields):
+    with app.app_context(), unit_of_work():
+        template = Template(name=name, template_file=fields.pop('template_file', 'modern'), **fields)
+        db.session.add(template)
+        template_catalog.bump()
+        db.session.flush()
+        return template.id
+
+
+def current_version(app):
+    with app.app_context():
+        return db.session.execute(select(template_catalog.version_column())).scalar()
+
+
+def test_adding_a_template_bumps_the_version(app):
+    before = current_version(app)
+    template_id = add_template(app, 'Bumped')
+
+    assert current_version(app) == before + 1
+    with app.app_context():
+        template_catalog.sync(current_version(app))
+        assert template_catalog.get(template_id).name == 'Bumped'
+
+
+def test_toggling_a_template_reloads_the_catalog(app, client):
+    template_id = add_template(app, 'Toggled')
+    with app.app_context():
+        template_catalog.sync(current_version(app))
+        assert template_id in [t.id for t in template_catalog.available(include_premium=True)]
+
+    client.get(f'/admin/templates/{template_id}/toggle')
+
+    with app.app_context():
+        template_catalog.sync(current_version(app))
+        assert template_id not in [t.id for t in template_catalog.available(include_premium=True)]
+        assert template_catalog.get(template_id).is_active is False
+
+
+def test_unchanged_version_skips_the_reload(app):
+    with app.app_context():
+        version = current_version(app)
+        template_catalog.sync(version)
+        # Written without a bump, so a sync at the same version must not see it
+        db.session.add(Template(name='Unbumped', template_file='modern'))
+        db.session.commit()
+
+        template_catalog.sync(version)
+        assert 'Unbumped' not in [t.name for t in template_catalog.available(include_premium=True)]
+
+
+def test_rolled_back_edit_keeps_the_version(app):
+    before = current_version(app)
+    with app.app_context():
+        try:
+            with unit_of_work():
+                db.session.add(Template(name='Abandoned', template_file='modern'))
+                template_catalog.bump()
+                raise RuntimeError('edit failed')
+        except RuntimeError:
+            pass
+
+    assert current_version(app) == before
+
+
+def test_first_lookup_loads_the_catalog(app, monkeypatch):
+    template_id = add_template(app, 'Cold')
+    monkeypatch.setattr(template_catalog, 'version', None)
+    monkeypatch.setattr(template_catalog, '_templates', ())
+
+    with app.app_context():
+        assert template_catalog.get(template_id).name == 'Cold'
+        assert template_catalog.version == current_version(app)
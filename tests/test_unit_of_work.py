@@ -0,0 +1,115 @@
+import pytest
+
+from app import db
+from cv_templates import template_info
+from media_fetcher import Attachment
+from message_dedup import message_deduplicator
+from models import RenderJob, User
+from profile_photos import profile_photos
+from render_queue import render_queue
+from routes import bot
+from template_catalog import template_catalog
+from unit_of_work import commit_count
+
+DETAILS = [
+    'Jane Doe',
+    'jane@example.com',
+    '+263 77 123 4567',
+    'Harare, Zimbabwe',
+    'Experienced engineer who ships reliable software.',
+    'Software Engineer at Acme\nJan 2020 - Present\nBuilt and ran payment services.',
+    'done',
+    'BSc Computer Science from University of Zimbabwe\n2016',
+    'done',
+    'Python, SQL, Leadership',
+]
+
+PHOTO = [Attachment('https://api.twilio.com/media/ME0001', 'image/jpeg')]
+
+
+@pytest.fixture
+def dispatched(monkeypatch):
+    jobs = []
+    monkeypatch.setattr(render_queue, '_dispatch', lambda job_id, *args: jobs.append(job_id))
+    monkeypatch.setattr(profile_photos, 'ingest', lambda media: 'photos/test.jpg')
+    return jobs
+
+
+def send(app, phone_number, message, media=()):
+    """Run one message through the bot in its own app context, like a webhook request"""
+    sid = f'SM{phone_number[-4:]}{send.count:06d}'
+    send.count += 1
+    with app.app_context():
+        reply = bot.process_message(f'whatsapp:{phone_number}', message, media, sid)
+        commits = commit_count()
+    assert commits == 1, f"{message!r} made {commits} commits: {reply}"
+    return reply
+
+
+send.count = 0
+
+
+def test_every_step_of_a_free_cv_commits_once(app, dispatched):
+    phone_number = '+263770001001'
+    send(app, phone_number, 'hi')
+    send(app, phone_number, '1')
+    for message in DETAILS:
+        send(app, phone_number, message)
+
+    reply = send(app, phone_number, '1', PHOTO)
+    assert 'Great photo' in reply
+
+    reply = send(app, phone_number, '1')
+    assert 'being prepared' in reply
+
+    # The render job reached the pool only after its commit
+    assert len(dispatched) == 1
+    with app.app_context():
+        assert db.session.get(RenderJob, dispatched[0]).phone_number == phone_number
+
+
+def test_every_step_of_a_premium_cv_commits_once(app, dispatched):
+    phone_number = '+263770001002'
+    send(app, phone_number, 'hi')
+    with app.app_context():
+        User.query.filter_by(phone_number=phone_number).update({'is_premium': True})
+        db.session.commit()
+        templates = template_catalog.available(True)
+
+    choice = next(i for i, t in enumerate(templates, 1)
+                  if t.is_premium and template_info(t.template_file).supports_color)
+
+    send(app, phone_number, '1')
+    for message in DETAILS:
+        send(app, phone_number, message)
+    send(app, phone_number, '2')
+
+    reply = send(app, phone_number, str(choice))
+    assert 'color scheme' in reply
+
+    reply = send(app, phone_number, '2')
+    assert 'being prepared' in reply
+    assert len(dispatched) == 1
+
+
+def test_failed_message_is_rolled_back_and_not_recorded(app, monkeypatch):
+    phone_number = '+263770001003'
+    send(app, phone_number, 'hi')
+
+    def broken(*args):
+        raise RuntimeError('handler failed')
+
+    monkeypatch.setitem(bot.conversation_manager.states, 'menu', broken)
+    with app.app_context():
+        reply = bot.process_message(f'whatsapp:{phone_number}', '1', (), 'SMfailed0001')
+        assert commit_count() == 0
+    assert 'error' in reply
+
+    with app.app_context():
+        assert message_deduplicator.lookup('SMfailed0001') is None
+
+    # Twilio's retry of the same message is processed normally once the fault is gone
+    monkeypatch.undo()
+    with app.app_context():
+        reply = bot.process_message(f'whatsapp:{phone_number}', '1', (), 'SMfailed0001')
+    assert 'full name' in reply
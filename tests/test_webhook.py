@@ -0,0 +1,66 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from app import db
+from message_dedup import message_deduplicator
+from message_lock import LockTimeout, phone_locks
+from models import ProcessedMessage
+from routes import bot
+
+
+def test_lock_timeout_asks_twilio_to_redeliver(client, monkeypatch):
+    @contextmanager
+    def timed_out(phone_number):
+        raise LockTimeout(f"Timed out waiting for lock on {phone_number}")
+        yield
+
+    monkeypatch.setattr(phone_locks, 'hold', timed_out)
+    response = client.post('/webhook', data={
+        'Body': 'hi',
+        'From': 'whatsapp:+263770000002',
+        'MessageSid': 'SMlocktimeout0001'
+    })
+
+    assert response.status_code == 503
+    assert b'<Message>' not in response.data
+
+
+def deliver(client, body, message_sid, phone_number='+263770000003'):
+    return client.post('/webhook', data={
+        'Body': body,
+        'From': f'whatsapp:{phone_number}',
+        'MessageSid': message_sid
+    })
+
+
+def test_redelivered_message_gets_the_stored_reply_without_reprocessing(app, client, monkeypatch):
+    first = deliver(client, 'hi', 'SMdedup0001')
+    handled = []
+    monkeypatch.setattr(bot.conversation_manager, 'handle_message',
+                        lambda *args: handled.append(args) or 'processed again')
+
+    again = deliver(client, 'hi', 'SMdedup0001')
+
+    assert again.data == first.data
+    assert handled == []
+
+
+def test_stored_reply_is_shared_through_the_database(app, client, monkeypatch):
+    first = deliver(client, 'hi', 'SMdedup0002', '+263770000004')
+    # Another worker has nothing in its in-memory cache
+    message_deduplicator._replies.clear()
+    monkeypatch.setattr(bot.conversation_manager, 'handle_message', lambda *args: 'processed again')
+
+    assert deliver(client, 'hi', 'SMdedup0002', '+263770000004').data == first.data
+
+
+def test_expired_record_is_processed_again(app, client, monkeypatch):
+    deliver(client, 'hi', 'SMdedup0003', '+263770000005')
+    message_deduplicator._replies.clear()
+    with app.app_context():
+        ProcessedMessage.query.filter_by(message_sid='SMdedup0003').update(
+            {'created_at': datetime.utcnow() - message_deduplicator.ttl - timedelta(minutes=1)})
+        db.session.commit()
+    monkeypatch.setattr(bot.conversation_manager, 'handle_message', lambda *args: 'processed again')
+
+    assert b'processed again' in deliver(client, 'hi', 'SMdedup0003', '+263770000005').data
@@ -0,0 +1,61 @@
+"""
+Unit of work for inbound messages
+
+Each inbound message runs in one database transaction with one commit. If
+anything fails, the whole transaction is rolled back. Work that must only
+happen once the data is durable, such as handing a render job to the pool, is
+registered with on_commit() and runs after the commit succeeds.
+
+Every session commit is counted per app context, so a code path that starts
+committing more than once per message is easy to spot.
+"""
+
+import logging
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+
+
+@event.listens_for(Session, 'after_commit')
+def _count_commit(session):
+    if has_app_context():
+        g.commit_count = g.get('commit_count', 0) + 1
+
+
+def commit_count():
+    """Number of session commits made in the current request so far"""
+    if not has_app_context():
+        return 0
+    return g.get('commit_count', 0)
+
+
+def on_commit(callback):
+    """Run a callback once the current unit of work has committed"""
+    db.session.info.setdefault('on_commit', []).append(callback)
+
+
+def rollback():
+    """Roll back the current unit of work and drop its post-commit callbacks"""
+    db.session.rollback()
+    db.session.info.pop('on_commit', None)
+
+
+@contextmanager
+def unit_of_work():
+    """Commit everything done inside the block once, or roll it all back"""
+    try:
+        yield
+        db.session.commit()
+    except Exception:
+        rollback()
+        raise
+
+    for callback in db.session.info.pop('on_commit', []):
+        try:
+            callback()
+        except Exception as e:
+            logging.error(f"Error in post-commit callback: {str(e)}")